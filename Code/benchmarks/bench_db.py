@@ -0,0 +1,330 @@
+"""Micro-benchmarks of the `db_connector` hot paths and ride pricing.
+
+Every size seeds a scratch database with that many finished rides (plus
+riders, scooters and charging stations in proportion), then times each
+function over a number of rounds after a warm-up. Results can be saved
+as a JSON baseline and later runs compared against it; the run fails if
+any median (or the statistic picked with `--stat`) got slower than the
+baseline by more than the threshold.
+
+    python -m benchmarks.bench_db --sizes 1k 100k --save baseline.json
+    python -m benchmarks.bench_db --sizes 1k 100k --compare baseline.json
+
+Baselines are only comparable on the same machine.
+"""
+
+import argparse
+import json
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+from collections.abc import Callable
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Any
+
+from mobile.constants import CITY_CENTER, TIMEZONE
+from mobile.db_connector import (
+    book_scooter,
+    check_user,
+    connect_db,
+    end_booking,
+    end_drive,
+    get_charging_stations,
+    get_scooters,
+    get_user_drive_history,
+    load_available_scooters,
+    load_charging_stations,
+    migrate_db,
+    start_drive,
+    use_database,
+)
+from mobile.geo import Circle
+from mobile.helpers import get_price, hash_password, now_ms
+from mobile.seeding import FleetSpec, seed_fleet
+
+
+PASSWORD = "Bench1234"
+SCOOTERS = 1_000
+STATIONS = 50
+RIDES_PER_USER = 100
+# Pure functions are too quick to time one call at a time.
+INNER_LOOPS = 1_000
+
+
+@dataclass(slots=True)
+class Result:
+    rounds: int
+    min: float
+    median: float
+    mean: float
+    stddev: float
+
+
+@dataclass(slots=True)
+class Bench:
+    """Times `func(*setup())` and runs `teardown(args)` after each round;
+    neither setup nor teardown is timed.
+    """
+
+    name: str
+    func: Callable[..., object]
+    setup: Callable[[], tuple[Any, ...]] = tuple
+    teardown: Callable[[tuple[Any, ...]], object] = lambda args: None
+    loops: int = 1
+
+    def run(self, rounds: int, warmup: int) -> Result:
+        timings: list[float] = []
+
+        for i in range(warmup + rounds):
+            args = self.setup()
+            start = time.perf_counter()
+            for _ in range(self.loops):
+                self.func(*args)
+            elapsed = (time.perf_counter() - start) / self.loops
+            self.teardown(args)
+
+            if i >= warmup:
+                timings.append(elapsed)
+
+        return Result(
+            rounds=rounds,
+            min=min(timings),
+            median=statistics.median(timings),
+            mean=statistics.fmean(timings),
+            stddev=statistics.stdev(timings) if rounds > 1 else 0.0,
+        )
+
+
+@dataclass(slots=True)
+class Fixture:
+    users: list[int]
+    scooters: list[int]
+    _next: int = field(default=0, init=False)
+
+    def free_scooter(self) -> tuple[int, int]:
+        """A (user, scooter) pair, cycling through the fleet."""
+        self._next += 1
+        return (
+            self.users[self._next % len(self.users)],
+            self.scooters[self._next % len(self.scooters)],
+        )
+
+
+def parse_size(text: str) -> int:
+    units = {"k": 1_000, "m": 1_000_000}
+    suffix = text[-1].lower()
+
+    if suffix in units:
+        return int(float(text[:-1]) * units[suffix])
+    return int(text)
+
+
+def seed(database: Path, rides: int) -> Fixture:
+    use_database(database)
+    migrate_db()
+
+    seed_fleet(FleetSpec(scooters=SCOOTERS, stations=STATIONS, seed=1))
+
+    users = max(1, rides // RIDES_PER_USER)
+    rng = random.Random(1)
+    # 2025-01-01 UTC; the history spans one ride start a minute from there.
+    start = 1_735_689_600_000
+
+    with connect_db() as (_, cur):
+        cur.executemany(
+            """
+            INSERT INTO users (username, password_hash, salt)
+            VALUES (?, ?, 'salt')
+            """,
+            (
+                (f"rider{i}", hash_password(PASSWORD, "salt"))
+                for i in range(users)
+            ),
+        )
+        user_ids = [row[0] for row in cur.execute("SELECT id FROM users")]
+        scooter_ids = [
+            row[0] for row in cur.execute("SELECT id FROM scooters")
+        ]
+
+        def drives() -> Any:
+            for i in range(rides):
+                begin = start + i * 60_000
+                minutes = rng.randint(2, 40)
+                yield (
+                    user_ids[i % users],
+                    rng.choice(scooter_ids),
+                    begin,
+                    begin + minutes * 60_000,
+                    get_price(minutes, 0.0),
+                )
+
+        cur.executemany(
+            """
+            INSERT INTO drives
+                (user_id, scooter_id, driving_time, end_time, is_active,
+                    price)
+            VALUES (?, ?, ?, ?, 0, ?)
+            """,
+            drives(),
+        )
+
+    with connect_db() as (conn, _):
+        conn.execute("ANALYZE")
+
+    load_available_scooters()
+    load_charging_stations()
+    return Fixture(user_ids, scooter_ids)
+
+
+def benches(fixture: Fixture) -> list[Bench]:
+    def booked() -> tuple[int, int, int]:
+        user_id, scooter_id = fixture.free_scooter()
+        return user_id, scooter_id, now_ms()
+
+    def release_booking(args: tuple[Any, ...]) -> None:
+        end_booking(args[1], now_ms())
+
+    def started() -> tuple[int, int]:
+        user_id, scooter_id, start = booked()
+        start_drive(user_id, scooter_id, start)
+        return scooter_id, now_ms()
+
+    def finish_drive(args: tuple[Any, ...]) -> None:
+        end_drive(args[1], now_ms())
+
+    # Every rider has the same number of rides.
+    _, cursor = get_user_drive_history(fixture.users[0])
+    area = Circle(*CITY_CENTER, 300.0)
+
+    return [
+        Bench("check_user", check_user, lambda: ("rider0", PASSWORD)),
+        Bench("get_scooters", get_scooters),
+        Bench("get_scooters[area]", get_scooters, lambda: (area,)),
+        Bench("book_scooter", book_scooter, booked, release_booking),
+        Bench("start_drive", start_drive, booked, finish_drive),
+        Bench("end_drive", end_drive, started),
+        Bench(
+            "get_user_drive_history",
+            get_user_drive_history,
+            lambda: (fixture.users[0],),
+        ),
+        Bench(
+            "get_user_drive_history[page 2]",
+            get_user_drive_history,
+            lambda: (fixture.users[0], cursor),
+        ),
+        Bench("get_charging_stations", get_charging_stations),
+        Bench(
+            "get_price",
+            get_price,
+            lambda: (random.uniform(0, 60), 0.3),
+            loops=INNER_LOOPS,
+        ),
+    ]
+
+
+def run(sizes: list[str], rounds: int, warmup: int) -> dict[str, Any]:
+    results: dict[str, dict[str, dict[str, float]]] = {}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in sizes:
+            started = time.perf_counter()
+            fixture = seed(Path(tmp) / f"bench-{size}.db", parse_size(size))
+            print(
+                f"seeded {size} rides in {time.perf_counter() - started:.1f}s",
+                file=sys.stderr,
+            )
+            results[size] = {
+                bench.name: asdict(bench.run(rounds, warmup))
+                for bench in benches(fixture)
+            }
+
+    return {
+        "created": datetime.now(TIMEZONE).isoformat(),
+        "python": platform.python_version(),
+        "machine": platform.platform(),
+        "results": results,
+    }
+
+
+def compare(
+    report: dict[str, Any],
+    baseline: dict[str, Any],
+    threshold: float,
+    stat: str = "median",
+) -> list[str]:
+    """Prints every timing next to its baseline and returns the names of
+    those that regressed by more than `threshold`.
+    """
+    regressions: list[str] = []
+    print(f"{'size':<6}{'function':<34}{stat + ' us':>11}{'baseline':>11}")
+
+    for size, benches in report["results"].items():
+        for name, result in benches.items():
+            current = result[stat] * 1e6
+            before = baseline["results"].get(size, {}).get(name)
+
+            if before is None:
+                print(f"{size:<6}{name:<34}{current:>11.2f}{'-':>11}")
+                continue
+
+            base = before[stat] * 1e6
+            change = current / base - 1
+            flag = ""
+
+            if change > threshold:
+                flag = "  REGRESSION"
+                regressions.append(f"{size} {name}")
+
+            print(
+                f"{size:<6}{name:<34}{current:>11.2f}{base:>11.2f}"
+                f"{change:>+8.0%}{flag}"
+            )
+
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter
+    )
+    parser.add_argument("--sizes", nargs="+", default=["1k", "100k"])
+    parser.add_argument("--rounds", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--save", type=Path, help="write the results here")
+    parser.add_argument("--compare", type=Path, help="baseline to check")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="allowed slowdown, as a fraction (default 0.2)",
+    )
+    parser.add_argument(
+        "--stat", choices=("min", "median", "mean"), default="median"
+    )
+    args = parser.parse_args()
+
+    report = run(args.sizes, args.rounds, args.warmup)
+    baseline = (
+        json.loads(args.compare.read_text())
+        if args.compare
+        else {"results": {}}
+    )
+    regressions = compare(report, baseline, args.threshold, args.stat)
+
+    if args.save:
+        args.save.parent.mkdir(parents=True, exist_ok=True)
+        args.save.write_text(json.dumps(report, indent=2) + "\n")
+
+    if regressions:
+        print(f"\nslower than the baseline: {', '.join(regressions)}")
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
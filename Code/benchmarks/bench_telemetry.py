@@ -0,0 +1,231 @@
+"""Throughput of telemetry ingestion against per-report commits.
+
+Seeds a scratch fleet, starts the in-process MQTT stand-in and a
+`TelemetryIngest` writing to the scratch database, then has every
+scooter report a drifting position and draining battery on
+`escooter/{id}/telemetry` once per period. At the end the database must
+hold each scooter's last report. For comparison the same number of
+reports is then written one transaction each, as a naive handler would.
+
+    python -m benchmarks.bench_telemetry --scooters 5000 --period 2
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import tempfile
+import threading
+import time
+from collections.abc import Mapping
+from pathlib import Path
+
+from paho.mqtt.client import Client
+from paho.mqtt.enums import CallbackAPIVersion
+
+from benchmarks.mqtt_broker import LocalBroker
+from mobile.db_connector import (
+    connect_db,
+    load_available_scooters,
+    migrate_db,
+    transaction,
+    update_telemetry,
+    use_database,
+)
+from mobile.seeding import FleetSpec, seed_fleet
+from mobile.telemetry import Telemetry, TelemetryIngest
+
+
+# (latitude, longitude, battery_level) by scooter id
+Reports = dict[int, tuple[float, float, int]]
+
+
+def _start_broker() -> tuple[LocalBroker, asyncio.AbstractEventLoop]:
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    broker = LocalBroker()
+    asyncio.run_coroutine_threadsafe(broker.start(), loop).result()
+    return broker, loop
+
+
+def _connect(port: int) -> Client:
+    client = Client(CallbackAPIVersion.VERSION2, client_id="bench-fleet")
+    connected = threading.Event()
+    client.on_connect = lambda *_: connected.set()
+    client.connect("127.0.0.1", port)
+    client.loop_start()
+    connected.wait(5)
+    return client
+
+
+def _report(
+    rng: random.Random, lat: float, lng: float, battery: int
+) -> tuple[float, float, int]:
+    return (
+        round(lat + rng.uniform(-1e-4, 1e-4), 6),
+        round(lng + rng.uniform(-1e-4, 1e-4), 6),
+        max(0, battery - rng.choice((0, 0, 0, 1))),
+    )
+
+
+def publish_fleet(
+    client: Client, fleet: Reports, period: float, duration: float
+) -> tuple[int, Reports]:
+    """Reports every scooter once per `period`, spread evenly over it,
+    until `duration` has passed. Returns the number of reports and the
+    last one of each scooter.
+    """
+    rng = random.Random(1)
+    last = dict(fleet)
+    sent = 0
+    start = time.monotonic()
+    gap = period / len(fleet)
+
+    while time.monotonic() - start < duration:
+        for scooter_id, state in last.items():
+            last[scooter_id] = lat, lng, battery = _report(rng, *state)
+            payload = json.dumps(
+                {"latitude": lat, "longitude": lng, "battery_level": battery}
+            )
+            client.publish(f"escooter/{scooter_id}/telemetry", payload)
+            sent += 1
+
+            if (ahead := start + sent * gap - time.monotonic()) > 0:
+                time.sleep(ahead)
+
+    return sent, last
+
+
+def mismatches(expected: Reports) -> int:
+    with connect_db() as (_, cur):
+        stored = {
+            row[0]: row[1:]
+            for row in cur.execute(
+                "SELECT id, latitude, longitude, battery_level FROM scooters"
+            )
+        }
+
+    return sum(stored.get(i) != report for i, report in expected.items())
+
+
+def one_commit_each(reports: Mapping[int, Telemetry], count: int) -> float:
+    """Seconds per report written in a transaction of its own."""
+    items = list(reports.items())
+    start = time.perf_counter()
+
+    for i in range(count):
+        scooter_id, report = items[i % len(items)]
+        with transaction() as cur:
+            cur.execute(
+                """
+                UPDATE scooters
+                SET latitude = ?, longitude = ?, battery_level = ?
+                WHERE id = ?
+                """,
+                (
+                    report.latitude + 1e-6 * (i % 2),  # type: ignore
+                    report.longitude,
+                    report.battery_level,
+                    scooter_id,
+                ),
+            )
+
+    return (time.perf_counter() - start) / count
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter
+    )
+    parser.add_argument("--scooters", type=int, default=2_000)
+    parser.add_argument("--period", type=float, default=2.0)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--interval", type=float, default=1.0)
+    parser.add_argument(
+        "--naive-sample",
+        type=int,
+        default=2_000,
+        help="reports timed one transaction each (default 2000)",
+    )
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        use_database(Path(tmp) / "telemetry.db")
+        migrate_db()
+        seed_fleet(FleetSpec(scooters=args.scooters, stations=10, seed=1))
+        load_available_scooters()
+
+        with connect_db() as (_, cur):
+            fleet: Reports = {
+                row[0]: row[1:]
+                for row in cur.execute(
+                    """
+                    SELECT id, latitude, longitude, battery_level
+                    FROM scooters
+                    """
+                )
+            }
+
+        write_seconds = 0.0
+
+        def timed_write(reports: Mapping[int, Telemetry]) -> int:
+            nonlocal write_seconds
+            started = time.perf_counter()
+            try:
+                return update_telemetry(reports)
+            finally:
+                write_seconds += time.perf_counter() - started
+
+        broker, loop = _start_broker()
+        ingest = TelemetryIngest(
+            "127.0.0.1",
+            broker.port,
+            timed_write,
+            interval=args.interval,
+            client_id="bench-ingest",
+        )
+        ingest.start()
+        client = _connect(broker.port)
+        # Let the ingest subscribe before the first report.
+        time.sleep(0.5)
+
+        start = time.perf_counter()
+        sent, last = publish_fleet(client, fleet, args.period, args.duration)
+        deadline = time.monotonic() + 10
+
+        while ingest.stats.received < sent and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+        ingest.stop()
+        elapsed = time.perf_counter() - start
+        client.disconnect()
+        client.loop_stop()
+        asyncio.run_coroutine_threadsafe(broker.stop(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+
+        stats = ingest.stats
+        wrong = mismatches(last)
+        print(
+            f"{sent} reports from {len(fleet)} scooters in {elapsed:.1f}s "
+            f"({sent / elapsed:.0f}/s)\n"
+            f"received {stats.received}, coalesced {stats.coalesced}, "
+            f"invalid {stats.invalid}, dropped {stats.dropped}\n"
+            f"{stats.flushes} commits wrote {stats.rows_written} rows in "
+            f"{write_seconds:.2f}s ({write_seconds / sent * 1e6:.1f} us a "
+            f"report), {stats.failed_flushes} failed\n"
+            f"scooters not at their last report: {wrong}"
+        )
+
+        sample = {i: Telemetry(*report) for i, report in last.items()}
+        per_report = one_commit_each(sample, args.naive_sample)
+        print(
+            f"one commit per report: {per_report * 1e6:.0f} us each, "
+            f"at most {1 / per_report:.0f} reports/s"
+        )
+
+    if wrong or stats.received < sent:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
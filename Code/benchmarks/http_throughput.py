@@ -0,0 +1,103 @@
+"""Measures requests per second of a running server under concurrency.
+
+Every client registers its own rider, then loops on the given path for
+the duration of the run. Start the server first, e.g. on the commit
+before and after a change, with `ADMISSION=off` so that the sign-ups
+are not rate limited, and compare the two reports:
+
+    python -m benchmarks.http_throughput --url http://127.0.0.1:8000 \\
+        --clients 500 --duration 20 --path /scooters
+"""
+
+import argparse
+import asyncio
+import secrets
+import statistics
+import time
+from dataclasses import dataclass, field
+
+import httpx
+
+
+PASSWORD = "Bench1234"
+
+
+@dataclass(slots=True)
+class Report:
+    latencies: list[float] = field(default_factory=list)
+    errors: int = 0
+
+    def summary(self, seconds: float) -> str:
+        if not self.latencies:
+            return f"no successful requests, {self.errors} errors"
+
+        totals = (
+            f"{len(self.latencies)} requests in {seconds:.1f}s, "
+            f"{len(self.latencies) / seconds:.0f} req/s, "
+            f"{self.errors} errors\n"
+        )
+
+        # Percentiles need at least two samples.
+        if len(self.latencies) < 2:
+            return f"{totals}latency ms: {self.latencies[0] * 1e3:.1f}"
+
+        quantiles = statistics.quantiles(self.latencies, n=100)
+        return (
+            f"{totals}latency ms: p50 {quantiles[49] * 1e3:.1f}, "
+            f"p95 {quantiles[94] * 1e3:.1f}, p99 {quantiles[98] * 1e3:.1f}"
+        )
+
+
+async def _client(
+    http: httpx.AsyncClient, path: str, deadline: float, report: Report
+) -> None:
+    username = f"bench{secrets.token_hex(6)}"
+    response = await http.post(
+        "/register", json={"username": username, "password": PASSWORD}
+    )
+    cookies = response.cookies
+
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            response = await http.get(path, cookies=cookies)
+        except httpx.HTTPError:
+            report.errors += 1
+            continue
+
+        if response.status_code >= 400:
+            report.errors += 1
+        else:
+            report.latencies.append(time.perf_counter() - start)
+
+
+async def run(url: str, path: str, clients: int, duration: float) -> Report:
+    report = Report()
+    limits = httpx.Limits(max_connections=clients)
+
+    async with httpx.AsyncClient(
+        base_url=url, limits=limits, timeout=30, verify=False
+    ) as http:
+        deadline = time.perf_counter() + duration
+        await asyncio.gather(
+            *(_client(http, path, deadline, report) for _ in range(clients))
+        )
+
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--url", default="https://127.0.0.1:8000")
+    parser.add_argument("--path", default="/scooters")
+    parser.add_argument("--clients", type=int, default=500)
+    parser.add_argument("--duration", type=float, default=20.0)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    report = asyncio.run(run(args.url, args.path, args.clients, args.duration))
+    print(report.summary(time.perf_counter() - start))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,314 @@
+"""End-to-end load test of one backend instance on localhost.
+
+Seeds a scratch database, starts `mobile_app` under uvicorn against it
+with the MQTT broker replaced by the in-process stand-in from
+`benchmarks.mqtt_broker`, then lets virtual riders go through
+
+    register -> login -> /scooters -> /book -> /start_drive -> /end_drive
+
+and reports throughput, latency percentiles and outcomes per step, plus
+the scooter commands the broker received. Admission control is switched
+off, since every rider signs up from the same address.
+
+    python -m benchmarks.load_test --users 2000 --concurrency 200
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import secrets
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import httpx
+
+from benchmarks.mqtt_broker import LocalBroker
+
+
+PASSWORD = "Load1234"
+STEPS = ("register", "login", "scooters", "book", "start_drive", "end_drive")
+CODE_DIR = Path(__file__).resolve().parent.parent
+
+
+@dataclass(slots=True)
+class StepStats:
+    latencies: list[float] = field(default_factory=list)
+    # ok, conflict (400/409), rejected (429/503) or error
+    outcomes: Counter[str] = field(default_factory=Counter)
+
+    def record(self, status: int | None, seconds: float) -> str:
+        if status is None:
+            outcome = "error"
+        elif status < 400:
+            outcome = "ok"
+            self.latencies.append(seconds)
+        elif status in (400, 409):
+            outcome = "conflict"
+        elif status in (429, 503):
+            outcome = "rejected"
+        else:
+            outcome = "error"
+
+        self.outcomes[outcome] += 1
+        return outcome
+
+    def row(self, name: str, seconds: float) -> str:
+        total = sum(self.outcomes.values())
+        ok = self.outcomes["ok"]
+
+        if len(self.latencies) >= 2:
+            q = statistics.quantiles(self.latencies, n=100)
+            p50, p95, p99 = q[49] * 1e3, q[94] * 1e3, q[98] * 1e3
+            worst = max(self.latencies) * 1e3
+        else:
+            p50 = p95 = p99 = worst = float("nan")
+
+        return (
+            f"{name:<12}{total:>7}{ok / seconds:>9.1f}"
+            f"{p50:>9.1f}{p95:>9.1f}{p99:>9.1f}{worst:>9.1f}"
+            f"{self.outcomes['conflict']:>9}{self.outcomes['rejected']:>9}"
+            f"{self.outcomes['error']:>7}"
+        )
+
+
+@dataclass(slots=True)
+class Report:
+    steps: dict[str, StepStats] = field(
+        default_factory=lambda: {step: StepStats() for step in STEPS}
+    )
+    rides: int = 0
+
+    def print(self, seconds: float, broker: LocalBroker) -> None:
+        print(
+            f"{'step':<12}{'reqs':>7}{'ok/s':>9}{'p50 ms':>9}{'p95 ms':>9}"
+            f"{'p99 ms':>9}{'max ms':>9}{'conflict':>9}{'rejected':>9}"
+            f"{'error':>7}"
+        )
+        for name, stats in self.steps.items():
+            print(stats.row(name, seconds))
+
+        print(
+            f"\n{self.rides} rides in {seconds:.1f}s "
+            f"({self.rides / seconds:.1f}/s)\n"
+            f"MQTT: {broker.count(b'reserve')} reserve, "
+            f"{broker.count(b'unlock')} unlock, "
+            f"{broker.count(b'lock')} lock over "
+            f"{broker.connections} connection(s)"
+        )
+
+
+async def _step(
+    report: Report,
+    name: str,
+    http: httpx.AsyncClient,
+    method: str,
+    path: str,
+    json: dict[str, str] | None = None,
+) -> httpx.Response | None:
+    start = time.perf_counter()
+
+    try:
+        response = await http.request(method, path, json=json)
+    except httpx.HTTPError:
+        report.steps[name].record(None, time.perf_counter() - start)
+        return None
+
+    outcome = report.steps[name].record(
+        response.status_code, time.perf_counter() - start
+    )
+    return response if outcome == "ok" else None
+
+
+async def _rider(
+    transport: httpx.AsyncHTTPTransport,
+    url: str,
+    report: Report,
+    ride_seconds: float,
+) -> None:
+    # A client of its own keeps the rider's cookie; the connections are
+    # shared through the transport.
+    http = httpx.AsyncClient(transport=transport, base_url=url, timeout=60)
+    credentials = {
+        "username": f"rider{secrets.token_hex(6)}",
+        "password": PASSWORD,
+    }
+
+    if not await _step(
+        report, "register", http, "POST", "/register", json=credentials
+    ):
+        return
+
+    http.cookies.clear()
+
+    if not await _step(
+        report, "login", http, "POST", "/login", json=credentials
+    ):
+        return
+
+    if not (
+        response := await _step(report, "scooters", http, "GET", "/scooters")
+    ):
+        return
+
+    free = [
+        scooter["id"]
+        for scooter in response.json()
+        if not scooter["is_booked"] and not scooter["is_driving"]
+    ]
+
+    # Riders looking at the same map go for the same scooters; one that
+    # loses the race tries another.
+    for scooter_id in random.sample(free, min(3, len(free))):
+        if await _step(report, "book", http, "POST", f"/book/{scooter_id}"):
+            break
+    else:
+        return
+
+    if not await _step(
+        report, "start_drive", http, "POST", f"/start_drive/{scooter_id}"
+    ):
+        return
+
+    await asyncio.sleep(ride_seconds)
+
+    if await _step(
+        report, "end_drive", http, "POST", f"/end_drive/{scooter_id}"
+    ):
+        report.rides += 1
+
+
+async def run(
+    url: str, users: int, concurrency: int, ride_seconds: float
+) -> Report:
+    report = Report()
+    transport = httpx.AsyncHTTPTransport(
+        limits=httpx.Limits(max_connections=concurrency)
+    )
+    slots = asyncio.Semaphore(concurrency)
+
+    async def rider() -> None:
+        async with slots:
+            await _rider(transport, url, report, ride_seconds)
+
+    async with transport:
+        await asyncio.gather(*(rider() for _ in range(users)))
+
+    return report
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port: int = sock.getsockname()[1]
+        return port
+
+
+async def _wait_until_up(url: str, server: subprocess.Popen[bytes]) -> None:
+    async with httpx.AsyncClient(base_url=url) as http:
+        for _ in range(300):
+            if server.poll() is not None:
+                raise SystemExit("server exited during startup")
+            try:
+                if (await http.get("/charging_stations")).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.1)
+
+    raise SystemExit("server did not come up")
+
+
+async def main_async(args: argparse.Namespace) -> None:
+    broker = LocalBroker()
+    await broker.start()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        port = _free_port()
+        url = f"http://127.0.0.1:{port}"
+        env = {
+            **os.environ,
+            "DATABASE_FILE": str(Path(tmp) / "load.db"),
+            "SECRET_KEY": os.environ.get("SECRET_KEY") or secrets.token_hex(),
+            "MQTT_BROKER": "127.0.0.1",
+            "MQTT_PORT": str(broker.port),
+            "ADMISSION": "off",
+        }
+        subprocess.run(
+            [
+                sys.executable,
+                "-m",
+                "mobile.seeding",
+                "seed",
+                "--scooters",
+                str(args.scooters),
+                "--seed",
+                "1",
+            ],
+            cwd=CODE_DIR,
+            env=env,
+            check=True,
+        )
+
+        log = open(Path(tmp) / "server.log", "wb")
+        server = subprocess.Popen(
+            [
+                sys.executable,
+                "-m",
+                "uvicorn",
+                "mobile_app:app",
+                "--port",
+                str(port),
+                "--workers",
+                str(args.workers),
+                "--log-level",
+                "warning",
+                "--no-access-log",
+            ],
+            cwd=CODE_DIR,
+            env=env,
+            stdout=log,
+            stderr=subprocess.STDOUT,
+        )
+
+        try:
+            await _wait_until_up(url, server)
+            start = time.perf_counter()
+            report = await run(
+                url, args.users, args.concurrency, args.ride_seconds
+            )
+            seconds = time.perf_counter() - start
+            # Let the publisher drain its queue before counting.
+            await asyncio.sleep(1)
+            report.print(seconds, broker)
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+            log.close()
+            await broker.stop()
+
+            if server.returncode not in (0, -15):
+                print((Path(tmp) / "server.log").read_text()[-4_000:])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter
+    )
+    parser.add_argument("--users", type=int, default=1_000)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--scooters", type=int, default=2_000)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--ride-seconds", type=float, default=0.0)
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,245 @@
+"""A minimal MQTT 3.1.1 broker for running the backend on localhost.
+
+It speaks just enough of the protocol for paho clients: connect, publish
+at QoS 0 and 1, subscribe with `+`/`#` wildcards and `$share/{group}/`
+shared subscriptions, ping and disconnect. Messages are forwarded to
+subscribers at QoS 0 (to one session per shared group, in turn) and
+counted by topic and payload. There is no persistence, retained messages or authentication.
+
+    python -m benchmarks.mqtt_broker --port 1883
+"""
+
+import argparse
+import asyncio
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+
+
+CONNECT, CONNACK = 1, 2
+PUBLISH, PUBACK = 3, 4
+SUBSCRIBE, SUBACK = 8, 9
+UNSUBSCRIBE, UNSUBACK = 10, 11
+PINGREQ, PINGRESP = 12, 13
+DISCONNECT = 14
+
+
+def _encode_length(length: int) -> bytes:
+    encoded = bytearray()
+
+    while True:
+        length, digit = divmod(length, 128)
+        encoded.append(digit | (128 if length else 0))
+        if not length:
+            return bytes(encoded)
+
+
+def _packet(header: int, body: bytes) -> bytes:
+    return bytes([header]) + _encode_length(len(body)) + body
+
+
+def _string(data: bytes, offset: int) -> tuple[bytes, int]:
+    length = int.from_bytes(data[offset : offset + 2], "big")
+    end = offset + 2 + length
+    return data[offset + 2 : end], end
+
+
+def matches(topic_filter: str, topic: str) -> bool:
+    filter_levels = topic_filter.split("/")
+    topic_levels = topic.split("/")
+
+    for i, level in enumerate(filter_levels):
+        if level == "#":
+            return True
+        if i >= len(topic_levels):
+            return False
+        if level != "+" and level != topic_levels[i]:
+            return False
+
+    return len(filter_levels) == len(topic_levels)
+
+
+def _split_share(topic_filter: str) -> tuple[str | None, str]:
+    """The shared subscription group of a filter, if any, and the filter
+    itself.
+    """
+    if not topic_filter.startswith("$share/"):
+        return None, topic_filter
+
+    _, group, topic_filter = topic_filter.split("/", 2)
+    return group, topic_filter
+
+
+async def _read_packet(reader: asyncio.StreamReader) -> tuple[int, bytes]:
+    header = (await reader.readexactly(1))[0]
+    length, multiplier = 0, 1
+
+    while True:
+        digit = (await reader.readexactly(1))[0]
+        length += (digit & 127) * multiplier
+        multiplier *= 128
+        if not digit & 128:
+            break
+
+    return header, await reader.readexactly(length)
+
+
+@dataclass(eq=False, slots=True)
+class _Session:
+    writer: asyncio.StreamWriter
+    filters: set[str] = field(default_factory=set)
+
+
+@dataclass(slots=True)
+class LocalBroker:
+    host: str = "127.0.0.1"
+    port: int = 0
+    # (topic, payload) -> messages received
+    received: Counter[tuple[str, bytes]] = field(
+        default_factory=Counter, init=False
+    )
+    connections: int = field(default=0, init=False)
+    _shared_turn: int = field(default=0, init=False)
+    _sessions: set[_Session] = field(default_factory=set, init=False)
+    _handlers: set[asyncio.Task[None]] = field(default_factory=set, init=False)
+    _server: asyncio.Server | None = field(default=None, init=False)
+
+    async def start(self) -> int:
+        """Starts listening and returns the port, which is picked by the
+        OS unless one was given.
+        """
+        self._server = await asyncio.start_server(
+            self._handle, self.host, self.port
+        )
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self.port
+
+    async def stop(self) -> None:
+        if self._server is None:
+            return
+
+        self._server.close()
+        for session in list(self._sessions):
+            session.writer.close()
+        # Closing makes every handler read EOF and return.
+        await asyncio.gather(*self._handlers, return_exceptions=True)
+        await self._server.wait_closed()
+        self._server = None
+
+    def count(self, payload: bytes) -> int:
+        return sum(
+            n for (_, body), n in self.received.items() if body == payload
+        )
+
+    async def _handle(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        session = _Session(writer)
+        self._sessions.add(session)
+        handler = asyncio.current_task()
+        assert handler is not None
+        self._handlers.add(handler)
+        self.connections += 1
+
+        try:
+            while True:
+                header, body = await _read_packet(reader)
+                kind = header >> 4
+
+                if kind == CONNECT:
+                    writer.write(_packet(CONNACK << 4, b"\x00\x00"))
+                elif kind == PUBLISH:
+                    self._publish(writer, header, body)
+                elif kind == SUBSCRIBE:
+                    writer.write(_subscribe(session, body))
+                elif kind == UNSUBSCRIBE:
+                    writer.write(_unsubscribe(session, body))
+                elif kind == PINGREQ:
+                    writer.write(_packet(PINGRESP << 4, b""))
+                elif kind == DISCONNECT:
+                    break
+
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self._sessions.discard(session)
+            self._handlers.discard(handler)
+            writer.close()
+
+    def _publish(
+        self, writer: asyncio.StreamWriter, header: int, body: bytes
+    ) -> None:
+        qos = (header >> 1) & 3
+        raw_topic, offset = _string(body, 0)
+
+        if qos:
+            packet_id = body[offset : offset + 2]
+            offset += 2
+            writer.write(_packet(PUBACK << 4, packet_id))
+
+        topic, payload = raw_topic.decode(), body[offset:]
+        self.received[topic, payload] += 1
+        forward = _packet(
+            PUBLISH << 4,
+            len(raw_topic).to_bytes(2, "big") + raw_topic + payload,
+        )
+
+        shared: dict[str, list[_Session]] = defaultdict(list)
+
+        for session in self._sessions:
+            direct = False
+
+            for group, topic_filter in map(_split_share, session.filters):
+                if not matches(topic_filter, topic):
+                    continue
+                if group is None:
+                    direct = True
+                else:
+                    shared[group].append(session)
+
+            if direct:
+                session.writer.write(forward)
+
+        for sessions in shared.values():
+            self._shared_turn += 1
+            sessions[self._shared_turn % len(sessions)].writer.write(forward)
+
+
+def _subscribe(session: _Session, body: bytes) -> bytes:
+    packet_id, offset, granted = body[:2], 2, bytearray()
+
+    while offset < len(body):
+        topic_filter, offset = _string(body, offset)
+        session.filters.add(topic_filter.decode())
+        granted.append(min(body[offset], 1))
+        offset += 1
+
+    return _packet(SUBACK << 4, packet_id + bytes(granted))
+
+
+def _unsubscribe(session: _Session, body: bytes) -> bytes:
+    packet_id, offset = body[:2], 2
+
+    while offset < len(body):
+        topic_filter, offset = _string(body, offset)
+        session.filters.discard(topic_filter.decode())
+
+    return _packet(UNSUBACK << 4, packet_id)
+
+
+async def _serve(host: str, port: int) -> None:
+    broker = LocalBroker(host, port)
+    print(f"MQTT stand-in listening on {host}:{await broker.start()}")
+    await asyncio.Event().wait()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=1_883)
+    args = parser.parse_args()
+    asyncio.run(_serve(args.host, args.port))
+
+
+if __name__ == "__main__":
+    main()
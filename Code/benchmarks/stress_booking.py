@@ -0,0 +1,178 @@
+"""Fires hundreds of simultaneous bookings at a single scooter.
+
+Exactly one attempt may win. By default the attempts go straight to
+`book_scooter()` against a scratch database; with `--url` they are sent
+as `POST /book/{id}` requests to a running server instead; start it
+with `ADMISSION=off`, or the sign-ups are rate limited.
+
+    python -m benchmarks.stress_booking --requests 500
+    python -m benchmarks.stress_booking --url https://127.0.0.1:8000
+"""
+
+import argparse
+import http.client
+import json
+import secrets
+import ssl
+import tempfile
+import threading
+import time
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from pathlib import Path
+from urllib.parse import urlsplit
+
+from mobile.constants import CITY_CENTER
+from mobile.db_connector import (
+    book_scooter,
+    connect_db,
+    insert_scooters,
+    migrate_db,
+    use_database,
+)
+from mobile.helpers import now_ms
+
+
+PASSWORD = "Stress1234"
+
+
+def _race(attempts: list[Callable[[], bool]]) -> tuple[int, float]:
+    """Releases all attempts at once and returns (winners, seconds)."""
+    barrier = threading.Barrier(len(attempts))
+
+    def run(attempt: Callable[[], bool]) -> bool:
+        barrier.wait()
+        return attempt()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(attempts)) as executor:
+        results = list(executor.map(run, attempts))
+    return sum(results), time.perf_counter() - start
+
+
+def stress_db(requests: int) -> int:
+    with tempfile.TemporaryDirectory() as tmp:
+        use_database(Path(tmp) / "stress.db")
+        migrate_db()
+        insert_scooters([(*CITY_CENTER, 100)])
+
+        with connect_db() as (_, cur):
+            cur.executemany(
+                """
+                INSERT INTO users (username, password_hash, salt)
+                VALUES (?, '', '')
+                """,
+                ((f"rider{i}",) for i in range(requests)),
+            )
+            user_ids = [row[0] for row in cur.execute("SELECT id FROM users")]
+            scooter_id = cur.execute(
+                "SELECT MIN(id) FROM scooters"
+            ).fetchone()[0]
+
+        booking_time = now_ms()
+        winners, seconds = _race(
+            [
+                partial(book_scooter, user_id, scooter_id, booking_time)
+                for user_id in user_ids
+            ]
+        )
+
+        with connect_db() as (_, cur):
+            open_bookings = cur.execute(
+                """
+                SELECT COUNT(*) FROM bookings
+                WHERE scooter_id = ? AND end_time IS NULL
+                """,
+                (scooter_id,),
+            ).fetchone()[0]
+
+        print(f"{requests} attempts in {seconds:.3f}s")
+        print(f"winners: {winners}, open bookings: {open_bookings}")
+        return 0 if winners == open_bookings == 1 else 1
+
+
+def _connect(url: str) -> http.client.HTTPConnection:
+    parts = urlsplit(url)
+
+    if parts.scheme == "https":
+        # The dev server runs on a self-signed certificate.
+        return http.client.HTTPSConnection(
+            parts.netloc, context=ssl._create_unverified_context()
+        )
+    return http.client.HTTPConnection(parts.netloc)
+
+
+def _request(
+    url: str,
+    method: str,
+    path: str,
+    body: dict[str, str] | None = None,
+    cookie: str | None = None,
+) -> tuple[int, bytes, str | None]:
+    headers = {"Content-Type": "application/json"}
+
+    if cookie:
+        headers["Cookie"] = cookie
+
+    conn = _connect(url)
+    try:
+        conn.request(method, path, json.dumps(body) if body else None, headers)
+        response = conn.getresponse()
+        payload = response.read()
+        set_cookie = response.getheader("set-cookie")
+    finally:
+        conn.close()
+
+    return response.status, payload, set_cookie and set_cookie.split(";")[0]
+
+
+def stress_http(url: str, requests: int) -> int:
+    run_id = secrets.token_hex(3)
+    cookies: list[str] = []
+
+    for i in range(requests):
+        status, _, cookie = _request(
+            url,
+            "POST",
+            "/register",
+            {"username": f"stress{run_id}{i}", "password": PASSWORD},
+        )
+        if status != 200 or cookie is None:
+            print(f"registration failed with {status}")
+            return 1
+        cookies.append(cookie)
+
+    _, payload, _ = _request(url, "GET", "/scooters", cookie=cookies[0])
+    free = [
+        scooter["id"]
+        for scooter in json.loads(payload)
+        if not scooter["is_booked"] and not scooter["is_driving"]
+    ]
+
+    if not free:
+        print("no free scooter to book")
+        return 1
+
+    def book(cookie: str) -> bool:
+        status, _, _ = _request(url, "POST", f"/book/{free[0]}", cookie=cookie)
+        return status == 200
+
+    winners, seconds = _race([partial(book, cookie) for cookie in cookies])
+    print(f"{requests} attempts in {seconds:.3f}s, winners: {winners}")
+    return 0 if winners == 1 else 1
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--url", help="base URL of a running server")
+    args = parser.parse_args()
+
+    if args.url:
+        raise SystemExit(stress_http(args.url, args.requests))
+    raise SystemExit(stress_db(args.requests))
+
+
+if __name__ == "__main__":
+    main()
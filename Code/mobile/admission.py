@@ -0,0 +1,180 @@
+"""Admission control for the write endpoints.
+
+Every write goes through SQLite's single writer, so a burst of them only
+queues up and slows everyone down. Writes are limited per client by
+token buckets (answered with 429) and globally by a cap on concurrent
+writes (answered with 503); both say when to retry. Requests that finish
+a ride are never limited, and count against the cap so that other writes
+back off while they run.
+
+Limits are per worker process, so with several workers a client gets up
+to that many times the configured rate.
+"""
+
+import math
+import time
+from collections import OrderedDict
+from collections.abc import AsyncIterator, Callable, Hashable
+from dataclasses import dataclass, field
+from typing import Literal
+
+from fastapi import HTTPException, Request
+
+from mobile.auth import SESSION_COOKIE, read_session
+from mobile.constants import (
+    ADMISSION_ENABLED,
+    ADMISSION_IP_RATE,
+    ADMISSION_LOGIN_RATE,
+    ADMISSION_MAX_KEYS,
+    ADMISSION_MAX_WRITES,
+    ADMISSION_RETRY_AFTER_S,
+    ADMISSION_USER_RATE,
+)
+from mobile.metrics import registry
+
+
+rejected = registry.counter(
+    "admission_rejected_total",
+    "Requests turned away by admission control.",
+    ("kind", "reason"),
+)
+
+
+@dataclass(slots=True)
+class TokenBuckets:
+    """One token bucket per key, refilled at `rate` tokens a second up to
+    `burst`. Only the most recently used `max_keys` buckets are kept; a
+    forgotten key starts again with a full bucket.
+    """
+
+    rate: float
+    burst: float
+    max_keys: int = ADMISSION_MAX_KEYS
+    # key -> (tokens, last refill)
+    _buckets: OrderedDict[Hashable, tuple[float, float]] = field(
+        default_factory=OrderedDict, init=False
+    )
+
+    def _tokens(self, key: Hashable, now: float) -> float:
+        tokens, updated = self._buckets.get(key, (self.burst, now))
+        return min(self.burst, tokens + (now - updated) * self.rate)
+
+    def wait(self, key: Hashable) -> float:
+        """Like `take()`, but leaves the token where it is."""
+        tokens = self._tokens(key, time.monotonic())
+        return 0.0 if tokens >= 1 else (1 - tokens) / self.rate
+
+    def take(self, key: Hashable) -> float:
+        """Takes a token for `key`. Returns 0 on success, or the seconds
+        until a token will be available.
+        """
+        now = time.monotonic()
+        tokens = self._tokens(key, now)
+        # Moved to the end as the most recently used.
+        self._buckets.pop(key, None)
+        wait = 0.0
+
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            wait = (1 - tokens) / self.rate
+
+        self._buckets[key] = (tokens, now)
+
+        if len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+
+        return wait
+
+
+@dataclass(slots=True)
+class WriteGate:
+    """Caps concurrent writes. Only touched from the event loop."""
+
+    limit: int = ADMISSION_MAX_WRITES
+    active: int = field(default=0, init=False)
+
+    def enter(self, priority: bool) -> bool:
+        if self.active >= self.limit and not priority:
+            return False
+        self.active += 1
+        return True
+
+    def leave(self) -> None:
+        self.active -= 1
+
+
+Kind = Literal["login", "write", "priority"]
+
+ip_buckets = TokenBuckets(*ADMISSION_IP_RATE)
+user_buckets = TokenBuckets(*ADMISSION_USER_RATE)
+login_buckets = TokenBuckets(*ADMISSION_LOGIN_RATE)
+write_gate = WriteGate()
+
+registry.callback(
+    "admission_writes_in_flight",
+    "Write requests admitted and not yet finished.",
+    "gauge",
+    lambda: write_gate.active,
+)
+
+
+def _reject(kind: Kind, reason: str, retry_after: float) -> HTTPException:
+    rejected.labels(kind, reason).inc()
+    status, detail = (
+        (503, "Server busy, try again shortly.")
+        if reason == "busy"
+        else (429, "Too many requests.")
+    )
+    return HTTPException(
+        status_code=status,
+        detail=detail,
+        headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+    )
+
+
+def admit(kind: Kind) -> Callable[[Request], AsyncIterator[None]]:
+    """Returns a dependency that admits a request of `kind`:
+
+    - `login`: limited per client IP, since there is no user yet.
+    - `write`: limited per IP and per signed-in user.
+    - `priority`: never limited.
+    """
+
+    async def dependency(request: Request) -> AsyncIterator[None]:
+        if not ADMISSION_ENABLED:
+            yield
+            return
+
+        ip = request.client.host if request.client else ""
+        # (buckets, key, reason) of every limit the request is under.
+        limits: list[tuple[TokenBuckets, Hashable, str]] = []
+
+        if kind == "login":
+            limits.append((login_buckets, ip, "ip"))
+        elif kind == "write":
+            limits.append((ip_buckets, ip, "ip"))
+
+            session = read_session(request.cookies.get(SESSION_COOKIE))
+            if session:
+                limits.append((user_buckets, session["uid"], "user"))
+
+        # Every limit is checked before any token is taken, so a request
+        # turned away by one does not use up the others. Nothing awaits
+        # in between, so the checks still hold when the tokens are taken.
+        for buckets, key, reason in limits:
+            if wait := buckets.wait(key):
+                raise _reject(kind, reason, wait)
+
+        if not write_gate.enter(kind == "priority"):
+            raise _reject(kind, "busy", ADMISSION_RETRY_AFTER_S)
+
+        for buckets, key, _ in limits:
+            buckets.take(key)
+
+        try:
+            yield
+        finally:
+            write_gate.leave()
+
+    return dependency
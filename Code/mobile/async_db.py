@@ -0,0 +1,188 @@
+"""Asyncio front end for `mobile.db_connector`.
+
+Every function here mirrors the blocking one of the same name and runs
+it on a dedicated, fixed-size executor. Each executor thread keeps its
+own pooled connection, and a semaphore bounds how many calls can be
+queued for it, so a burst of requests waits in the event loop instead of
+spreading over FastAPI's general-purpose threadpool.
+"""
+
+import asyncio
+from collections.abc import AsyncIterator, Callable, Iterable
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from functools import partial
+from typing import Any, ParamSpec, TypeVar
+
+from mobile import db_connector as db
+from mobile.constants import (
+    DB_EXECUTOR_MAX_PENDING,
+    DB_EXECUTOR_WORKERS,
+    HISTORY_PAGE_SIZE,
+)
+from mobile.db_connector import ClosedRide, HistoryCursor, User
+from mobile.geo import Area
+
+
+P = ParamSpec("P")
+R = TypeVar("R")
+
+
+@dataclass(slots=True)
+class DatabaseExecutor:
+    workers: int = DB_EXECUTOR_WORKERS
+    max_pending: int = DB_EXECUTOR_MAX_PENDING
+    _executor: ThreadPoolExecutor | None = field(default=None, init=False)
+    _pending: asyncio.Semaphore | None = field(default=None, init=False)
+
+    def start(self) -> None:
+        if self._executor is not None:
+            return
+
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.workers, thread_name_prefix="db"
+        )
+        self._pending = asyncio.Semaphore(self.max_pending)
+
+    def shutdown(self) -> None:
+        if self._executor is None:
+            return
+
+        self._executor.shutdown(wait=True)
+        self._executor = None
+        self._pending = None
+        db.close_db()
+
+    async def run(
+        self, func: Callable[P, R], *args: P.args, **kwargs: P.kwargs
+    ) -> R:
+        if self._executor is None or self._pending is None:
+            self.start()
+
+        assert self._pending is not None
+
+        async with self._pending:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                self._executor, partial(func, *args, **kwargs)
+            )
+
+
+executor = DatabaseExecutor()
+
+
+async def migrate_db() -> list[int]:
+    return await executor.run(db.migrate_db)
+
+
+async def is_fleet_seeded() -> bool:
+    return await executor.run(db.is_fleet_seeded)
+
+
+async def check_user(username: str, password: str) -> User | None:
+    return await executor.run(db.check_user, username, password)
+
+
+async def get_user(user_id: int) -> User | None:
+    return await executor.run(db.get_user, user_id)
+
+
+async def register_user(username: str, password: str) -> User | None:
+    return await executor.run(db.register_user, username, password)
+
+
+async def revoke_sessions(user_id: int) -> User | None:
+    return await executor.run(db.revoke_sessions, user_id)
+
+
+async def insert_scooters(rows: Iterable[tuple[float, float, int]]) -> int:
+    return await executor.run(db.insert_scooters, rows)
+
+
+async def load_available_scooters() -> None:
+    await executor.run(db.load_available_scooters)
+
+
+async def get_scooters(area: Area | None = None) -> list[dict[str, Any]]:
+    return await executor.run(db.get_scooters, area)
+
+
+async def book_scooter(
+    user_id: int | None, scooter_id: int, booking_time: int
+) -> bool:
+    return await executor.run(
+        db.book_scooter, user_id, scooter_id, booking_time
+    )
+
+
+async def end_booking(scooter_id: int, end_time: int) -> ClosedRide | None:
+    return await executor.run(db.end_booking, scooter_id, end_time)
+
+
+async def get_user_bookings(user_id: int) -> dict[str, float | None]:
+    return await executor.run(db.get_user_bookings, user_id)
+
+
+async def get_user_active_bookings(user_id: int) -> list[dict[str, float]]:
+    return await executor.run(db.get_user_active_bookings, user_id)
+
+
+async def get_user_drive_history(
+    user_id: int,
+    after: HistoryCursor | None = None,
+    limit: int = HISTORY_PAGE_SIZE,
+) -> tuple[list[dict[str, float]], HistoryCursor | None]:
+    return await executor.run(db.get_user_drive_history, user_id, after, limit)
+
+
+async def iter_user_drive_history(
+    user_id: int,
+    after: HistoryCursor | None = None,
+    chunk_size: int = HISTORY_PAGE_SIZE,
+) -> AsyncIterator[dict[str, float]]:
+    while True:
+        page, after = await get_user_drive_history(user_id, after, chunk_size)
+
+        for row in page:
+            yield row
+
+        if after is None:
+            return
+
+
+async def insert_charging_stations(
+    rows: Iterable[tuple[float, float]],
+) -> int:
+    return await executor.run(db.insert_charging_stations, rows)
+
+
+async def load_charging_stations() -> None:
+    await executor.run(db.load_charging_stations)
+
+
+async def get_charging_stations(
+    area: Area | None = None,
+) -> list[dict[str, float]]:
+    return await executor.run(db.get_charging_stations, area)
+
+
+async def start_drive(user_id: int, scooter_id: int, start_time: int) -> bool:
+    return await executor.run(db.start_drive, user_id, scooter_id, start_time)
+
+
+async def end_drive(scooter_id: int, end_time: int) -> ClosedRide | None:
+    return await executor.run(db.end_drive, scooter_id, end_time)
+
+
+async def get_hourly_utilization(
+    hours: int, now: int
+) -> list[dict[str, float]]:
+    return await executor.run(db.get_hourly_utilization, hours, now)
+
+
+async def get_scooter_utilization(now: int) -> list[dict[str, float]]:
+    return await executor.run(db.get_scooter_utilization, now)
+
+
+async def get_cell_utilization(now: int) -> list[dict[str, float]]:
+    return await executor.run(db.get_cell_utilization, now)
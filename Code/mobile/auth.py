@@ -0,0 +1,149 @@
+"""Signed session cookies and the user cache behind them.
+
+A session carries the user's id, username, session version and issue
+time, so authenticated requests know who is calling without a lookup.
+The version is compared against a bounded LRU cache of users; only a
+cache miss reaches the database, and bumping the version (see
+`revoke`) rejects every session issued before it.
+"""
+
+import hmac
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any
+
+from itsdangerous import BadSignature, URLSafeSerializer
+
+from mobile.async_db import get_user, revoke_sessions
+from mobile.constants import (
+    ADMIN_TOKEN,
+    SECRET_KEY,
+    SESSION_MAX_AGE,
+    USER_CACHE_SIZE,
+)
+from mobile.db_connector import User, change_watcher
+
+
+SESSION_COOKIE = "session"
+
+serializer = URLSafeSerializer(SECRET_KEY)
+
+
+@dataclass(slots=True)
+class UserCache:
+    """Thread-safe LRU cache of users keyed by id."""
+
+    maxsize: int = USER_CACHE_SIZE
+    _users: OrderedDict[int, User] = field(
+        default_factory=OrderedDict, init=False
+    )
+    _lock: threading.Lock = field(default_factory=threading.Lock, init=False)
+
+    def get(self, user_id: int) -> User | None:
+        with self._lock:
+            if (user := self._users.get(user_id)) is not None:
+                self._users.move_to_end(user_id)
+            return user
+
+    def put(self, user: User) -> None:
+        with self._lock:
+            self._users[user.id] = user
+            self._users.move_to_end(user.id)
+
+            while len(self._users) > self.maxsize:
+                self._users.popitem(last=False)
+
+    def invalidate(self, user_id: int) -> None:
+        with self._lock:
+            self._users.pop(user_id, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._users.clear()
+
+    def __len__(self) -> int:
+        return len(self._users)
+
+
+user_cache = UserCache()
+
+
+def _forget_users(user_ids: set[int] | None) -> None:
+    """Drops users changed by another process from the cache."""
+    if user_ids is None:
+        user_cache.clear()
+        return
+
+    for user_id in user_ids:
+        user_cache.invalidate(user_id)
+
+
+change_watcher.on("user", _forget_users)
+
+
+def issue_session(user: User) -> str:
+    user_cache.put(user)
+    return serializer.dumps(
+        {
+            "uid": user.id,
+            "username": user.username,
+            "ver": user.session_version,
+            "iat": int(time.time()),
+        }
+    )
+
+
+def read_session(token: str | None) -> dict[str, Any]:
+    """Returns the session's claims, or an empty dict if the token is
+    missing, forged, expired or predates the current session format.
+    """
+    if not token:
+        return {}
+
+    try:
+        session: dict[str, Any] = serializer.loads(token)
+    except BadSignature:
+        return {}
+
+    if not {"uid", "username", "ver", "iat"} <= session.keys():
+        return {}
+
+    if time.time() - session["iat"] > SESSION_MAX_AGE:
+        return {}
+
+    return session
+
+
+async def resolve_user(session: dict[str, Any]) -> User | None:
+    """Returns the session's user if the session is still valid.
+
+    Cache hits are answered without touching the database.
+    """
+    if not session:
+        return None
+
+    if (user := user_cache.get(session["uid"])) is None:
+        if (user := await get_user(session["uid"])) is None:
+            return None
+        user_cache.put(user)
+
+    if user.session_version != session["ver"]:
+        return None
+    return user
+
+
+async def revoke(user_id: int) -> None:
+    """Logs the user out of every session issued so far."""
+    if (user := await revoke_sessions(user_id)) is not None:
+        user_cache.put(user)
+    else:
+        user_cache.invalidate(user_id)
+
+
+def is_admin(token: str | None) -> bool:
+    """Whether `token` is the admin token. Never true without one set."""
+    if not ADMIN_TOKEN or not token:
+        return False
+    return hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode())
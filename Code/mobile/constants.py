@@ -4,6 +4,8 @@ from pathlib import Path
 import pytz
 from dotenv import load_dotenv
 
+from scooter import constants as scooter_constants
+
 
 load_dotenv(verbose=True)
 
@@ -11,14 +13,133 @@ HOST = "127.0.0.1"
 PORT = 8_000
 REDIRECT_PORT = 8_001
 
+# A ride costs the unlock price plus its duration at the price per
+# minute, less any discount.
+UNLOCK_PRICE = 10.0
+PRICE_PER_MINUTE = 2.5
 DISCOUNT_RATE = 0.3
+# A scooter left this close to a charging station earns the discount.
+CHARGING_STATION_RADIUS_M = 30.0
+MIN_BATTERY_LEVEL = 20
+
+# Cell size of the in-memory nearest-scooter index, roughly 220 m x 100 m
+# around Trondheim.
+NEAREST_CELL_DEG = 0.002
+NEAREST_MAX_K = 50
+
+# Default synthetic fleet, seeded around central Trondheim.
+CITY_CENTER = (63.422, 10.395)
+SEED_SCOOTERS = 2
+SEED_STATIONS = 10
+
+# Fleet change feed: events kept for resuming clients, deltas a slow
+# client may have pending before it is resynced, and keep-alive period.
+FEED_REPLAY_SIZE = 1_024
+FEED_SUBSCRIBER_BUFFER = 256
+FEED_HEARTBEAT_S = 15.0
+
+HISTORY_PAGE_SIZE = 50
+HISTORY_MAX_PAGE_SIZE = 500
+
+# Rides read and priced at a time by the billing reports.
+REPORT_CHUNK_ROWS = 100_000
+
+# Fleet utilization is summed per hour, per scooter and per grid cell of
+# this size, roughly 550 m x 250 m around Trondheim.
+HOUR_MS = 60 * 60 * 1000
+UTILIZATION_CELL_DEG = 0.005
+UTILIZATION_MAX_HOURS = 31 * 24
 
 INDEX_HTML = "index.html"
 
 TIMEZONE = pytz.timezone("Europe/Oslo")
 
 _module_name = Path(__file__).parent.name
-DATABASE_FILE = Path(_module_name) / "database.db"
-SCHEMA_FILE = Path(_module_name) / "schema.sql"
+DATABASE_FILE = Path(
+    os.getenv("DATABASE_FILE", Path(_module_name) / "database.db")
+)
+MIGRATIONS_DIR = Path(_module_name) / "migrations"
+FRONTEND_DIR = Path(_module_name) / "templates" / "dist_vue"
+ASSETS_DIR = FRONTEND_DIR / "assets"
+
+DB_TIMEOUT = 5.0
+DB_CACHED_STATEMENTS = 256
+DB_MMAP_SIZE = 256 * 1024 * 1024
+DB_EXECUTOR_WORKERS = 8
+DB_EXECUTOR_MAX_PENDING = 1_024
+
+# Upper bounds, in seconds, of the latency histograms on `/metrics`.
+LATENCY_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+# Requests are profiled when they send `X-Profile: <PROFILE_TOKEN>`, or at
+# random at the sample rate. Statements slower than SLOW_QUERY_MS are
+# logged; 0 turns both off.
+PROFILE_DIR = Path(os.getenv("PROFILE_DIR", "profiles"))
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN")
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_KEEP = 200
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "0"))
+
+# `/admin/*` and `/metrics` answer requests with
+# `X-Admin-Token: <ADMIN_TOKEN>`, and nothing at all without a token set.
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+# Token buckets as (tokens per second, burst), per worker process. Load
+# tests that sign up many riders from one address run with ADMISSION=off.
+ADMISSION_ENABLED = os.getenv("ADMISSION", "on") != "off"
+ADMISSION_USER_RATE = (1.0, 5)
+ADMISSION_IP_RATE = (5.0, 30)
+ADMISSION_LOGIN_RATE = (0.2, 10)
+ADMISSION_MAX_KEYS = 100_000
+# Concurrent writes per worker; SQLite runs them one at a time anyway.
+ADMISSION_MAX_WRITES = 32
+ADMISSION_RETRY_AFTER_S = 1
+
+# Other worker processes' writes are picked up this often. Bigger batches
+# than the threshold reload everything instead of row by row. The log is
+# cut back to its last CHANGE_LOG_KEEP entries every prune interval.
+CHANGE_POLL_INTERVAL_S = 0.1
+CHANGE_RELOAD_THRESHOLD = 5_000
+CHANGE_LOG_KEEP = 100_000
+CHANGE_PRUNE_INTERVAL_S = 60.0
+
+# The broker scooter commands go to; the load test points the backend at
+# a local stand-in instead.
+MQTT_BROKER = os.getenv("MQTT_BROKER", scooter_constants.BROKER)
+MQTT_PORT = int(os.getenv("MQTT_PORT", scooter_constants.PORT))
+MQTT_CLIENT_PREFIX = "mobile-backend"
+MQTT_QOS = 1
+MQTT_KEEPALIVE = 60
+MQTT_MAX_QUEUE = 10_000
+MQTT_MAX_INFLIGHT = 100
+MQTT_RECONNECT_MIN_DELAY = 1
+MQTT_RECONNECT_MAX_DELAY = 60
+MQTT_ACK_TIMEOUT_S = 60.0
+
+# Scooters report position and battery on TELEMETRY_TOPIC. Reports are
+# merged per scooter and written every TELEMETRY_FLUSH_INTERVAL_S in one
+# transaction. Workers share the subscription, so each report reaches one
+# of them; an empty TELEMETRY_SHARE_GROUP has every worker get them all.
+TELEMETRY_TOPIC = "escooter/+/telemetry"
+TELEMETRY_SHARE_GROUP = os.getenv("TELEMETRY_SHARE_GROUP", MQTT_CLIENT_PREFIX)
+TELEMETRY_FLUSH_INTERVAL_S = 1.0
+TELEMETRY_MAX_PENDING = 100_000
 
 SECRET_KEY: str = os.getenv("SECRET_KEY")  # type: ignore
+SESSION_MAX_AGE = 30 * 24 * 60 * 60
+USER_CACHE_SIZE = 10_000
@@ -1,115 +1,590 @@
-import os
+import json
 import secrets
-import sqlite3
-from datetime import datetime
+from collections import Counter
+from collections.abc import Iterable, Iterator, Mapping
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
 from sqlite3 import Connection, Cursor, IntegrityError
 from typing import Any
 
+from mobile.change_watcher import ChangeWatcher
 from mobile.constants import (
+    CHARGING_STATION_RADIUS_M,
     DATABASE_FILE,
+    DB_CACHED_STATEMENTS,
+    DB_MMAP_SIZE,
+    DB_TIMEOUT,
     DISCOUNT_RATE,
-    SCHEMA_FILE,
-    TIMEZONE,
+    HISTORY_PAGE_SIZE,
+    HOUR_MS,
+    MIN_BATTERY_LEVEL,
+    NEAREST_CELL_DEG,
+    SLOW_QUERY_MS,
+    UTILIZATION_CELL_DEG,
 )
-from mobile.helpers import get_price, hash_password, validate_password
+from mobile.db_pool import ConnectionPool
+from mobile.fleet_feed import (
+    BookingOverlay,
+    FleetFeed,
+    ScooterRow,
+    scooter_dict,
+)
+from mobile.geo import Area, grid_cell
+from mobile.helpers import (
+    hash_password,
+    price_sql,
+    validate_password,
+)
+from mobile.metrics import registry, timed
+from mobile.migrations import migrate
+from mobile.profiling import SlowQueryLog
+from mobile.spatial_index import GridIndex
+from mobile.telemetry import Telemetry
+
+
+pool = ConnectionPool(
+    DATABASE_FILE,
+    timeout=DB_TIMEOUT,
+    cached_statements=DB_CACHED_STATEMENTS,
+    mmap_size=DB_MMAP_SIZE,
+    slow_queries=(
+        SlowQueryLog(SLOW_QUERY_MS / 1000) if SLOW_QUERY_MS > 0 else None
+    ),
+)
+
+registry.callback(
+    "db_pool_connections",
+    "Open pooled SQLite connections.",
+    "gauge",
+    lambda: pool.size,
+)
+registry.callback(
+    "db_pool_opened_total",
+    "SQLite connections opened.",
+    "counter",
+    lambda: pool.stats.opened,
+)
+registry.callback(
+    "db_pool_closed_total",
+    "SQLite connections closed.",
+    "counter",
+    lambda: pool.stats.closed,
+)
+registry.callback(
+    "db_pool_checkouts_total",
+    "Connection checkouts, nested ones included.",
+    "counter",
+    lambda: pool.stats.checkouts,
+)
+
+# Free scooters with enough battery, keyed by id with the battery level
+# as payload. Kept up to date by the functions that change availability.
+available_scooters: GridIndex[int] = GridIndex(NEAREST_CELL_DEG)
+
+# Every scooter as last written, and the stream of changes to it. Its
+# version is bumped by every fleet write and keys the cached responses.
+fleet_feed = FleetFeed()
+
+registry.callback(
+    "fleet_feed_subscribers",
+    "Open `/scooters/stream` connections.",
+    "gauge",
+    lambda: fleet_feed.subscribers,
+)
+registry.callback(
+    "fleet_feed_version",
+    "Fleet changes applied by this process.",
+    "counter",
+    lambda: fleet_feed.version,
+)
+
+# Open bookings by user, for the per-user overlay on `/scooters`.
+booking_overlay = BookingOverlay()
+
+# Applies writes committed by other processes to the state above.
+change_watcher = ChangeWatcher()
+
+# Charging station positions, used to decide whether a ride ended close
+# enough to one to earn the discount.
+charging_station_index: GridIndex[None] = GridIndex(NEAREST_CELL_DEG)
+
+_SCOOTER_COLUMNS = (
+    "id, latitude, longitude, battery_level, is_booked, is_driving"
+)
+
+
+@dataclass(frozen=True, slots=True)
+class ClosedRide:
+    """A booking or drive as it was closed by `end_booking()` or
+    `end_drive()`. Times are UTC epoch milliseconds, like in the database.
+    """
+
+    id: int
+    scooter_id: int
+    start_time: int
+    end_time: int
+    discount: float
+    price: float
+
+    @property
+    def minutes(self) -> float:
+        return (self.end_time - self.start_time) / 60_000
+
+
+def is_near_charging_station(lat: float, lng: float) -> bool:
+    return bool(
+        charging_station_index.nearest(
+            lat, lng, 1, max_distance_m=CHARGING_STATION_RADIUS_M
+        )
+    )
+
+
+def _discount(scooter: ScooterRow) -> float:
+    """The discount applies when the scooter was left at a charging
+    station.
+    """
+    return DISCOUNT_RATE if is_near_charging_station(*scooter[1:3]) else 0.0
+
+
+def _record_utilization(
+    cur: Cursor, booked: bool, scooter: ScooterRow, start: int, end: int
+) -> None:
+    """Adds a ride that just closed to the utilization aggregates, in the
+    transaction that closes it.
+    """
+    if end <= start:
+        return
+
+    busy, count = (
+        ("booked_ms", "bookings") if booked else ("driving_ms", "drives")
+    )
+    hours = range(start - start % HOUR_MS, end, HOUR_MS)
+    cur.executemany(
+        f"""
+        INSERT INTO utilization_hourly (hour, {busy}) VALUES (?, ?)
+        ON CONFLICT (hour) DO UPDATE SET {busy} = {busy} + excluded.{busy}
+        """,
+        [
+            (hour, min(end, hour + HOUR_MS) - max(start, hour))
+            for hour in hours
+        ],
+    )
+    cur.execute(
+        f"""
+        INSERT INTO utilization_scooter (scooter_id, {busy}, {count}, since)
+        VALUES (?, ?, 1, ?)
+        ON CONFLICT (scooter_id) DO UPDATE
+        SET {busy} = {busy} + excluded.{busy}, {count} = {count} + 1,
+            since = min(coalesce(since, excluded.since), excluded.since)
+        """,
+        (scooter[0], end - start, start),
+    )
+    cur.execute(
+        f"""
+        INSERT INTO utilization_cell (cell_lat, cell_lng, {busy}, {count})
+        VALUES (?, ?, ?, 1)
+        ON CONFLICT (cell_lat, cell_lng) DO UPDATE
+        SET {busy} = {busy} + excluded.{busy}, {count} = {count} + 1
+        """,
+        (*grid_cell(*scooter[1:3], UTILIZATION_CELL_DEG), end - start),
+    )
+
+
+def use_database(database: Path) -> None:
+    """Points the pool at another database file, e.g. a scratch copy."""
+    pool.close_all()
+    pool.database = database
 
 
 def nuke_db() -> None:
-    os.remove(DATABASE_FILE)
-    conn, _ = connect_db()
-    conn.close()
+    pool.close_all()
+
+    for suffix in ("", "-wal", "-shm"):
+        pool.database.with_name(pool.database.name + suffix).unlink(
+            missing_ok=True
+        )
+
+    with connect_db():
+        pass
+
 
+@contextmanager
+def connect_db() -> Iterator[tuple[Connection, Cursor]]:
+    """Checks out this thread's pooled connection.
 
-def connect_db() -> tuple[Connection, Cursor]:
-    conn = sqlite3.connect(DATABASE_FILE)
-    cur = conn.cursor()
-    cur.execute("PRAGMA foreign_keys = ON")
-    cur.execute("PRAGMA analysis_limit = 1000")
-    return conn, cur
+    The outermost `with connect_db()` block commits when it exits
+    normally and rolls back when it raises.
+    """
+    with pool.connection() as conn:
+        cur = conn.cursor()
+        try:
+            yield conn, cur
+        finally:
+            cur.close()
 
 
-def create_tables() -> None:
-    conn, cur = connect_db()
+@contextmanager
+def transaction() -> Iterator[Cursor]:
+    """Runs the block inside `BEGIN IMMEDIATE`.
 
-    with open(SCHEMA_FILE, encoding="utf-8") as file:
-        cur.executescript(file.read())
+    The write lock is taken up front, so checks made inside the block
+    still hold when it commits. Must not be nested in another open
+    transaction on the same thread.
+    """
+    with connect_db() as (_, cur):
+        cur.execute("BEGIN IMMEDIATE")
+        yield cur
 
-    conn.commit()
-    conn.close()
 
+def close_db() -> None:
+    pool.close_all()
 
-def check_user(username: str, password: str) -> bool:
-    conn, cur = connect_db()
-    row: tuple[str, str] | None = cur.execute(
-        "SELECT password_hash, salt FROM users WHERE username = ?", (username,)
-    ).fetchone()
-    conn.close()
+
+@timed
+def migrate_db() -> list[int]:
+    lock = pool.database.with_name(pool.database.name + ".migrate.lock")
+
+    with connect_db() as (conn, _):
+        return migrate(conn, lock)
+
+
+@timed
+def is_fleet_seeded() -> bool:
+    with connect_db() as (_, cur):
+        row = cur.execute("SELECT 1 FROM scooters LIMIT 1").fetchone()
+    return row is not None
+
+
+@dataclass(frozen=True, slots=True)
+class User:
+    id: int
+    username: str
+    session_version: int
+
+
+_USER_COLUMNS = "id, username, session_version"
+
+
+@timed
+def check_user(username: str, password: str) -> User | None:
+    with connect_db() as (_, cur):
+        row: tuple[int, str, int, str, str] | None = cur.execute(
+            f"""
+            SELECT {_USER_COLUMNS}, password_hash, salt
+            FROM users WHERE username = ?
+            """,
+            (username,),
+        ).fetchone()
 
     if row is None:
-        return False
+        return None
 
-    stored_hash, salt = row
+    user_id, name, session_version, stored_hash, salt = row
     password_hash = hash_password(password, salt)
-    return stored_hash == password_hash
 
+    if stored_hash != password_hash:
+        return None
+    return User(user_id, name, session_version)
 
-def register_user(username: str, password: str) -> bool:
+
+@timed
+def get_user(user_id: int) -> User | None:
+    with connect_db() as (_, cur):
+        row = cur.execute(
+            f"SELECT {_USER_COLUMNS} FROM users WHERE id = ?", (user_id,)
+        ).fetchone()
+    return User(*row) if row else None
+
+
+@timed
+def register_user(username: str, password: str) -> User | None:
     if not validate_password(username, password):
-        return False
+        return None
 
-    conn, cur = connect_db()
     salt = secrets.token_urlsafe(8)
     password_hash = hash_password(password, salt)
 
-    try:
-        cur.execute(
-            """
-            INSERT INTO users (username, password_hash, salt)
-            VALUES (?, ?, ?)
+    with connect_db() as (_, cur):
+        try:
+            row = cur.execute(
+                f"""
+                INSERT INTO users (username, password_hash, salt)
+                VALUES (?, ?, ?)
+                RETURNING {_USER_COLUMNS}
+                """,
+                (username, password_hash, salt),
+            ).fetchone()
+        except IntegrityError:
+            return None
+
+    return User(*row)
+
+
+@timed
+def revoke_sessions(user_id: int) -> User | None:
+    """Bumps the user's session version so that every session issued so
+    far is rejected.
+    """
+    with connect_db() as (_, cur):
+        row = cur.execute(
+            f"""
+            UPDATE users SET session_version = session_version + 1
+            WHERE id = ?
+            RETURNING {_USER_COLUMNS}
             """,
-            (username, password_hash, salt),
+            (user_id,),
+        ).fetchone()
+    return User(*row) if row else None
+
+
+def _insert_scooters(
+    cur: Cursor, rows: Iterable[tuple[float, float, int]]
+) -> int:
+    cur.executemany(
+        """
+        INSERT INTO scooters (latitude, longitude, battery_level)
+        VALUES (?, ?, ?)
+        """,
+        rows,
+    )
+    return cur.rowcount
+
+
+@timed
+def insert_scooters(rows: Iterable[tuple[float, float, int]]) -> int:
+    """Bulk-inserts `(latitude, longitude, battery_level)` rows in one
+    transaction and returns how many were written.
+    """
+    with transaction() as cur:
+        count = _insert_scooters(cur, rows)
+
+    load_available_scooters()
+    return count
+
+
+@timed
+def insert_fleet(
+    scooters: Iterable[tuple[float, float, int]],
+    stations: Iterable[tuple[float, float]],
+) -> tuple[int, int]:
+    """Bulk-inserts scooters and charging stations, as for
+    `insert_scooters()` and `insert_charging_stations()`, in a single
+    transaction. Returns both counts.
+    """
+    with transaction() as cur:
+        counts = (
+            _insert_scooters(cur, scooters),
+            _insert_charging_stations(cur, stations),
         )
-    except IntegrityError:
-        conn.close()
-        return False
 
-    conn.commit()
-    conn.close()
-    return True
+    load_available_scooters()
+    load_charging_stations()
+    return counts
+
+
+def _is_available(scooter: ScooterRow) -> bool:
+    _, _, _, battery_level, is_booked, is_driving = scooter
+    return not (is_booked or is_driving) and battery_level > MIN_BATTERY_LEVEL
+
+
+@timed
+def load_available_scooters() -> None:
+    """Reloads `fleet_feed`, `booking_overlay` and `available_scooters`
+    from the database.
+    """
+    with connect_db() as (_, cur):
+        rows: list[ScooterRow] = cur.execute(
+            f"SELECT {_SCOOTER_COLUMNS} FROM scooters"
+        ).fetchall()
+        bookings = cur.execute(
+            "SELECT user_id, scooter_id FROM bookings WHERE end_time IS NULL"
+        ).fetchall()
+
+    booking_overlay.reset(bookings)
+    fleet_feed.reset(rows)
+    available_scooters.rebuild(
+        (scooter_id, lat, lng, battery_level)
+        for scooter_id, lat, lng, battery_level, _, _ in filter(
+            _is_available, rows
+        )
+    )
+
 
+def _track_availability(scooter: ScooterRow) -> None:
+    scooter_id, lat, lng, battery_level = scooter[:4]
+
+    if _is_available(scooter):
+        available_scooters.upsert(scooter_id, lat, lng, battery_level)
+    else:
+        available_scooters.remove(scooter_id)
+
+
+fleet_feed.add_listener(_track_availability)
+
+
+@timed
+def refresh_scooters(scooter_ids: set[int] | None) -> None:
+    """Re-reads scooters changed elsewhere (all of them for None) into
+    `fleet_feed` and `booking_overlay`.
+    """
+    if scooter_ids is None:
+        load_available_scooters()
+        return
+
+    ids = sorted(scooter_ids)
+    rows: list[ScooterRow] = []
+    bookings: dict[int, int] = {}
+
+    with connect_db() as (_, cur):
+        for start in range(0, len(ids), 500):
+            chunk = ids[start : start + 500]
+            marks = ",".join("?" * len(chunk))
+            rows += cur.execute(
+                f"""
+                SELECT {_SCOOTER_COLUMNS} FROM scooters
+                WHERE id IN ({marks})
+                """,
+                chunk,
+            )
+            bookings.update(
+                cur.execute(
+                    f"""
+                    SELECT scooter_id, user_id FROM bookings
+                    WHERE end_time IS NULL AND scooter_id IN ({marks})
+                    """,
+                    chunk,
+                )
+            )
+
+    if len(rows) < len(ids):
+        # Deleted scooters have no row to publish; only a reload drops
+        # them from the mirror and the indexes.
+        load_available_scooters()
+        return
 
-def generate_scooters(center_lat: float, center_lng: float) -> None:
-    conn, cur = connect_db()
-    lat_delta = 1e-4
-    ltd_delta = 4 * lat_delta
+    for row in rows:
+        if (user_id := bookings.get(row[0])) is None:
+            booking_overlay.release(row[0])
+        else:
+            booking_overlay.book(user_id, row[0])
 
-    for _ in range(2):
-        lat = center_lat + (secrets.randbelow(200) - 100) * lat_delta
-        lng = center_lng + (secrets.randbelow(200) - 100) * ltd_delta
-        battery_level = secrets.randbelow(101)
+    fleet_feed.publish(rows)
 
-        cur.execute(
+
+change_watcher.on("scooter", refresh_scooters)
+
+
+def _is_news(scooter_id: int, report: Telemetry) -> bool:
+    if (row := fleet_feed.get(scooter_id)) is None:
+        return True
+    position = report.latitude, report.longitude
+
+    if report.latitude is not None and position != row[1:3]:
+        return True
+    return report.battery_level not in (None, row[3])
+
+
+@timed
+def update_telemetry(reports: Mapping[int, Telemetry]) -> int:
+    """Writes the latest reported positions and battery levels in one
+    transaction and returns how many scooters changed.
+    """
+    # Reports that repeat what the feed already shows are not written,
+    # and the WHERE clause skips the rest that change nothing, so parked
+    # scooters touch neither the R*Tree nor `change_log`.
+    news = [
+        (scooter_id, report.latitude, report.longitude, report.battery_level)
+        for scooter_id, report in reports.items()
+        if _is_news(scooter_id, report)
+    ]
+
+    if not news:
+        return 0
+
+    with transaction() as cur:
+        cur.executemany(
             """
-            INSERT INTO scooters (latitude, longitude, battery_level)
-            VALUES (?, ?, ?)
+            UPDATE scooters
+            SET latitude = coalesce(?2, latitude),
+                longitude = coalesce(?3, longitude),
+                battery_level = coalesce(?4, battery_level)
+            WHERE id = ?1 AND (
+                latitude IS NOT coalesce(?2, latitude)
+                OR longitude IS NOT coalesce(?3, longitude)
+                OR battery_level IS NOT coalesce(?4, battery_level)
+            )
             """,
-            (lat, lng, battery_level),
+            news,
         )
+        changed = cur.rowcount
 
-    conn.commit()
-    conn.close()
+    if changed:
+        refresh_scooters({scooter_id for scooter_id, *_ in news})
+    return changed
 
 
-def get_scooters() -> list[dict[str, Any]]:
-    conn, cur = connect_db()
-    rows = cur.execute(
-        """
-        SELECT id, latitude, longitude, battery_level, is_booked, is_driving
-        FROM scooters
-        WHERE battery_level > 20
-        """
-    ).fetchall()
-    scooters = [
+def nearest_available_scooters(
+    lat: float, lng: float, k: int
+) -> list[dict[str, float | int]]:
+    return [
+        {
+            "id": neighbour.id,
+            "latitude": neighbour.latitude,
+            "longitude": neighbour.longitude,
+            "battery_level": neighbour.payload,
+            "distance_m": round(neighbour.distance_m, 1),
+        }
+        for neighbour in available_scooters.nearest(lat, lng, k)
+    ]
+
+
+def _bounds_params(area: Area) -> dict[str, float]:
+    box = area.bounds()
+    return {
+        "min_lat": box.min_lat,
+        "max_lat": box.max_lat,
+        "min_lng": box.min_lng,
+        "max_lng": box.max_lng,
+    }
+
+
+@timed
+def get_scooters(area: Area | None = None) -> list[dict[str, Any]]:
+    """Returns the scooters with enough battery, optionally only those
+    inside `area`.
+
+    Area queries are answered from the `scooters_rtree` index; its
+    single-precision boxes are widened by SQLite, so candidates are
+    checked against the exact area afterwards.
+    """
+    with connect_db() as (_, cur):
+        if area is None:
+            rows = cur.execute(
+                """
+                SELECT id, latitude, longitude, battery_level, is_booked,
+                    is_driving
+                FROM scooters
+                WHERE battery_level > ?
+                """,
+                (MIN_BATTERY_LEVEL,),
+            ).fetchall()
+        else:
+            rows = cur.execute(
+                """
+                SELECT s.id, s.latitude, s.longitude, s.battery_level,
+                    s.is_booked, s.is_driving
+                FROM scooters_rtree AS r
+                CROSS JOIN scooters AS s ON s.id = r.id
+                WHERE r.max_lat >= :min_lat AND r.min_lat <= :max_lat
+                    AND r.max_lng >= :min_lng AND r.min_lng <= :max_lng
+                    AND s.battery_level > :min_battery
+                """,
+                {**_bounds_params(area), "min_battery": MIN_BATTERY_LEVEL},
+            ).fetchall()
+            rows = [row for row in rows if area.contains(row[1], row[2])]
+
+    return [
         {
             "id": row[0],
             "latitude": row[1],
@@ -120,27 +595,64 @@ def get_scooters() -> list[dict[str, Any]]:
         }
         for row in rows
     ]
-    conn.close()
-    return scooters
 
 
+def _render_free_scooters(version: int, rows: list[ScooterRow]) -> bytes:
+    return b",".join(
+        json.dumps({**scooter_dict(row), "is_user_booked": False}).encode()
+        for row in rows
+        if row[3] > MIN_BATTERY_LEVEL and not row[4]
+    )
+
+
+def scooters_json(user_id: int | None) -> tuple[int, bytes]:
+    """Returns the fleet version and the `/scooters` body for `user_id`
+    without querying the database.
+
+    The unbooked scooters are rendered once per version and shared; the
+    user's own bookings are spliced in front of them.
+    """
+    version, free = fleet_feed.cached("free_scooters", _render_free_scooters)
+    own = [
+        json.dumps({**scooter_dict(row), "is_user_booked": True}).encode()
+        for scooter_id in booking_overlay.scooters_of(user_id or 0)
+        if (row := fleet_feed.get(scooter_id)) is not None
+        and row[3] > MIN_BATTERY_LEVEL
+    ]
+    return version, b"[" + b",".join([*own, free] if free else own) + b"]"
+
+
+@timed
 def book_scooter(
-    user_id: int | None, scooter_id: int, booking_time: str
+    user_id: int | None, scooter_id: int, booking_time: int
 ) -> bool:
-    conn, cur = connect_db()
-    existing_booking = cur.execute(
-        """
-        SELECT id FROM bookings
-        WHERE scooter_id = ? AND end_time IS NULL
-        """,
-        (scooter_id,),
-    ).fetchone()
+    """Reserves a free scooter for `user_id`.
 
-    if existing_booking:
-        conn.close()
+    The scooter row acts as the lock: only one of several concurrent
+    requests can flip `is_booked`, every other one sees no row returned
+    and fails straight away.
+    """
+    if user_id is None:
         return False
 
-    try:
+    with transaction() as cur:
+        claimed = cur.execute(
+            f"""
+            UPDATE scooters
+            SET is_booked = 1
+            WHERE id = ? AND is_booked = 0 AND is_driving = 0
+                AND NOT EXISTS (
+                    SELECT 1 FROM bookings
+                    WHERE scooter_id = scooters.id AND end_time IS NULL
+                )
+            RETURNING {_SCOOTER_COLUMNS}
+            """,
+            (scooter_id,),
+        ).fetchone()
+
+        if claimed is None:
+            return False
+
         cur.execute(
             """
             INSERT INTO bookings (user_id, scooter_id, booking_time)
@@ -148,123 +660,78 @@ def book_scooter(
             """,
             (user_id, scooter_id, booking_time),
         )
-    except IntegrityError:
-        conn.close()
-        return False
 
-    try:
-        cur.execute(
-            """
-            UPDATE scooters
-            SET is_booked = 1
-            WHERE id = ?
-            """,
-            (scooter_id,),
-        )
-    except IntegrityError:
-        conn.close()
-        return False
-
-    conn.commit()
-    conn.close()
+    booking_overlay.book(user_id, scooter_id)
+    fleet_feed.publish([claimed])
     return True
 
 
-def end_booking(booking_id: int, end_time: str, apply_discount: bool) -> float:
-    conn, cur = connect_db()
-
-    # Update booking
-    cur.execute(
-        """
-        UPDATE bookings
-        SET end_time = ?, is_active = 0
-        WHERE scooter_id = ? AND end_time IS NULL
-        """,
-        (end_time, booking_id),
-    )
-    conn.commit()
-
-    # Fetch booking again
-    row = cur.execute(
-        """
-        SELECT scooter_id, booking_time, end_time
-        FROM bookings
-        WHERE scooter_id = ?
-        """,
-        (booking_id,),
-    ).fetchone()
-
-    if row is None:
-        conn.close()
-        return 0.0
-
-    scooter_id, booking_time, actual_end_time = row
-
-    # New: check that `actual_end_time` and `booking_time` actually exist
-    if not actual_end_time or not booking_time:
-        conn.close()
-        return 0.0
-
-    # Update scooter status
-    cur.execute(
-        """
-        UPDATE scooters
-        SET is_booked = 0
-        WHERE id = ?
-        """,
-        (scooter_id,),
-    )
-    conn.commit()
-
-    # Safe parsing
-    booking_time_dt = (
-        datetime.fromisoformat(booking_time)
-        if isinstance(booking_time, str)
-        else booking_time
-    ).astimezone(TIMEZONE)
-
-    end_time_dt = (
-        datetime.fromisoformat(actual_end_time)
-        if isinstance(actual_end_time, str)
-        else actual_end_time
-    ).astimezone(TIMEZONE)
-
-    discount = DISCOUNT_RATE if apply_discount else 0.0
-    minutes = (end_time_dt - booking_time_dt).total_seconds() / 60
-    price = get_price(minutes, discount)
-
-    cur.execute(
-        """
-        UPDATE bookings
-        SET price = ?
-        WHERE id = ?
-        """,
-        (price, booking_id),
+@timed
+def end_booking(scooter_id: int, end_time: int) -> ClosedRide | None:
+    """Frees a scooter and closes its open booking, priced in the same
+    statement, all in one transaction.
+    """
+    with transaction() as cur:
+        scooter = cur.execute(
+            f"""
+            UPDATE scooters
+            SET is_booked = 0
+            WHERE id = ? AND EXISTS (
+                SELECT 1 FROM bookings
+                WHERE scooter_id = scooters.id AND end_time IS NULL
+            )
+            RETURNING {_SCOOTER_COLUMNS}
+            """,
+            (scooter_id,),
+        ).fetchone()
+
+        if scooter is None:
+            return None
+
+        discount = _discount(scooter)
+        booking_id, booking_time, price = cur.execute(
+            f"""
+            UPDATE bookings
+            SET end_time = :end_time, is_active = 0, discount = :discount,
+                price = {price_sql("booking_time", ":end_time", ":discount")}
+            WHERE scooter_id = :scooter_id AND end_time IS NULL
+            RETURNING id, booking_time, price
+            """,
+            {
+                "end_time": end_time,
+                "discount": discount,
+                "scooter_id": scooter_id,
+            },
+        ).fetchone()
+        _record_utilization(cur, True, scooter, booking_time, end_time)
+
+    booking_overlay.release(scooter_id)
+    fleet_feed.publish([scooter])
+    # RETURNING hands back whole-number prices as integers.
+    return ClosedRide(
+        booking_id, scooter_id, booking_time, end_time, discount, float(price)
     )
-    conn.commit()
-    conn.close()
-    return price
 
 
-def get_user_bookings(user_id: int) -> dict[str, float | int | str]:
-    conn, cur = connect_db()
-    row = cur.execute(
-        """
-        SELECT b.id, s.latitude, s.longitude, s.battery_level, b.booking_time,
-            b.end_time, b.price
-        FROM bookings AS b JOIN scooters AS s ON b.scooter_id = s.id
-        WHERE b.user_id = ?
-        """,
-        (user_id,),
-    ).fetchone()
-    conn.close()
+@timed
+def get_user_bookings(user_id: int) -> dict[str, float | None]:
+    with connect_db() as (_, cur):
+        row = cur.execute(
+            """
+            SELECT b.id, s.latitude, s.longitude, s.battery_level,
+                b.booking_time, b.end_time, b.price
+            FROM bookings AS b JOIN scooters AS s ON b.scooter_id = s.id
+            WHERE b.user_id = ?
+            """,
+            (user_id,),
+        ).fetchone()
 
     if row is None:
         return {}
 
-    booking_time: str = row[4]
-    end_time: str = row[5]
-    booking: dict[str, float | str] = {
+    booking_time: int = row[4]
+    end_time: int | None = row[5]
+    booking: dict[str, float | None] = {
         "id": row[0],
         "latitude": row[1],
         "longitude": row[2],
@@ -277,20 +744,19 @@ def get_user_bookings(user_id: int) -> dict[str, float | int | str]:
     return booking
 
 
-def get_user_active_bookings(
-    user_id: int,
-) -> list[dict[str, float | str]]:
-    conn, cur = connect_db()
-    rows = cur.execute(
-        """
-        SELECT b.id, s.latitude, s.longitude, s.battery_level, b.booking_time
-        FROM bookings AS b
-        JOIN scooters AS s ON b.scooter_id = s.id
-        WHERE b.user_id = ? AND b.is_active = 1
-        """,
-        (user_id,),
-    ).fetchall()
-    conn.close()
+@timed
+def get_user_active_bookings(user_id: int) -> list[dict[str, float]]:
+    with connect_db() as (_, cur):
+        rows = cur.execute(
+            """
+            SELECT b.id, s.latitude, s.longitude, s.battery_level,
+                b.booking_time
+            FROM bookings AS b
+            JOIN scooters AS s ON b.scooter_id = s.id
+            WHERE b.user_id = ? AND b.is_active = 1
+            """,
+            (user_id,),
+        ).fetchall()
 
     return [
         {
@@ -304,93 +770,217 @@ def get_user_active_bookings(
     ]
 
 
+# Position of the last history row a client has seen, (end_time, drive id).
+HistoryCursor = tuple[int, int]
+
+
+@timed
 def get_user_drive_history(
     user_id: int,
-) -> list[dict[str, float | str]]:
-    conn, cur = connect_db()
-    rows = cur.execute(
-        """
-        SELECT d.scooter_id, s.latitude, s.longitude, s.battery_level,
-            d.driving_time, d.end_time, d.price
-        FROM drives AS d
-        JOIN scooters AS s ON d.scooter_id = s.id
-        WHERE d.user_id = ? AND d.is_active = 0
-        """,
-        (user_id,),
-    ).fetchall()
-    conn.close()
+    after: HistoryCursor | None = None,
+    limit: int = HISTORY_PAGE_SIZE,
+) -> tuple[list[dict[str, float]], HistoryCursor | None]:
+    """Returns one page of finished drives, newest first, and the cursor
+    of the next page if there is one. Times are UTC epoch milliseconds.
+
+    Pages are keyset seeks on `(end_time, id)`, so fetching a page costs
+    the same however deep into the history it is.
+    """
+    seek = "AND (d.end_time, d.id) < (:end_time, :id)" if after else ""
+
+    with connect_db() as (_, cur):
+        rows = cur.execute(
+            f"""
+            SELECT d.id, d.scooter_id, s.latitude, s.longitude,
+                s.battery_level, d.driving_time, d.end_time, d.price
+            FROM drives AS d
+            JOIN scooters AS s ON d.scooter_id = s.id
+            WHERE d.user_id = :user_id AND d.is_active = 0 {seek}
+            ORDER BY d.end_time DESC, d.id DESC
+            LIMIT :limit
+            """,
+            {
+                "user_id": user_id,
+                "end_time": after and after[0],
+                "id": after and after[1],
+                "limit": limit + 1,
+            },
+        ).fetchall()
 
-    history: list[dict[str, float | str]] = []
+    next_cursor = None
 
-    for row in rows:
-        booking_time = datetime.fromisoformat(row[4]).astimezone(TIMEZONE)
-        end_time = datetime.fromisoformat(row[5]).astimezone(TIMEZONE)
-        history.append(
-            {
-                "id": row[0],
-                "latitude": row[1],
-                "longitude": row[2],
-                "battery_level": row[3],
-                "booking_time": booking_time.strftime("%Y-%m-%d %H:%M:%S"),
-                "end_time": end_time.strftime("%Y-%m-%d %H:%M:%S"),
-                "price": row[6],
-            }
-        )
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = (rows[-1][6], rows[-1][0])
 
-    return history
+    history = [
+        {
+            "id": row[1],
+            "latitude": row[2],
+            "longitude": row[3],
+            "battery_level": row[4],
+            "booking_time": row[5],
+            "end_time": row[6],
+            "price": row[7],
+        }
+        for row in rows
+    ]
+    return history, next_cursor
 
 
-def generate_charging_stations(center_lat: float, center_lng: float) -> None:
-    conn, cur = connect_db()
-    lat_delta = 1e-4
-    lng_delta = 4 * lat_delta
+def iter_user_drive_history(
+    user_id: int,
+    after: HistoryCursor | None = None,
+    chunk_size: int = HISTORY_PAGE_SIZE,
+) -> Iterator[dict[str, float]]:
+    """Yields the whole history from `after` onwards, one page at a time.
+
+    Each page is read on its own checkout, so a slow consumer never
+    holds a connection between pages.
+    """
+    while True:
+        page, after = get_user_drive_history(user_id, after, chunk_size)
+        yield from page
+
+        if after is None:
+            return
+
+
+def _insert_charging_stations(
+    cur: Cursor, rows: Iterable[tuple[float, float]]
+) -> int:
+    cur.executemany(
+        """
+        INSERT INTO charging_stations (latitude, longitude)
+        VALUES (?, ?)
+        """,
+        rows,
+    )
+    return cur.rowcount
 
-    for _ in range(10):
-        lat = center_lat + (secrets.randbelow(200) - 100) * lat_delta
-        lng = center_lng + (secrets.randbelow(200) - 100) * lng_delta
-        cur.execute(
-            """
-            INSERT INTO charging_stations (latitude, longitude)
-            VALUES (?, ?)
-            """,
-            (lat, lng),
-        )
 
-    conn.commit()
-    conn.close()
+@timed
+def insert_charging_stations(rows: Iterable[tuple[float, float]]) -> int:
+    """Bulk-inserts `(latitude, longitude)` rows in one transaction and
+    returns how many were written.
+    """
+    with transaction() as cur:
+        count = _insert_charging_stations(cur, rows)
 
+    load_charging_stations()
+    return count
 
-def get_charging_stations() -> list[dict[str, float]]:
-    conn, cur = connect_db()
-    rows = cur.execute(
-        """
-        SELECT id, latitude, longitude
-        FROM charging_stations
-        """
-    ).fetchall()
-    stations = [
+
+@timed
+def load_charging_stations() -> None:
+    """Rebuilds `charging_station_index` from the database."""
+    with connect_db() as (_, cur):
+        rows = cur.execute(
+            "SELECT id, latitude, longitude FROM charging_stations"
+        ).fetchall()
+
+    charging_station_index.rebuild(
+        (station_id, lat, lng, None) for station_id, lat, lng in rows
+    )
+    fleet_feed.touch()
+
+
+def _render_charging_stations(version: int, rows: list[ScooterRow]) -> bytes:
+    return json.dumps(
+        [
+            {"id": station_id, "latitude": lat, "longitude": lng}
+            for station_id, lat, lng, _ in charging_station_index.points()
+        ]
+    ).encode()
+
+
+change_watcher.on("charging_station", lambda _: load_charging_stations())
+
+
+def charging_stations_json() -> tuple[int, bytes]:
+    """Returns the fleet version and every charging station as JSON,
+    rendered from memory once per version.
+    """
+    return fleet_feed.cached("charging_stations", _render_charging_stations)
+
+
+@timed
+def get_charging_stations(
+    area: Area | None = None,
+) -> list[dict[str, float]]:
+    with connect_db() as (_, cur):
+        if area is None:
+            rows = cur.execute(
+                """
+                SELECT id, latitude, longitude
+                FROM charging_stations
+                """
+            ).fetchall()
+        else:
+            rows = cur.execute(
+                """
+                SELECT c.id, c.latitude, c.longitude
+                FROM charging_stations_rtree AS r
+                CROSS JOIN charging_stations AS c ON c.id = r.id
+                WHERE r.max_lat >= :min_lat AND r.min_lat <= :max_lat
+                    AND r.max_lng >= :min_lng AND r.min_lng <= :max_lng
+                """,
+                _bounds_params(area),
+            ).fetchall()
+            rows = [row for row in rows if area.contains(row[1], row[2])]
+
+    return [
         {"id": row[0], "latitude": row[1], "longitude": row[2]} for row in rows
     ]
-    conn.close()
-    return stations
 
 
-def start_drive(user_id: int, scooter_id: int, start_time: str) -> bool:
-    conn, cur = connect_db()
-    # End any existing booking before starting a drive
-    existing_booking = cur.execute(
-        """
-        SELECT scooter_id FROM drives
-        WHERE scooter_id = ? AND end_time IS NULL
-        """,
-        (scooter_id,),
-    ).fetchone()
+@timed
+def start_drive(user_id: int, scooter_id: int, start_time: int) -> bool:
+    """Unlocks a scooter that is free or reserved by `user_id`.
 
-    if existing_booking:
-        conn.close()
-        return False
+    Works like `book_scooter()`: the conditional update claims the
+    scooter, and a reservation the rider still holds on it is closed in
+    the same transaction.
+    """
+    with transaction() as cur:
+        claimed = cur.execute(
+            f"""
+            UPDATE scooters
+            SET is_driving = 1, is_booked = 0
+            WHERE id = ? AND is_driving = 0
+                AND (
+                    is_booked = 0
+                    OR EXISTS (
+                        SELECT 1 FROM bookings
+                        WHERE scooter_id = scooters.id AND user_id = ?
+                            AND end_time IS NULL
+                    )
+                )
+                AND NOT EXISTS (
+                    SELECT 1 FROM drives
+                    WHERE scooter_id = scooters.id AND end_time IS NULL
+                )
+            RETURNING {_SCOOTER_COLUMNS}
+            """,
+            (scooter_id, user_id),
+        ).fetchone()
+
+        if claimed is None:
+            return False
+
+        reservation = cur.execute(
+            """
+            UPDATE bookings
+            SET end_time = ?, is_active = 0
+            WHERE scooter_id = ? AND user_id = ? AND end_time IS NULL
+            RETURNING booking_time
+            """,
+            (start_time, scooter_id, user_id),
+        ).fetchone()
+
+        if reservation is not None:
+            _record_utilization(cur, True, claimed, reservation[0], start_time)
 
-    try:
         cur.execute(
             """
             INSERT INTO drives (user_id, scooter_id, driving_time)
@@ -398,89 +988,187 @@ def start_drive(user_id: int, scooter_id: int, start_time: str) -> bool:
             """,
             (user_id, scooter_id, start_time),
         )
-    except IntegrityError:
-        conn.close()
-        return False
 
-    try:
-        cur.execute(
-            """
+    booking_overlay.release(scooter_id)
+    fleet_feed.publish([claimed])
+    return True
+
+
+@timed
+def end_drive(scooter_id: int, end_time: int) -> ClosedRide | None:
+    """Frees a scooter and closes its open drive, priced in the same
+    statement, all in one transaction.
+    """
+    with transaction() as cur:
+        scooter = cur.execute(
+            f"""
             UPDATE scooters
-            SET is_driving = 1, is_booked = 0
-            WHERE id = ?
+            SET is_driving = 0, is_booked = 0
+            WHERE id = ? AND EXISTS (
+                SELECT 1 FROM drives
+                WHERE scooter_id = scooters.id AND end_time IS NULL
+            )
+            RETURNING {_SCOOTER_COLUMNS}
             """,
             (scooter_id,),
-        )
-    except IntegrityError:
-        conn.close()
-        return False
+        ).fetchone()
+
+        if scooter is None:
+            return None
+
+        discount = _discount(scooter)
+        drive_id, driving_time, price = cur.execute(
+            f"""
+            UPDATE drives
+            SET end_time = :end_time, is_active = 0, discount = :discount,
+                price = {price_sql("driving_time", ":end_time", ":discount")}
+            WHERE scooter_id = :scooter_id AND end_time IS NULL
+            RETURNING id, driving_time, price
+            """,
+            {
+                "end_time": end_time,
+                "discount": discount,
+                "scooter_id": scooter_id,
+            },
+        ).fetchone()
+        _record_utilization(cur, False, scooter, driving_time, end_time)
+
+    fleet_feed.publish([scooter])
+    # RETURNING hands back whole-number prices as integers.
+    return ClosedRide(
+        drive_id, scooter_id, driving_time, end_time, discount, float(price)
+    )
 
-    conn.commit()
-    conn.close()
-    return True
+
+def _shares(
+    booked_ms: int, driving_ms: int, capacity_ms: int
+) -> dict[str, float]:
+    """Splits `capacity_ms` of scooter time into booked, driving and idle
+    shares.
+    """
+    if capacity_ms <= 0:
+        return {"booked": 0.0, "driving": 0.0, "idle": 1.0}
+
+    booked = min(1.0, booked_ms / capacity_ms)
+    driving = min(1.0 - booked, driving_ms / capacity_ms)
+    return {
+        "booked": round(booked, 4),
+        "driving": round(driving, 4),
+        "idle": round(1.0 - booked - driving, 4),
+    }
 
 
-def end_drive(scooter_id: int, end_time: str, apply_discount: bool) -> float:
-    conn, cur = connect_db()
+@timed
+def get_hourly_utilization(hours: int, now: int) -> list[dict[str, float]]:
+    """Fleet utilization in each of the last `hours` hours up to `now`,
+    oldest first, against the current fleet size.
+
+    Read from the aggregates, so the cost depends on `hours` and never on
+    the length of the history. A ride only counts once it has closed.
+    """
+    current = now - now % HOUR_MS
+    first = current - (hours - 1) * HOUR_MS
+
+    with connect_db() as (_, cur):
+        fleet: int = cur.execute("SELECT COUNT(*) FROM scooters").fetchone()[0]
+        totals = {
+            hour: (booked, driving)
+            for hour, booked, driving in cur.execute(
+                """
+                SELECT hour, booked_ms, driving_ms FROM utilization_hourly
+                WHERE hour BETWEEN ? AND ?
+                """,
+                (first, current),
+            )
+        }
 
-    # Update the drive record
-    cur.execute(
-        """
-        UPDATE drives
-        SET end_time = ?, is_active = 0
-        WHERE scooter_id = ? AND end_time IS NULL
-        """,
-        (end_time, scooter_id),
-    )
-    conn.commit()
+    utilization: list[dict[str, float]] = []
 
-    # Fetch the updated drive details
-    row = cur.execute(
-        """
-        SELECT scooter_id, driving_time, end_time
-        FROM drives
-        WHERE scooter_id = ?
-        """,
-        (scooter_id,),
-    ).fetchone()
+    for hour in range(first, current + HOUR_MS, HOUR_MS):
+        booked, driving = totals.get(hour, (0, 0))
+        capacity = fleet * min(HOUR_MS, now - hour)
+        utilization.append(
+            {"hour": hour, **_shares(booked, driving, capacity)}
+        )
 
-    if row is None:
-        conn.close()
-        return 0.0
+    return utilization
 
-    # Extract data and validate
-    scooter_id_from_drive, driving_time, end_time = row
-    if not driving_time or not end_time:
-        conn.close()
-        return 0.0
 
-    # Update the scooter status
-    cur.execute(
-        """
-        UPDATE scooters
-        SET is_driving = 0, is_booked = 0
-        WHERE id = ?
-        """,
-        (scooter_id_from_drive,),
-    )
-    conn.commit()
+@timed
+def get_scooter_utilization(now: int) -> list[dict[str, float]]:
+    """All-time totals per scooter: its bookings and drives, and the
+    shares of its time spent booked, driving and idle since its own first
+    ride.
+    """
+    with connect_db() as (_, cur):
+        rows = cur.execute(
+            """
+            SELECT s.id, coalesce(u.booked_ms, 0), coalesce(u.driving_ms, 0),
+                coalesce(u.bookings, 0), coalesce(u.drives, 0), u.since
+            FROM scooters AS s
+            LEFT JOIN utilization_scooter AS u ON u.scooter_id = s.id
+            ORDER BY s.id
+            """
+        ).fetchall()
 
-    discount = DISCOUNT_RATE if apply_discount else 0.0
+    return [
+        {
+            "id": scooter_id,
+            "bookings": bookings,
+            "drives": drives,
+            **_shares(
+                booked, driving, now - since if since is not None else 0
+            ),
+        }
+        for scooter_id, booked, driving, bookings, drives, since in rows
+    ]
 
-    # Calculate duration and price
-    driving_time = datetime.fromisoformat(driving_time).astimezone(TIMEZONE)
-    end_time_date = datetime.fromisoformat(end_time).astimezone(TIMEZONE)
-    minutes = (end_time_date - driving_time).total_seconds() / 60
-    price = get_price(minutes, discount)
 
-    cur.execute(
-        """
-        UPDATE drives
-        SET price = ?
-        WHERE scooter_id = ?
-        """,
-        (price, scooter_id_from_drive),
-    )
-    conn.commit()
-    conn.close()
-    return price
+@timed
+def get_cell_utilization(now: int) -> list[dict[str, float]]:
+    """All-time totals per grid cell, against the time since the first
+    hour on record.
+
+    Rides count towards the cell the scooter was left in. The time
+    available in a cell is taken to be the scooters standing in it now
+    times the window, which holds as long as scooters are not moved
+    around between rides.
+    """
+    with connect_db() as (_, cur):
+        since = cur.execute(
+            "SELECT MIN(hour) FROM utilization_hourly"
+        ).fetchone()[0]
+        parked = Counter(
+            grid_cell(lat, lng, UTILIZATION_CELL_DEG)
+            for lat, lng in cur.execute(
+                "SELECT latitude, longitude FROM scooters"
+            )
+        )
+        totals = {
+            (cell_lat, cell_lng): rest
+            for cell_lat, cell_lng, *rest in cur.execute(
+                """
+                SELECT cell_lat, cell_lng, booked_ms, driving_ms, bookings,
+                    drives
+                FROM utilization_cell
+                """
+            )
+        }
+
+    window = now - since if since is not None else 0
+    utilization: list[dict[str, float]] = []
+
+    for cell in sorted(parked.keys() | totals.keys()):
+        booked, driving, bookings, drives = totals.get(cell, (0, 0, 0, 0))
+        utilization.append(
+            {
+                "min_lat": round(cell[0] * UTILIZATION_CELL_DEG, 6),
+                "min_lng": round(cell[1] * UTILIZATION_CELL_DEG, 6),
+                "scooters": parked[cell],
+                "bookings": bookings,
+                "drives": drives,
+                **_shares(booked, driving, parked[cell] * window),
+            }
+        )
+
+    return utilization
@@ -0,0 +1,127 @@
+import sqlite3
+import threading
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from sqlite3 import Connection
+
+from mobile.profiling import SlowQueryLog
+
+
+@dataclass(slots=True)
+class PoolStats:
+    opened: int = 0
+    closed: int = 0
+    checkouts: int = 0
+
+
+@dataclass(slots=True)
+class _Slot:
+    """The connection owned by one thread and its checkout depth."""
+
+    conn: Connection
+    owner: threading.Thread
+    depth: int = 0
+
+
+@dataclass(slots=True)
+class ConnectionPool:
+    """Hands out one long-lived SQLite connection per thread.
+
+    Connections are opened lazily, configured once and reused for every
+    checkout on the same thread. Checkouts nest: only the outermost one
+    commits on success or rolls back on error.
+    """
+
+    database: Path
+    timeout: float = 5.0
+    cached_statements: int = 256
+    mmap_size: int = 0
+    slow_queries: SlowQueryLog | None = None
+    stats: PoolStats = field(default_factory=PoolStats, init=False)
+    _local: threading.local = field(
+        default_factory=threading.local, init=False
+    )
+    _slots: dict[int, _Slot] = field(default_factory=dict, init=False)
+    _lock: threading.Lock = field(default_factory=threading.Lock, init=False)
+
+    def _open(self) -> Connection:
+        # Connections never cross threads during a checkout, but
+        # `close_all()` may close them from whichever thread shuts down.
+        conn = sqlite3.connect(
+            self.database,
+            timeout=self.timeout,
+            cached_statements=self.cached_statements,
+            check_same_thread=False,
+        )
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.execute("PRAGMA foreign_keys = ON")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        conn.execute(f"PRAGMA mmap_size = {int(self.mmap_size)}")
+        conn.execute("PRAGMA analysis_limit = 1000")
+
+        if self.slow_queries is not None:
+            self.slow_queries.attach(conn)
+        return conn
+
+    def _slot(self) -> _Slot:
+        slot: _Slot | None = getattr(self._local, "slot", None)
+
+        if slot is not None:
+            return slot
+
+        slot = _Slot(self._open(), threading.current_thread())
+        self._local.slot = slot
+
+        with self._lock:
+            self._prune()
+            self._slots[threading.get_ident()] = slot
+            self.stats.opened += 1
+
+        return slot
+
+    def _prune(self) -> None:
+        """Closes connections left behind by threads that have exited."""
+        for ident, slot in list(self._slots.items()):
+            if slot.owner.is_alive():
+                continue
+            slot.conn.close()
+            del self._slots[ident]
+            self.stats.closed += 1
+
+    @contextmanager
+    def connection(self) -> Iterator[Connection]:
+        slot = self._slot()
+        slot.depth += 1
+        self.stats.checkouts += 1
+
+        try:
+            yield slot.conn
+        except BaseException:
+            if slot.depth == 1 and slot.conn.in_transaction:
+                slot.conn.rollback()
+            raise
+        else:
+            if slot.depth == 1 and slot.conn.in_transaction:
+                slot.conn.commit()
+        finally:
+            slot.depth -= 1
+
+            if slot.depth == 0 and self.slow_queries is not None:
+                self.slow_queries.flush(slot.conn)
+
+    @property
+    def size(self) -> int:
+        return len(self._slots)
+
+    def close_all(self) -> None:
+        with self._lock:
+            for slot in self._slots.values():
+                slot.conn.close()
+                self.stats.closed += 1
+            self._slots.clear()
+
+        # Threads that still hold a closed slot reconnect on next use.
+        self._local = threading.local()
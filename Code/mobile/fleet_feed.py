@@ -0,0 +1,334 @@
+"""In-process change feed for the scooter fleet.
+
+`db_connector` publishes the scooter rows its writes return, after the
+transaction commits. The feed keeps a mirror of the whole fleet, works
+out what changed, serializes each delta once as a Server-Sent Event and
+fans it out to every subscriber, so connected clients cost no queries.
+Synchronous listeners (such as the nearest-scooter index) are called
+from the publishing thread.
+"""
+
+import asyncio
+import json
+import secrets
+import threading
+from collections import deque
+from collections.abc import AsyncIterator, Callable, Iterable
+from dataclasses import dataclass, field
+
+from mobile.constants import (
+    FEED_HEARTBEAT_S,
+    FEED_REPLAY_SIZE,
+    FEED_SUBSCRIBER_BUFFER,
+    MIN_BATTERY_LEVEL,
+)
+
+
+# (id, latitude, longitude, battery_level, is_booked, is_driving)
+ScooterRow = tuple[int, float, float, int, int, int]
+
+Listener = Callable[[ScooterRow], None]
+
+
+def scooter_dict(row: ScooterRow) -> dict[str, float | int | bool]:
+    return {
+        "id": row[0],
+        "latitude": row[1],
+        "longitude": row[2],
+        "battery_level": row[3],
+        "is_booked": bool(row[4]),
+        "is_driving": bool(row[5]),
+    }
+
+
+def _changes(before: ScooterRow | None, after: ScooterRow) -> list[str]:
+    if before is None:
+        return ["added"]
+
+    changes: list[str] = []
+
+    if after[5] and not before[5]:
+        changes.append("driving")
+    elif after[4] and not before[4]:
+        changes.append("booked")
+    elif (before[4] or before[5]) and not (after[4] or after[5]):
+        changes.append("freed")
+
+    if after[1:3] != before[1:3]:
+        changes.append("moved")
+    if after[3] != before[3]:
+        changes.append("battery")
+
+    return changes
+
+
+def _event(event: str, event_id: str, data: object) -> bytes:
+    payload = json.dumps(data, separators=(",", ":"))
+    return f"id: {event_id}\nevent: {event}\ndata: {payload}\n\n".encode()
+
+
+@dataclass(slots=True)
+class BookingOverlay:
+    """Which user holds the open booking on which scooter, kept in memory
+    so per-user views of the fleet need no queries.
+    """
+
+    _users: dict[int, int] = field(default_factory=dict, init=False)
+    _scooters: dict[int, set[int]] = field(default_factory=dict, init=False)
+    _lock: threading.Lock = field(default_factory=threading.Lock, init=False)
+
+    def reset(self, bookings: Iterable[tuple[int, int]]) -> None:
+        """Replaces everything with `(user_id, scooter_id)` pairs."""
+        with self._lock:
+            self._users.clear()
+            self._scooters.clear()
+
+            for user_id, scooter_id in bookings:
+                self._users[scooter_id] = user_id
+                self._scooters.setdefault(user_id, set()).add(scooter_id)
+
+    def book(self, user_id: int, scooter_id: int) -> None:
+        with self._lock:
+            self._users[scooter_id] = user_id
+            self._scooters.setdefault(user_id, set()).add(scooter_id)
+
+    def release(self, scooter_id: int) -> None:
+        with self._lock:
+            if (user_id := self._users.pop(scooter_id, None)) is None:
+                return
+
+            scooters = self._scooters[user_id]
+            scooters.discard(scooter_id)
+
+            if not scooters:
+                del self._scooters[user_id]
+
+    def scooters_of(self, user_id: int) -> frozenset[int]:
+        with self._lock:
+            return frozenset(self._scooters.get(user_id, ()))
+
+
+@dataclass(eq=False, slots=True)
+class _Subscriber:
+    events: deque[bytes] = field(default_factory=deque)
+    wakeup: asyncio.Event = field(default_factory=asyncio.Event)
+    # Set when the subscriber fell too far behind; it gets a fresh
+    # snapshot instead of the deltas it missed.
+    resync: bool = False
+
+
+@dataclass(slots=True)
+class FleetFeed:
+    buffer: int = FEED_SUBSCRIBER_BUFFER
+    replay_size: int = FEED_REPLAY_SIZE
+    version: int = field(default=0, init=False)
+    # Versions only mean something within one process, so ETags and event
+    # ids carry this random epoch: another worker or a restart never
+    # mistakes them for its own.
+    epoch: str = field(
+        default_factory=lambda: secrets.token_hex(4), init=False
+    )
+    _scooters: dict[int, ScooterRow] = field(default_factory=dict, init=False)
+    _cache: dict[str, tuple[int, bytes]] = field(
+        default_factory=dict, init=False
+    )
+    # Recent (version, event) pairs, for clients resuming with
+    # `Last-Event-ID`.
+    _recent: deque[tuple[int, bytes]] = field(init=False)
+    _listeners: list[Listener] = field(default_factory=list, init=False)
+    _subscribers: set[_Subscriber] = field(default_factory=set, init=False)
+    _loop: asyncio.AbstractEventLoop | None = field(default=None, init=False)
+    _lock: threading.Lock = field(default_factory=threading.Lock, init=False)
+
+    def __post_init__(self) -> None:
+        self._recent = deque(maxlen=self.replay_size)
+
+    def add_listener(self, listener: Listener) -> None:
+        self._listeners.append(listener)
+
+    def attach(self, loop: asyncio.AbstractEventLoop | None) -> None:
+        """Sets the event loop that subscribers live on."""
+        self._loop = loop
+
+    @property
+    def subscribers(self) -> int:
+        return len(self._subscribers)
+
+    def reset(self, rows: Iterable[ScooterRow]) -> None:
+        """Replaces the whole mirror; every subscriber is resynced."""
+        with self._lock:
+            self._scooters = {row[0]: row for row in rows}
+            self.version += 1
+            self._recent.clear()
+
+        self._dispatch(None)
+
+    def publish(self, rows: Iterable[ScooterRow | None]) -> None:
+        events: list[bytes] = []
+        changed: list[ScooterRow] = []
+
+        with self._lock:
+            for row in rows:
+                if row is None:
+                    continue
+
+                before = self._scooters.get(row[0])
+
+                if before == row or not (changes := _changes(before, row)):
+                    continue
+
+                self._scooters[row[0]] = row
+                self.version += 1
+                event = _event(
+                    "scooter",
+                    self.tag(self.version),
+                    {"changes": changes, "scooter": scooter_dict(row)},
+                )
+                self._recent.append((self.version, event))
+                events.append(event)
+                changed.append(row)
+
+        if not changed:
+            return
+
+        for row in changed:
+            for listener in self._listeners:
+                listener(row)
+
+        self._dispatch(events)
+
+    def _dispatch(self, events: list[bytes] | None) -> None:
+        if (loop := self._loop) is None or loop.is_closed():
+            return
+
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+
+        if running is loop:
+            self._fan_out(events)
+        else:
+            loop.call_soon_threadsafe(self._fan_out, events)
+
+    def _fan_out(self, events: list[bytes] | None) -> None:
+        for subscriber in self._subscribers:
+            if events is None or (
+                len(subscriber.events) + len(events) > self.buffer
+            ):
+                subscriber.events.clear()
+                subscriber.resync = True
+            else:
+                subscriber.events.extend(events)
+            subscriber.wakeup.set()
+
+    def get(self, scooter_id: int) -> ScooterRow | None:
+        return self._scooters.get(scooter_id)
+
+    def tag(self, version: int | None = None) -> str:
+        """Identifies `version` (by default the current one) across
+        processes.
+        """
+        return f"{self.epoch}.{self.version if version is None else version}"
+
+    def touch(self) -> None:
+        """Bumps the version for a fleet change that has no scooter delta,
+        such as new charging stations.
+        """
+        with self._lock:
+            self.version += 1
+
+    def cached(
+        self, key: str, render: Callable[[int, list[ScooterRow]], bytes]
+    ) -> tuple[int, bytes]:
+        """Returns the current version and `render(version, scooters)`,
+        rendered at most once per version and key.
+        """
+        with self._lock:
+            version = self.version
+
+            if (hit := self._cache.get(key)) is not None and hit[0] == version:
+                return hit
+
+            rows = list(self._scooters.values())
+
+        # Rendering happens outside the lock so that writers are never
+        # held up by it; a result that is already stale is not stored.
+        body = render(version, rows)
+
+        with self._lock:
+            if version == self.version:
+                self._cache[key] = (version, body)
+
+        return version, body
+
+    def snapshot(self) -> tuple[int, bytes]:
+        """Returns the current version and a `snapshot` event listing the
+        scooters with enough battery.
+        """
+        return self.cached("snapshot", self._render_snapshot)
+
+    def _render_snapshot(self, version: int, rows: list[ScooterRow]) -> bytes:
+        scooters = [
+            scooter_dict(row) for row in rows if row[3] > MIN_BATTERY_LEVEL
+        ]
+        return _event("snapshot", self.tag(version), scooters)
+
+    def _since(self, version: int) -> list[bytes] | None:
+        """Events after `version`, or None if they are no longer kept."""
+        with self._lock:
+            if version == self.version:
+                return []
+
+            if (
+                version > self.version
+                or not self._recent
+                or self._recent[0][0] > version + 1
+            ):
+                return None
+
+            return [event for v, event in self._recent if v > version]
+
+    async def stream(
+        self, last_event_id: str | None = None
+    ) -> AsyncIterator[bytes]:
+        """Yields a snapshot (or the deltas missed since `last_event_id`)
+        followed by every delta, with comment heartbeats in between.
+        """
+        subscriber = _Subscriber()
+        self._subscribers.add(subscriber)
+
+        try:
+            backlog = None
+
+            epoch, _, version = (last_event_id or "").partition(".")
+
+            if epoch == self.epoch and version.isdigit():
+                backlog = self._since(int(version))
+
+            if backlog is None:
+                backlog = [self.snapshot()[1]]
+
+            for event in backlog:
+                yield event
+
+            while True:
+                try:
+                    await asyncio.wait_for(
+                        subscriber.wakeup.wait(), FEED_HEARTBEAT_S
+                    )
+                except TimeoutError:
+                    yield b": keep-alive\n\n"
+                    continue
+
+                subscriber.wakeup.clear()
+
+                if subscriber.resync:
+                    subscriber.resync = False
+                    yield self.snapshot()[1]
+                    continue
+
+                while subscriber.events:
+                    yield subscriber.events.popleft()
+        finally:
+            self._subscribers.discard(subscriber)
@@ -0,0 +1,63 @@
+from dataclasses import dataclass
+from math import asin, cos, degrees, floor, radians, sin, sqrt
+
+
+EARTH_RADIUS_M = 6_371_000.0
+
+
+def haversine_m(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """Great-circle distance between two points in metres."""
+    d_lat = radians(lat2 - lat1)
+    d_lng = radians(lng2 - lng1)
+    a = (
+        sin(d_lat / 2) ** 2
+        + cos(radians(lat1)) * cos(radians(lat2)) * sin(d_lng / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_M * asin(min(1.0, sqrt(a)))
+
+
+def grid_cell(lat: float, lng: float, cell_deg: float) -> tuple[int, int]:
+    """The fixed-size lat/lng cell a point falls in."""
+    return floor(lat / cell_deg), floor(lng / cell_deg)
+
+
+@dataclass(frozen=True, slots=True)
+class BoundingBox:
+    min_lat: float
+    min_lng: float
+    max_lat: float
+    max_lng: float
+
+    def bounds(self) -> "BoundingBox":
+        return self
+
+    def contains(self, lat: float, lng: float) -> bool:
+        return (
+            self.min_lat <= lat <= self.max_lat
+            and self.min_lng <= lng <= self.max_lng
+        )
+
+
+@dataclass(frozen=True, slots=True)
+class Circle:
+    lat: float
+    lng: float
+    radius_m: float
+
+    def bounds(self) -> BoundingBox:
+        """The smallest box around the circle, used to prefilter."""
+        d_lat = degrees(self.radius_m / EARTH_RADIUS_M)
+        # Longitude degrees shrink towards the poles.
+        d_lng = d_lat / max(cos(radians(self.lat)), 1e-6)
+        return BoundingBox(
+            self.lat - d_lat,
+            self.lng - d_lng,
+            self.lat + d_lat,
+            self.lng + d_lng,
+        )
+
+    def contains(self, lat: float, lng: float) -> bool:
+        return haversine_m(self.lat, self.lng, lat, lng) <= self.radius_m
+
+
+Area = BoundingBox | Circle
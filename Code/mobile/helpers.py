@@ -1,7 +1,17 @@
+import base64
 import hashlib
+import json
+import math
+import time
 from datetime import datetime
+from typing import Any
 
-from mobile.constants import SECRET_KEY
+from mobile.constants import (
+    PRICE_PER_MINUTE,
+    SECRET_KEY,
+    TIMEZONE,
+    UNLOCK_PRICE,
+)
 
 
 def hash_password(password: str, salt: str) -> str:
@@ -25,15 +35,91 @@ def validate_password(username: str, password: str) -> bool:
     return True
 
 
-def to_datetime(value: str | datetime) -> datetime:
-    if isinstance(value, str):
-        return datetime.fromisoformat(value)
-    return value
+def now_ms() -> int:
+    """The current time as stored in the database: UTC epoch ms."""
+    return time.time_ns() // 1_000_000
+
+
+def format_time(epoch_ms: int) -> str:
+    """Formats a stored time in local time for API responses."""
+    moment = datetime.fromtimestamp(epoch_ms / 1000, TIMEZONE)
+    return moment.strftime("%Y-%m-%d %H:%M:%S")
+
+
+# Prices are worked out exactly, in integer cents, milliseconds and
+# basis points of discount, and rounded half a cent up once at the end.
+# `get_price()`, `price_sql()` and `reports.Tariff` all follow this rule,
+# so they agree to the cent.
+MS_PER_MINUTE = 60_000
+BASIS_POINTS = 10_000
+# A price in cents times this is an exact integer.
+PRICE_SCALE = MS_PER_MINUTE * BASIS_POINTS
+
+
+def cents(amount: float) -> int:
+    return math.floor(amount * 100 + 0.5)
+
+
+def price_cents(duration_ms: int, discount: float) -> int:
+    """The price of a ride in whole cents."""
+    scaled = (
+        cents(UNLOCK_PRICE) * MS_PER_MINUTE
+        + cents(PRICE_PER_MINUTE) * max(0, duration_ms)
+    ) * (BASIS_POINTS - math.floor(discount * BASIS_POINTS + 0.5))
+    return (scaled + PRICE_SCALE // 2) // PRICE_SCALE
 
 
 def get_price(minutes: float, discount: float) -> float:
-    return round((10 + max(0, 2.5 * minutes)) * (1 - discount), 2)
+    return price_cents(round(minutes * MS_PER_MINUTE), discount) / 100
+
+
+def price_sql(start: str, end: str, discount: str) -> str:
+    """`get_price()` as an SQL expression over epoch ms columns or
+    parameters, for pricing rides in the statement that closes them or
+    in bulk.
+    """
+    duration = f"max(0, CAST(({end}) - ({start}) AS INTEGER))"
+    basis_points = f"CAST(({discount}) * {BASIS_POINTS} + 0.5 AS INTEGER)"
+    scaled = (
+        f"({cents(UNLOCK_PRICE) * MS_PER_MINUTE}"
+        f" + {cents(PRICE_PER_MINUTE)} * {duration})"
+        f" * ({BASIS_POINTS} - {basis_points})"
+    )
+    return f"(({scaled}) + {PRICE_SCALE // 2}) / {PRICE_SCALE} / 100.0"
 
 
 def clean_username(username: str) -> str:
     return username.strip().lower()
+
+
+def encode_cursor(*values: int) -> str:
+    """Packs a pagination position into an opaque URL-safe token."""
+    payload = json.dumps(values, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(payload).rstrip(b"=").decode()
+
+
+def _is_sqlite_int(value: Any) -> bool:
+    return (
+        isinstance(value, int)
+        and not isinstance(value, bool)
+        and -(2**63) <= value < 2**63
+    )
+
+
+def decode_cursor(token: str) -> tuple[int, int]:
+    """Reverses `encode_cursor()` for a position of two integers. Raises
+    `ValueError` on a bad token, including numbers SQLite cannot bind.
+    """
+    padding = "=" * (-len(token) % 4)
+    try:
+        values = json.loads(base64.urlsafe_b64decode(token + padding))
+    except (TypeError, ValueError) as e:
+        raise ValueError("Malformed cursor") from e
+
+    if not (
+        isinstance(values, list)
+        and len(values) == 2
+        and all(map(_is_sqlite_int, values))
+    ):
+        raise ValueError("Malformed cursor")
+    return values[0], values[1]
@@ -0,0 +1,338 @@
+"""Prometheus text-format metrics without a client library.
+
+Counters, gauges and histograms are plain in-process objects. Label
+values are resolved to a child once (usually at import or decoration
+time), so recording an event is a few additions. They are not locked:
+losing an update takes a thread switch between two bytecodes, which is
+rare enough for monitoring, and a lock would cost more than the rest of
+the recording put together. Values that already live elsewhere, such as
+the connection pool's counters, are read through callbacks when
+`/metrics` is scraped.
+
+Each worker process keeps its own registry; with several workers a scrape
+reports the worker that happened to answer it, identified by the `pid`
+in `process_info`.
+"""
+
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections.abc import Callable, Iterable, Iterator
+from dataclasses import dataclass, field
+from functools import wraps
+from typing import Any, Generic, ParamSpec, TypeVar
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from mobile.constants import LATENCY_BUCKETS
+
+
+P = ParamSpec("P")
+R = TypeVar("R")
+C = TypeVar("C", "CounterChild", "GaugeChild", "HistogramChild")
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# (suffix, labels, value) triples making up one metric's exposition.
+Sample = tuple[str, tuple[tuple[str, str], ...], float]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: tuple[tuple[str, str], ...]) -> str:
+    if not labels:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in labels)
+    return f"{{{pairs}}}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+@dataclass(slots=True)
+class CounterChild:
+    value: float = 0.0
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.value += amount
+
+
+@dataclass(slots=True)
+class GaugeChild:
+    value: float = 0.0
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        self.value -= amount
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+
+@dataclass(slots=True)
+class HistogramChild:
+    bounds: tuple[float, ...]
+    # One count per bound plus the +Inf bucket, not cumulative.
+    counts: list[int] = field(init=False)
+    sum: float = 0.0
+
+    def __post_init__(self) -> None:
+        self.counts = [0] * (len(self.bounds) + 1)
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+
+@dataclass(slots=True)
+class Metric(Generic[C]):
+    name: str
+    help: str
+    kind: str
+    new_child: Callable[[], C]
+    labelnames: tuple[str, ...] = ()
+    # Read at scrape time instead of recorded; returns a value per label
+    # tuple.
+    source: Callable[[], Iterable[tuple[tuple[str, ...], float]]] | None = None
+    _children: dict[tuple[str, ...], C] = field(
+        default_factory=dict, init=False
+    )
+    _lock: threading.Lock = field(default_factory=threading.Lock, init=False)
+
+    def labels(self, *values: str) -> C:
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}")
+
+        if (child := self._children.get(values)) is not None:
+            return child
+
+        with self._lock:
+            if (child := self._children.get(values)) is None:
+                child = self.new_child()
+                self._children[values] = child
+            return child
+
+    def samples(self) -> Iterator[Sample]:
+        if self.source is not None:
+            for values, value in self.source():
+                yield "", tuple(zip(self.labelnames, values)), value
+            return
+
+        for values, child in list(self._children.items()):
+            labels = tuple(zip(self.labelnames, values))
+
+            if isinstance(child, HistogramChild):
+                counts, total = list(child.counts), child.sum
+
+                # Not `(*child.bounds, ...)`: mypy cannot type a starred
+                # tuple display inside a method generic over C.
+                bounds = child.bounds + (float("inf"),)
+
+                cumulative = 0
+                for bound, count in zip(bounds, counts):
+                    cumulative += count
+                    le = (("le", _format_value(bound)),)
+                    yield "_bucket", labels + le, cumulative
+                yield "_sum", labels, total
+                yield "_count", labels, cumulative
+            else:
+                yield "", labels, child.value
+
+
+@dataclass(slots=True)
+class Registry:
+    _metrics: dict[str, Metric[Any]] = field(default_factory=dict, init=False)
+
+    def register(self, metric: Metric[C]) -> Metric[C]:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(
+        self, name: str, help: str, labelnames: tuple[str, ...] = ()
+    ) -> Metric[CounterChild]:
+        return self.register(
+            Metric(name, help, "counter", CounterChild, labelnames)
+        )
+
+    def gauge(
+        self, name: str, help: str, labelnames: tuple[str, ...] = ()
+    ) -> Metric[GaugeChild]:
+        return self.register(
+            Metric(name, help, "gauge", GaugeChild, labelnames)
+        )
+
+    def histogram(
+        self,
+        name: str,
+        help: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = LATENCY_BUCKETS,
+    ) -> Metric[HistogramChild]:
+        return self.register(
+            Metric(
+                name,
+                help,
+                "histogram",
+                lambda: HistogramChild(buckets),
+                labelnames,
+            )
+        )
+
+    def callback(
+        self, name: str, help: str, kind: str, source: Callable[[], float]
+    ) -> Metric[GaugeChild]:
+        """Registers an unlabelled counter or gauge whose value is read
+        from `source` at scrape time.
+        """
+        return self.register(
+            Metric(
+                name,
+                help,
+                kind,
+                GaugeChild,
+                source=lambda: [((), source())],
+            )
+        )
+
+    def render(self) -> bytes:
+        lines: list[str] = []
+
+        for metric in list(self._metrics.values()):
+            lines.append(f"# HELP {metric.name} {_escape(metric.help)}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+
+            for suffix, labels, value in metric.samples():
+                lines.append(
+                    f"{metric.name}{suffix}{_format_labels(labels)}"
+                    f" {_format_value(value)}"
+                )
+
+        lines.append("")
+        return "\n".join(lines).encode()
+
+
+registry = Registry()
+
+registry.register(
+    Metric(
+        "process_info",
+        "The worker process that answered this scrape.",
+        "gauge",
+        GaugeChild,
+        ("pid",),
+        source=lambda: [((str(os.getpid()),), 1)],
+    )
+)
+
+http_requests = registry.counter(
+    "http_requests_total",
+    "Finished HTTP requests.",
+    ("method", "route", "status"),
+)
+http_request_seconds = registry.histogram(
+    "http_request_duration_seconds",
+    "Time from receiving a request to sending the last of its response.",
+    ("method", "route"),
+)
+http_in_flight = registry.gauge(
+    "http_requests_in_flight",
+    "HTTP requests being handled, including open event streams.",
+).labels()
+
+db_call_seconds = registry.histogram(
+    "db_call_duration_seconds",
+    "Duration of `db_connector` calls, including waits for SQLite locks.",
+    ("function",),
+)
+db_call_errors = registry.counter(
+    "db_call_errors_total",
+    "`db_connector` calls that raised.",
+    ("function",),
+)
+
+mqtt_publish_seconds = registry.histogram(
+    "mqtt_publish_latency_seconds",
+    "Time from queueing an MQTT command to the broker's acknowledgement.",
+).labels()
+
+
+def timed(func: Callable[P, R]) -> Callable[P, R]:
+    """Records the decorated `db_connector` function's duration and
+    errors, labelled with its name.
+    """
+    seconds = db_call_seconds.labels(func.__name__)
+    errors = db_call_errors.labels(func.__name__)
+
+    @wraps(func)
+    def wrapper(*args: P.args, **kwargs: P.kwargs) -> R:
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        except BaseException:
+            errors.inc()
+            raise
+        finally:
+            seconds.observe(time.perf_counter() - start)
+
+    return wrapper
+
+
+def _route(scope: Scope) -> str:
+    # FastAPI records the matched route; mounts only leave their prefix.
+    # Anything else is lumped together so that scanners cannot blow up
+    # the number of series.
+    if (route := scope.get("route")) is not None:
+        return str(getattr(route, "path", "unmatched"))
+    return str(scope.get("root_path") or "unmatched")
+
+
+class MetricsMiddleware:
+    """Counts and times HTTP requests by method, route template and
+    status. A plain ASGI middleware, so streaming responses pass through
+    untouched.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(
+        self, scope: Scope, receive: Receive, send: Send
+    ) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = 500
+
+        async def send_status(message: Message) -> None:
+            nonlocal status
+
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        http_in_flight.inc()
+        try:
+            await self.app(scope, receive, send_status)
+        finally:
+            http_in_flight.dec()
+            # Routing has filled in the scope by now.
+            route = _route(scope)
+            method = scope["method"]
+            http_requests.labels(method, route, str(status)).inc()
+            http_request_seconds.labels(method, route).observe(
+                time.perf_counter() - start
+            )
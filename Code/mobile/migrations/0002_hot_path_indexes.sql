@@ -0,0 +1,26 @@
+CREATE INDEX IF NOT EXISTS idx_scooters_battery_level
+    ON scooters (battery_level);
+
+CREATE INDEX IF NOT EXISTS idx_bookings_scooter_id
+    ON bookings (scooter_id);
+
+CREATE INDEX IF NOT EXISTS idx_bookings_open_by_scooter
+    ON bookings (scooter_id)
+    WHERE end_time IS NULL;
+
+CREATE INDEX IF NOT EXISTS idx_bookings_open_by_user
+    ON bookings (user_id, scooter_id)
+    WHERE end_time IS NULL;
+
+CREATE INDEX IF NOT EXISTS idx_bookings_user_active
+    ON bookings (user_id, is_active);
+
+CREATE INDEX IF NOT EXISTS idx_drives_scooter_id
+    ON drives (scooter_id);
+
+CREATE INDEX IF NOT EXISTS idx_drives_open_by_scooter
+    ON drives (scooter_id)
+    WHERE end_time IS NULL;
+
+CREATE INDEX IF NOT EXISTS idx_drives_user_active
+    ON drives (user_id, is_active);
@@ -0,0 +1,61 @@
+CREATE VIRTUAL TABLE IF NOT EXISTS scooters_rtree USING rtree (
+    id,
+    min_lat, max_lat,
+    min_lng, max_lng
+);
+
+INSERT OR REPLACE INTO scooters_rtree
+SELECT id, latitude, latitude, longitude, longitude FROM scooters;
+
+CREATE TRIGGER IF NOT EXISTS scooters_rtree_insert
+AFTER INSERT ON scooters
+BEGIN
+    INSERT INTO scooters_rtree
+    VALUES (new.id, new.latitude, new.latitude, new.longitude, new.longitude);
+END;
+
+CREATE TRIGGER IF NOT EXISTS scooters_rtree_update
+AFTER UPDATE OF latitude, longitude ON scooters
+BEGIN
+    UPDATE scooters_rtree
+    SET min_lat = new.latitude, max_lat = new.latitude,
+        min_lng = new.longitude, max_lng = new.longitude
+    WHERE id = new.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS scooters_rtree_delete
+AFTER DELETE ON scooters
+BEGIN
+    DELETE FROM scooters_rtree WHERE id = old.id;
+END;
+
+CREATE VIRTUAL TABLE IF NOT EXISTS charging_stations_rtree USING rtree (
+    id,
+    min_lat, max_lat,
+    min_lng, max_lng
+);
+
+INSERT OR REPLACE INTO charging_stations_rtree
+SELECT id, latitude, latitude, longitude, longitude FROM charging_stations;
+
+CREATE TRIGGER IF NOT EXISTS charging_stations_rtree_insert
+AFTER INSERT ON charging_stations
+BEGIN
+    INSERT INTO charging_stations_rtree
+    VALUES (new.id, new.latitude, new.latitude, new.longitude, new.longitude);
+END;
+
+CREATE TRIGGER IF NOT EXISTS charging_stations_rtree_update
+AFTER UPDATE OF latitude, longitude ON charging_stations
+BEGIN
+    UPDATE charging_stations_rtree
+    SET min_lat = new.latitude, max_lat = new.latitude,
+        min_lng = new.longitude, max_lng = new.longitude
+    WHERE id = new.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS charging_stations_rtree_delete
+AFTER DELETE ON charging_stations
+BEGIN
+    DELETE FROM charging_stations_rtree WHERE id = old.id;
+END;
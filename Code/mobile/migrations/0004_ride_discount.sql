@@ -0,0 +1,3 @@
+ALTER TABLE bookings ADD COLUMN discount REAL NOT NULL DEFAULT 0;
+
+ALTER TABLE drives ADD COLUMN discount REAL NOT NULL DEFAULT 0;
@@ -0,0 +1,3 @@
+CREATE INDEX IF NOT EXISTS idx_drives_history
+    ON drives (user_id, end_time DESC, id DESC)
+    WHERE is_active = 0;
@@ -0,0 +1,2 @@
+-- Bumped whenever a user's sessions must stop being accepted.
+ALTER TABLE users ADD COLUMN session_version INTEGER NOT NULL DEFAULT 0;
@@ -0,0 +1,30 @@
+-- Committed changes that other worker processes must mirror into their
+-- in-memory state, in commit order. Pruned by the change watcher.
+CREATE TABLE change_log (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    entity TEXT NOT NULL,
+    entity_id INTEGER NOT NULL
+);
+
+CREATE TRIGGER scooters_change_log_insert AFTER INSERT ON scooters
+BEGIN
+    INSERT INTO change_log (entity, entity_id) VALUES ('scooter', NEW.id);
+END;
+
+CREATE TRIGGER scooters_change_log_update AFTER UPDATE ON scooters
+BEGIN
+    INSERT INTO change_log (entity, entity_id) VALUES ('scooter', NEW.id);
+END;
+
+CREATE TRIGGER charging_stations_change_log_insert
+AFTER INSERT ON charging_stations
+BEGIN
+    INSERT INTO change_log (entity, entity_id)
+    VALUES ('charging_station', NEW.id);
+END;
+
+CREATE TRIGGER users_change_log_session_version
+AFTER UPDATE OF session_version ON users
+BEGIN
+    INSERT INTO change_log (entity, entity_id) VALUES ('user', NEW.id);
+END;
@@ -0,0 +1,91 @@
+"""Stores booking and drive times as integer UTC epoch milliseconds.
+
+They used to be ISO 8601 text in two formats: starts as naive local time
+from `strftime` and ends with an offset from `isoformat()`. SQLite cannot
+tell which local time the naive ones meant, so they are converted here.
+"""
+
+from datetime import datetime
+from sqlite3 import Connection
+
+from mobile.constants import TIMEZONE
+
+
+# (table, start column)
+_TABLES = (("bookings", "booking_time"), ("drives", "driving_time"))
+
+_INDEXES = (
+    "CREATE INDEX idx_bookings_scooter_id ON bookings (scooter_id)",
+    """
+    CREATE INDEX idx_bookings_open_by_scooter ON bookings (scooter_id)
+    WHERE end_time IS NULL
+    """,
+    """
+    CREATE INDEX idx_bookings_open_by_user ON bookings (user_id, scooter_id)
+    WHERE end_time IS NULL
+    """,
+    "CREATE INDEX idx_bookings_user_active ON bookings (user_id, is_active)",
+    "CREATE INDEX idx_drives_scooter_id ON drives (scooter_id)",
+    """
+    CREATE INDEX idx_drives_open_by_scooter ON drives (scooter_id)
+    WHERE end_time IS NULL
+    """,
+    "CREATE INDEX idx_drives_user_active ON drives (user_id, is_active)",
+    """
+    CREATE INDEX idx_drives_history ON drives (user_id, end_time DESC, id DESC)
+    WHERE is_active = 0
+    """,
+)
+
+
+def _epoch_ms(value: str | None) -> int | None:
+    if value is None:
+        return None
+
+    moment = datetime.fromisoformat(value)
+
+    if moment.tzinfo is None:
+        moment = TIMEZONE.localize(moment)
+    return round(moment.timestamp() * 1000)
+
+
+def upgrade(conn: Connection) -> None:
+    conn.create_function("epoch_ms", 1, _epoch_ms, deterministic=True)
+
+    # Column types cannot be changed in place, so both tables are rebuilt.
+    for table, start in _TABLES:
+        conn.execute(
+            f"""
+            CREATE TABLE {table}_new (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                scooter_id INTEGER NOT NULL,
+                {start} INTEGER NOT NULL,
+                end_time INTEGER,
+                is_active INTEGER DEFAULT 1,
+                price REAL DEFAULT 0,
+                discount REAL NOT NULL DEFAULT 0,
+                FOREIGN KEY (user_id)
+                    REFERENCES users (id)
+                        ON DELETE NO ACTION
+                        ON UPDATE CASCADE,
+                FOREIGN KEY (scooter_id)
+                    REFERENCES scooters (id)
+                        ON DELETE NO ACTION
+                        ON UPDATE CASCADE
+            )
+            """
+        )
+        conn.execute(
+            f"""
+            INSERT INTO {table}_new
+            SELECT id, user_id, scooter_id, epoch_ms({start}),
+                epoch_ms(end_time), is_active, price, discount
+            FROM {table}
+            """
+        )
+        conn.execute(f"DROP TABLE {table}")
+        conn.execute(f"ALTER TABLE {table}_new RENAME TO {table}")
+
+    for index in _INDEXES:
+        conn.execute(index)
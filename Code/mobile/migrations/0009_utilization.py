@@ -0,0 +1,111 @@
+"""Adds fleet utilization aggregates and fills them from the history.
+
+From here on `end_booking()`, `start_drive()` and `end_drive()` add every
+ride to them as it closes. Rides are placed in the grid cell of where
+the scooter stands, which for the history is its current position.
+"""
+
+from math import floor
+from sqlite3 import Connection
+
+from mobile.constants import HOUR_MS, UTILIZATION_CELL_DEG
+
+
+_TABLES = (
+    """
+    CREATE TABLE utilization_hourly (
+        -- UTC epoch ms at the start of the hour
+        hour INTEGER PRIMARY KEY,
+        booked_ms INTEGER NOT NULL DEFAULT 0,
+        driving_ms INTEGER NOT NULL DEFAULT 0
+    )
+    """,
+    """
+    CREATE TABLE utilization_scooter (
+        scooter_id INTEGER PRIMARY KEY,
+        booked_ms INTEGER NOT NULL DEFAULT 0,
+        driving_ms INTEGER NOT NULL DEFAULT 0,
+        bookings INTEGER NOT NULL DEFAULT 0,
+        drives INTEGER NOT NULL DEFAULT 0
+    )
+    """,
+    """
+    CREATE TABLE utilization_cell (
+        cell_lat INTEGER NOT NULL,
+        cell_lng INTEGER NOT NULL,
+        booked_ms INTEGER NOT NULL DEFAULT 0,
+        driving_ms INTEGER NOT NULL DEFAULT 0,
+        bookings INTEGER NOT NULL DEFAULT 0,
+        drives INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (cell_lat, cell_lng)
+    ) WITHOUT ROWID
+    """,
+)
+
+# Every closed ride as (booked, scooter_id, started, ended).
+_RIDES = """
+    SELECT 1 AS booked, scooter_id, booking_time AS started,
+        end_time AS ended
+    FROM bookings WHERE end_time > booking_time
+    UNION ALL
+    SELECT 0, scooter_id, driving_time, end_time
+    FROM drives WHERE end_time > driving_time
+"""
+
+
+def upgrade(conn: Connection) -> None:
+    conn.create_function(
+        "grid_index",
+        1,
+        lambda degrees: floor(degrees / UTILIZATION_CELL_DEG),
+        deterministic=True,
+    )
+
+    for table in _TABLES:
+        conn.execute(table)
+
+    # Rides are split at every hour they run across.
+    conn.execute(
+        f"""
+        WITH RECURSIVE
+            rides AS ({_RIDES}),
+            pieces (booked, started, ended, hour) AS (
+                SELECT booked, started, ended, started - started % :hour
+                FROM rides
+                UNION ALL
+                SELECT booked, started, ended, hour + :hour FROM pieces
+                WHERE hour + :hour < ended
+            ),
+            spans AS (
+                SELECT booked, hour,
+                    min(ended, hour + :hour) - max(started, hour) AS ms
+                FROM pieces
+            )
+        INSERT INTO utilization_hourly (hour, booked_ms, driving_ms)
+        SELECT hour, sum(booked * ms), sum((1 - booked) * ms)
+        FROM spans GROUP BY hour
+        """,
+        {"hour": HOUR_MS},
+    )
+    conn.execute(
+        f"""
+        INSERT INTO utilization_scooter
+            (scooter_id, booked_ms, driving_ms, bookings, drives)
+        SELECT scooter_id, sum(booked * (ended - started)),
+            sum((1 - booked) * (ended - started)), sum(booked),
+            sum(1 - booked)
+        FROM ({_RIDES})
+        GROUP BY scooter_id
+        """
+    )
+    conn.execute(
+        """
+        INSERT INTO utilization_cell
+            (cell_lat, cell_lng, booked_ms, driving_ms, bookings, drives)
+        SELECT grid_index(s.latitude), grid_index(s.longitude),
+            sum(u.booked_ms), sum(u.driving_ms), sum(u.bookings),
+            sum(u.drives)
+        FROM utilization_scooter AS u JOIN scooters AS s ON s.id = u.scooter_id
+        GROUP BY 1, 2
+        """
+    )
@@ -0,0 +1,20 @@
+-- Changes 0007 left out: stations that move or go away, and scooters
+-- that are deleted.
+CREATE TRIGGER scooters_change_log_delete AFTER DELETE ON scooters
+BEGIN
+    INSERT INTO change_log (entity, entity_id) VALUES ('scooter', OLD.id);
+END;
+
+CREATE TRIGGER charging_stations_change_log_update
+AFTER UPDATE ON charging_stations
+BEGIN
+    INSERT INTO change_log (entity, entity_id)
+    VALUES ('charging_station', NEW.id);
+END;
+
+CREATE TRIGGER charging_stations_change_log_delete
+AFTER DELETE ON charging_stations
+BEGIN
+    INSERT INTO change_log (entity, entity_id)
+    VALUES ('charging_station', OLD.id);
+END;
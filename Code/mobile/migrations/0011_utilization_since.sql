@@ -0,0 +1,18 @@
+-- Start of each scooter's first ride, from which its own utilization is
+-- measured, so scooters added later are not counted idle before then.
+ALTER TABLE utilization_scooter ADD COLUMN since INTEGER;
+
+WITH firsts AS (
+    SELECT scooter_id, min(started) AS since
+    FROM (
+        SELECT scooter_id, booking_time AS started
+        FROM bookings WHERE end_time > booking_time
+        UNION ALL
+        SELECT scooter_id, driving_time
+        FROM drives WHERE end_time > driving_time
+    )
+    GROUP BY scooter_id
+)
+UPDATE utilization_scooter SET since = firsts.since
+FROM firsts
+WHERE firsts.scooter_id = utilization_scooter.scooter_id;
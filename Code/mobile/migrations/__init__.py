@@ -0,0 +1,121 @@
+import importlib.util
+import re
+import sys
+from collections.abc import Iterator
+from contextlib import contextmanager, nullcontext
+from dataclasses import dataclass
+from pathlib import Path
+from sqlite3 import Connection
+
+from mobile.constants import MIGRATIONS_DIR
+
+
+# Windows has no fcntl; only single-process development runs there.
+if sys.platform != "win32":
+    import fcntl
+
+
+_MIGRATION_FILE = re.compile(r"^(\d{4})_\w+\.(sql|py)$")
+
+
+@dataclass(frozen=True, slots=True)
+class Migration:
+    version: int
+    path: Path
+
+
+def discover_migrations(directory: Path = MIGRATIONS_DIR) -> list[Migration]:
+    migrations = [
+        Migration(int(match[1]), path)
+        for path in directory.iterdir()
+        if (match := _MIGRATION_FILE.match(path.name))
+    ]
+    return sorted(migrations, key=lambda migration: migration.version)
+
+
+def schema_version(conn: Connection) -> int:
+    version: int = conn.execute("PRAGMA user_version").fetchone()[0]
+    return version
+
+
+def _run_python(conn: Connection, path: Path) -> None:
+    spec = importlib.util.spec_from_file_location(path.stem, path)
+    assert spec is not None and spec.loader is not None
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    module.upgrade(conn)
+
+
+def apply_migration(conn: Connection, migration: Migration) -> None:
+    """Runs one migration and bumps `user_version` atomically.
+
+    A migration is either an SQL script or, for data that SQL alone
+    cannot convert, a Python module with an `upgrade(conn)` function.
+    """
+    if migration.path.suffix == ".py":
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            _run_python(conn, migration.path)
+            conn.execute(f"PRAGMA user_version = {migration.version}")
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        return
+
+    script = migration.path.read_text(encoding="utf-8")
+
+    try:
+        conn.executescript(
+            f"""
+            BEGIN IMMEDIATE;
+            {script}
+            PRAGMA user_version = {migration.version};
+            COMMIT;
+            """
+        )
+    except BaseException:
+        if conn.in_transaction:
+            conn.rollback()
+        raise
+
+
+@contextmanager
+def file_lock(path: Path) -> Iterator[None]:
+    """Holds an exclusive advisory lock on `path` across processes."""
+    with open(path, "a") as handle:
+        if sys.platform == "win32":
+            yield
+        else:
+            fcntl.flock(handle, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(handle, fcntl.LOCK_UN)
+
+
+def migrate(conn: Connection, lock: Path | None = None) -> list[int]:
+    """Upgrades the database in place and returns the versions applied.
+
+    With `lock`, migrations run under that file lock, so when several
+    workers start at once exactly one of them applies each migration.
+    Statistics are refreshed whenever something was applied so the query
+    planner picks up new indexes straight away.
+    """
+    applied: list[int] = []
+
+    with file_lock(lock) if lock is not None else nullcontext():
+        for migration in discover_migrations():
+            # Re-read on every step: another process may have migrated
+            # first.
+            if migration.version <= schema_version(conn):
+                continue
+
+            apply_migration(conn, migration)
+            applied.append(migration.version)
+
+    if applied:
+        conn.execute("ANALYZE")
+
+    conn.execute("PRAGMA optimize")
+    return applied
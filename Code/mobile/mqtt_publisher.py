@@ -0,0 +1,247 @@
+"""Background MQTT publisher for the web backend.
+
+Request handlers only drop a message on a bounded queue; a sender thread
+hands it to paho, whose own network thread (`loop_start()`) talks to the
+broker, reconnects with exponential backoff and retries unacknowledged
+QoS 1 messages. Queue depth and drops are counted in `stats`, and
+enqueue-to-PUBACK latency in the `mqtt_publish_seconds` histogram; both
+are exported on `/metrics`. Messages still waiting for their PUBACK
+after MQTT_ACK_TIMEOUT_S, e.g. across a broker restart, are given up on
+and counted as expired.
+"""
+
+import os
+import queue
+import socket
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any
+
+from paho.mqtt.client import Client, ConnectFlags, DisconnectFlags
+from paho.mqtt.enums import CallbackAPIVersion
+from paho.mqtt.properties import Properties
+from paho.mqtt.reasoncodes import ReasonCode
+
+from mobile.constants import (
+    MQTT_ACK_TIMEOUT_S,
+    MQTT_CLIENT_PREFIX,
+    MQTT_KEEPALIVE,
+    MQTT_MAX_INFLIGHT,
+    MQTT_MAX_QUEUE,
+    MQTT_QOS,
+    MQTT_RECONNECT_MAX_DELAY,
+    MQTT_RECONNECT_MIN_DELAY,
+)
+from mobile.metrics import mqtt_publish_seconds
+
+
+@dataclass(frozen=True, slots=True)
+class _Message:
+    topic: str
+    payload: str
+    enqueued_at: float
+
+
+@dataclass(slots=True)
+class PublisherStats:
+    enqueued: int = 0
+    published: int = 0
+    acked: int = 0
+    dropped: int = 0
+    expired: int = 0
+    connects: int = 0
+    disconnects: int = 0
+
+    def ack(self, latency: float) -> None:
+        """Counts an acknowledgement `latency` seconds after `publish()`."""
+        self.acked += 1
+        mqtt_publish_seconds.observe(latency)
+
+
+@dataclass(slots=True)
+class MqttPublisher:
+    broker: str
+    port: int
+    client_id: str = ""
+    qos: int = MQTT_QOS
+    max_queue: int = MQTT_MAX_QUEUE
+    stats: PublisherStats = field(default_factory=PublisherStats, init=False)
+    _client: Client | None = field(default=None, init=False)
+    _queue: queue.Queue[_Message | None] = field(init=False)
+    _sender: threading.Thread | None = field(default=None, init=False)
+    _connected: threading.Event = field(
+        default_factory=threading.Event, init=False
+    )
+    _stopping: threading.Event = field(
+        default_factory=threading.Event, init=False
+    )
+    # mid -> enqueue time for messages awaiting PUBACK, and mid -> ack
+    # time for acknowledgements that beat the sender to the bookkeeping.
+    _in_flight: dict[int, float] = field(default_factory=dict, init=False)
+    _early_acks: dict[int, float] = field(default_factory=dict, init=False)
+    _next_expiry: float = field(default=0.0, init=False)
+    _lock: threading.Lock = field(default_factory=threading.Lock, init=False)
+
+    def __post_init__(self) -> None:
+        self._queue = queue.Queue(self.max_queue)
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._in_flight)
+
+    @property
+    def connected(self) -> bool:
+        return self._connected.is_set()
+
+    def start(self) -> None:
+        if self._client is not None:
+            return
+
+        # Every worker process needs its own client id, or the broker
+        # would keep disconnecting one in favour of the other.
+        client_id = self.client_id or (
+            f"{MQTT_CLIENT_PREFIX}-{socket.gethostname()}-{os.getpid()}"
+        )
+        client = Client(CallbackAPIVersion.VERSION2, client_id=client_id)
+        client.on_connect = self._on_connect
+        client.on_disconnect = self._on_disconnect
+        client.on_publish = self._on_publish
+        client.reconnect_delay_set(
+            MQTT_RECONNECT_MIN_DELAY, MQTT_RECONNECT_MAX_DELAY
+        )
+        client.max_inflight_messages_set(MQTT_MAX_INFLIGHT)
+
+        # Resolving and connecting happen on the network thread, so a
+        # slow or unreachable broker never delays startup.
+        client.connect_async(self.broker, self.port, MQTT_KEEPALIVE)
+        client.loop_start()
+
+        self._client = client
+        self._stopping.clear()
+        self._sender = threading.Thread(
+            target=self._send_forever, name="mqtt-sender", daemon=True
+        )
+        self._sender.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Flushes what the broker can take within `timeout` seconds and
+        disconnects.
+        """
+        if self._client is None:
+            return
+
+        deadline = time.monotonic() + timeout
+        self._stopping.set()
+
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            pass
+
+        if self._sender is not None:
+            self._sender.join(max(0.0, deadline - time.monotonic()))
+
+        while self._in_flight and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        self._client.disconnect()
+        self._client.loop_stop()
+        self._client = None
+        self._sender = None
+        self._connected.clear()
+
+    def publish(self, topic: str, payload: str) -> bool:
+        """Queues a message without blocking. Returns False and counts a
+        drop if the queue is full.
+        """
+        try:
+            self._queue.put_nowait(_Message(topic, payload, time.monotonic()))
+        except queue.Full:
+            self.stats.dropped += 1
+            return False
+
+        self.stats.enqueued += 1
+        return True
+
+    def _send_forever(self) -> None:
+        while (message := self._queue.get()) is not None:
+            # Hold messages back while disconnected, so they keep their
+            # order and the bounded queue applies backpressure.
+            while not self._connected.wait(0.5):
+                if self._stopping.is_set():
+                    return
+
+            client = self._client
+            assert client is not None
+
+            info = client.publish(message.topic, message.payload, self.qos)
+            self.stats.published += 1
+
+            with self._lock:
+                if (acked_at := self._early_acks.pop(info.mid, None)) is None:
+                    self._in_flight[info.mid] = message.enqueued_at
+                else:
+                    self.stats.ack(acked_at - message.enqueued_at)
+
+                if (now := time.monotonic()) >= self._next_expiry:
+                    self._expire(now - MQTT_ACK_TIMEOUT_S)
+                    self._next_expiry = now + MQTT_ACK_TIMEOUT_S
+
+    def _expire(self, before: float) -> None:
+        """Forgets messages sent and acknowledgements received before
+        `before`. Only messages being published add entries, so checking
+        once per timeout bounds both dicts. Called with the lock held.
+        """
+        for mid in [m for m, t in self._in_flight.items() if t < before]:
+            del self._in_flight[mid]
+            self.stats.expired += 1
+
+        for mid in [m for m, t in self._early_acks.items() if t < before]:
+            del self._early_acks[mid]
+
+    def _on_connect(
+        self,
+        client: Client,
+        userdata: Any,
+        flags: ConnectFlags,
+        reason_code: ReasonCode,
+        properties: Properties | None,
+    ) -> None:
+        if reason_code.is_failure:
+            print(f"MQTT connect to {self.broker} failed: {reason_code}")
+            return
+
+        self.stats.connects += 1
+        self._connected.set()
+
+    def _on_disconnect(
+        self,
+        client: Client,
+        userdata: Any,
+        flags: DisconnectFlags,
+        reason_code: ReasonCode,
+        properties: Properties | None,
+    ) -> None:
+        self._connected.clear()
+        self.stats.disconnects += 1
+
+    def _on_publish(
+        self,
+        client: Client,
+        userdata: Any,
+        mid: int,
+        reason_code: ReasonCode,
+        properties: Properties,
+    ) -> None:
+        now = time.monotonic()
+
+        with self._lock:
+            if (enqueued_at := self._in_flight.pop(mid, None)) is None:
+                self._early_acks[mid] = now
+            else:
+                self.stats.ack(now - enqueued_at)
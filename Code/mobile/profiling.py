@@ -0,0 +1,246 @@
+"""Opt-in request profiling and a slow-query log.
+
+`ProfilerMiddleware` runs a request under cProfile when it carries an
+`X-Profile` header matching `PROFILE_TOKEN`, or at random with
+`PROFILE_SAMPLE_RATE`, and writes the stats to `PROFILE_DIR` (read them
+with `python -m pstats` or snakeviz). Only one request per process is
+profiled at a time, and whatever else the event loop runs meanwhile
+shows up in its profile too; database work on the executor threads does
+not, which is what the slow-query log is for.
+
+`SlowQueryLog` times every statement on the pooled connections through
+`set_trace_callback` and reports those slower than `SLOW_QUERY_MS` with
+their query plan and the `db_connector` function that issued them.
+"""
+
+import asyncio
+import cProfile
+import hmac
+import random
+import re
+import secrets
+import sqlite3
+import sys
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from types import FrameType
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from mobile.constants import (
+    PROFILE_DIR,
+    PROFILE_KEEP,
+    PROFILE_SAMPLE_RATE,
+    PROFILE_TOKEN,
+)
+
+
+PROFILE_HEADER = b"x-profile"
+EXPLAINABLE = re.compile(
+    r"\s*(SELECT|INSERT|UPDATE|DELETE|REPLACE|WITH)\b", re.IGNORECASE
+)
+# Quoted values are left out of the log; they may be password hashes.
+STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+STATEMENT_PREVIEW = 1_000
+
+
+class ProfilerMiddleware:
+    """Profiles selected requests and names the dump in an
+    `X-Profile-Id` response header.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        directory: Path = PROFILE_DIR,
+        token: str | None = PROFILE_TOKEN,
+        sample_rate: float = PROFILE_SAMPLE_RATE,
+        keep: int = PROFILE_KEEP,
+    ) -> None:
+        self.app = app
+        self.directory = directory
+        self.token = token.encode() if token else None
+        self.sample_rate = sample_rate
+        self.keep = keep
+        self._busy = False
+
+    def _wanted(self, scope: Scope) -> bool:
+        requested = False
+
+        for name, value in scope["headers"]:
+            # Event streams never finish, so they are never profiled.
+            if name == b"accept" and b"text/event-stream" in value:
+                return False
+            if name == PROFILE_HEADER and self.token is not None:
+                requested = hmac.compare_digest(value, self.token)
+
+        return requested or random.random() < self.sample_rate
+
+    async def __call__(
+        self, scope: Scope, receive: Receive, send: Send
+    ) -> None:
+        if (
+            scope["type"] != "http"
+            or (self.token is None and self.sample_rate <= 0)
+            or self._busy
+            or not self._wanted(scope)
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        stamp = time.strftime("%Y%m%dT%H%M%S")
+        profile_id = f"{stamp}-{secrets.token_hex(3)}"
+
+        async def send_with_id(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((b"x-profile-id", profile_id.encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        self._busy = True
+        profiler = cProfile.Profile()
+        start = time.perf_counter()
+        profiler.enable()
+
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            profiler.disable()
+            self._busy = False
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            route = str(getattr(scope.get("route"), "path", scope["path"]))
+            slug = re.sub(r"\W+", "_", route).strip("_")[:60] or "root"
+            name = f"{profile_id}-{scope['method']}-{slug}-{elapsed_ms:.0f}ms"
+            await asyncio.get_running_loop().run_in_executor(
+                None, self._dump, profiler, name
+            )
+
+    def _dump(self, profiler: cProfile.Profile, name: str) -> None:
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            profiler.dump_stats(self.directory / f"{name}.prof")
+
+            dumps = sorted(
+                self.directory.glob("*.prof"),
+                key=lambda path: path.stat().st_mtime,
+                reverse=True,
+            )
+            for old in dumps[self.keep :]:
+                old.unlink(missing_ok=True)
+        except OSError as e:
+            print(f"Could not write profile {name}: {e!r}")
+
+
+@dataclass(slots=True)
+class _Statement:
+    sql: str
+    started: float
+
+
+@dataclass(slots=True)
+class SlowQueryLog:
+    """Reports statements slower than `threshold` seconds.
+
+    SQLite only says when a statement starts, so a statement is taken to
+    run until the next one starts or the checkout ends. That includes
+    fetching its rows, which is when SQLite does most of the work.
+    Reports wait for the end of the checkout, when the plan can be asked
+    for on the same connection.
+    """
+
+    threshold: float
+    caller_module: str = "mobile.db_connector"
+    _local: threading.local = field(
+        default_factory=threading.local, init=False
+    )
+
+    def attach(self, conn: sqlite3.Connection) -> None:
+        conn.set_trace_callback(self._started)
+
+    def _started(self, sql: str) -> None:
+        local = self._local
+
+        if getattr(local, "explaining", False):
+            return
+
+        current: _Statement | None = getattr(local, "current", None)
+
+        # Triggers fired by a statement trace it again, and SQL run on its
+        # behalf (such as the R*Tree's own lookups) is traced with a `--`
+        # prefix; either way it is still the same statement running.
+        if current is not None and (
+            current.sql == sql or sql.startswith("--")
+        ):
+            return
+
+        self._finish(current)
+        local.current = _Statement(sql, time.perf_counter())
+
+    def _finish(self, statement: _Statement | None) -> None:
+        if statement is None:
+            return
+
+        elapsed = time.perf_counter() - statement.started
+
+        if elapsed < self.threshold:
+            return
+
+        if not hasattr(self._local, "slow"):
+            self._local.slow = []
+        self._local.slow.append((statement.sql, elapsed, self._caller()))
+
+    def _caller(self) -> str:
+        frame: FrameType | None = sys._getframe(2)
+
+        while frame is not None:
+            name = frame.f_code.co_name
+
+            if frame.f_globals.get("__name__") == self.caller_module and (
+                name not in ("connect_db", "transaction")
+            ):
+                return name
+            frame = frame.f_back
+
+        return "?"
+
+    def flush(self, conn: sqlite3.Connection) -> None:
+        """Ends the checkout's last statement and reports the slow ones.
+        Called by the pool at the end of the outermost checkout.
+        """
+        local = self._local
+        self._finish(getattr(local, "current", None))
+        local.current = None
+
+        if not (slow := getattr(local, "slow", None)):
+            return
+
+        local.slow = []
+        local.explaining = True
+
+        try:
+            for sql, elapsed, caller in slow:
+                self._report(conn, sql, elapsed, caller)
+        finally:
+            local.explaining = False
+
+    def _report(
+        self, conn: sqlite3.Connection, sql: str, elapsed: float, caller: str
+    ) -> None:
+        preview = STRING_LITERAL.sub("'…'", " ".join(sql.split()))
+        lines = [
+            f"Slow query ({elapsed * 1000:.1f} ms) in {caller}: "
+            f"{preview[:STATEMENT_PREVIEW]}"
+        ]
+
+        if EXPLAINABLE.match(sql):
+            try:
+                plan = conn.execute(f"EXPLAIN QUERY PLAN {sql}").fetchall()
+            except sqlite3.Error as e:
+                lines.append(f"  (no plan: {e})")
+            else:
+                lines += [f"  {row[3]}" for row in plan]
+
+        print("\n".join(lines))
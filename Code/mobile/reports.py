@@ -0,0 +1,375 @@
+"""Billing and revenue reports over finished bookings and drives.
+
+Rides closed in the period are read in chunks off one query per table,
+priced with NumPy and summed per user, per scooter and per local day.
+Memory is bounded by the highest user and scooter ids and the number of
+days, never by the number of rides. Reports are written as CSV, or as
+Parquet when pyarrow is installed.
+
+    python -m mobile.reports 2025-03 --out reports/
+    python -m mobile.reports 2025-03-14 --format parquet
+    python -m mobile.reports 2025-03 --unlock-price 12 --price-per-minute 3
+
+Revenue is what riders were charged, summed from the stored prices.
+Given another tariff, prices are recomputed from duration and discount
+instead, so a report can also show what a month would have earned at
+other prices. Gross prices, before discount, are always recomputed.
+"""
+
+import argparse
+import csv
+import itertools
+import time
+from collections.abc import Iterator
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Any, Literal
+
+import numpy as np
+from numpy.typing import NDArray
+
+from mobile.constants import (
+    PRICE_PER_MINUTE,
+    REPORT_CHUNK_ROWS,
+    TIMEZONE,
+    UNLOCK_PRICE,
+)
+from mobile.db_connector import connect_db, migrate_db
+from mobile.helpers import BASIS_POINTS, MS_PER_MINUTE, PRICE_SCALE, cents
+
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet output is optional; CSV needs nothing.
+    pa = pq = None
+
+
+Format = Literal["csv", "parquet"]
+Kind = Literal["drives", "bookings"]
+
+# Start time column of each table.
+_START_COLUMNS: dict[Kind, str] = {
+    "drives": "driving_time",
+    "bookings": "booking_time",
+}
+_COLUMNS = 6
+
+
+@dataclass(frozen=True, slots=True)
+class Tariff:
+    unlock_price: float = UNLOCK_PRICE
+    price_per_minute: float = PRICE_PER_MINUTE
+
+    def price(
+        self, duration_ms: NDArray[np.int64], discount: NDArray[np.float64]
+    ) -> NDArray[np.float64]:
+        """`get_price()` over whole arrays of rides, with the tariff
+        rounded to whole cents.
+        """
+        basis_points = np.floor(discount * BASIS_POINTS + 0.5)
+        scaled = (
+            cents(self.unlock_price) * MS_PER_MINUTE
+            + cents(self.price_per_minute) * np.maximum(0, duration_ms)
+        ) * (BASIS_POINTS - basis_points.astype(np.int64))
+        price: NDArray[np.float64] = (
+            (scaled + PRICE_SCALE // 2) // PRICE_SCALE / 100
+        )
+        return price
+
+
+def _zeros(dtype: type[Any]) -> NDArray[Any]:
+    return np.zeros(0, dtype)
+
+
+@dataclass(slots=True)
+class Totals:
+    """Running sums per non-negative integer key, in arrays indexed by
+    the key.
+    """
+
+    rides: NDArray[np.int64] = field(default_factory=lambda: _zeros(np.int64))
+    minutes: NDArray[np.float64] = field(
+        default_factory=lambda: _zeros(np.float64)
+    )
+    gross: NDArray[np.float64] = field(
+        default_factory=lambda: _zeros(np.float64)
+    )
+    revenue: NDArray[np.float64] = field(
+        default_factory=lambda: _zeros(np.float64)
+    )
+
+    def add(
+        self,
+        keys: NDArray[np.int64],
+        minutes: NDArray[np.float64],
+        gross: NDArray[np.float64],
+        revenue: NDArray[np.float64],
+    ) -> None:
+        if not len(keys):
+            return
+
+        size = max(len(self.rides), int(keys.max()) + 1)
+
+        if size > len(self.rides):
+            grow = (0, size - len(self.rides))
+            self.rides = np.pad(self.rides, grow)
+            self.minutes = np.pad(self.minutes, grow)
+            self.gross = np.pad(self.gross, grow)
+            self.revenue = np.pad(self.revenue, grow)
+
+        self.rides += np.bincount(keys, minlength=size)
+        self.minutes += np.bincount(keys, minutes, minlength=size)
+        self.gross += np.bincount(keys, gross, minlength=size)
+        self.revenue += np.bincount(keys, revenue, minlength=size)
+
+    def columns(self, key: str) -> dict[str, NDArray[Any]]:
+        """The keys that had rides and their totals, money rounded to
+        cents.
+        """
+        keys = np.flatnonzero(self.rides)
+        revenue = np.round(self.revenue[keys], 2)
+        gross = np.round(self.gross[keys], 2)
+        return {
+            key: keys,
+            "rides": self.rides[keys],
+            "minutes": np.round(self.minutes[keys], 1),
+            "gross": gross,
+            "discount": np.round(gross - revenue, 2),
+            "revenue": revenue,
+        }
+
+
+@dataclass(slots=True)
+class RevenueReport:
+    first_day: date
+    # UTC epoch ms of each local midnight in the period and of its end.
+    day_starts: NDArray[np.int64]
+    tariff: Tariff = Tariff()
+    users: Totals = field(default_factory=Totals)
+    scooters: Totals = field(default_factory=Totals)
+    days: dict[Kind, Totals] = field(
+        default_factory=lambda: {"drives": Totals(), "bookings": Totals()}
+    )
+
+    @property
+    def start_ms(self) -> int:
+        return int(self.day_starts[0])
+
+    @property
+    def end_ms(self) -> int:
+        return int(self.day_starts[-1])
+
+    def add(self, kind: Kind, rides: NDArray[np.float64]) -> None:
+        """Prices a chunk of `(user_id, scooter_id, start, end, discount,
+        price)` rows and adds them up.
+        """
+        users, scooters, start, end, discount, price = rides.T
+        duration = (end - start).astype(np.int64)
+        minutes = duration / MS_PER_MINUTE
+        gross = self.tariff.price(duration, np.zeros_like(discount))
+        revenue = (
+            price
+            if self.tariff == Tariff()
+            else self.tariff.price(duration, discount)
+        )
+        days = np.searchsorted(self.day_starts, end, side="right") - 1
+
+        for totals, keys in (
+            (self.users, users),
+            (self.scooters, scooters),
+            (self.days[kind], days),
+        ):
+            totals.add(keys.astype(np.int64), minutes, gross, revenue)
+
+    def tables(self) -> dict[str, dict[str, NDArray[Any]]]:
+        daily: dict[str, list[NDArray[Any]]] = {}
+
+        for kind, totals in self.days.items():
+            columns = totals.columns("day")
+            days = columns.pop("day")
+            columns = {
+                "day": np.array(
+                    [
+                        (self.first_day + timedelta(int(day))).isoformat()
+                        for day in days
+                    ]
+                ),
+                "kind": np.full(len(days), kind),
+                **columns,
+            }
+            for name, values in columns.items():
+                daily.setdefault(name, []).append(values)
+
+        return {
+            "daily": {
+                name: np.concatenate(parts) for name, parts in daily.items()
+            },
+            "users": self.users.columns("user_id"),
+            "scooters": self.scooters.columns("scooter_id"),
+        }
+
+
+def parse_period(text: str) -> tuple[date, int]:
+    """Reads `YYYY-MM` as a month or `YYYY-MM-DD` as a single day and
+    returns its first day and length in days.
+    """
+    if len(text) == len("YYYY-MM"):
+        first = date.fromisoformat(f"{text}-01")
+        following = date(
+            first.year + first.month // 12, first.month % 12 + 1, 1
+        )
+        return first, (following - first).days
+
+    return date.fromisoformat(text), 1
+
+
+def day_starts(first: date, days: int) -> NDArray[np.int64]:
+    """UTC epoch ms of local midnight on each day, plus the day after.
+    Days are not all 24 hours long across daylight saving changes.
+    """
+    midnights = (
+        TIMEZONE.localize(
+            datetime.combine(first + timedelta(d), datetime.min.time())
+        )
+        for d in range(days + 1)
+    )
+    return np.array(
+        [round(midnight.timestamp() * 1000) for midnight in midnights],
+        dtype=np.int64,
+    )
+
+
+def iter_rides(
+    kind: Kind, start_ms: int, end_ms: int, chunk_size: int
+) -> Iterator[NDArray[np.float64]]:
+    """Yields the rides of one table that closed in `[start_ms, end_ms)`,
+    `chunk_size` rows at a time.
+
+    Everything is read in one statement, so the report sees a single
+    snapshot of the database however long it takes.
+    """
+    # Reservations taken over by a drive are closed without a price; only
+    # the drive is billed.
+    unbilled = "AND price > 0" if kind == "bookings" else ""
+
+    with connect_db() as (conn, _):
+        cur = conn.execute(
+            f"""
+            SELECT user_id, scooter_id, {_START_COLUMNS[kind]}, end_time,
+                discount, price
+            FROM {kind}
+            WHERE is_active = 0 AND end_time >= ? AND end_time < ?
+                {unbilled}
+            """,
+            (start_ms, end_ms),
+        )
+
+        while rows := cur.fetchmany(chunk_size):
+            # Epoch ms are well inside float64's exact integer range.
+            flat = np.fromiter(
+                itertools.chain.from_iterable(rows),
+                dtype=np.float64,
+                count=len(rows) * _COLUMNS,
+            )
+            yield flat.reshape(-1, _COLUMNS)
+
+
+def build_report(
+    first: date,
+    days: int,
+    tariff: Tariff = Tariff(),
+    chunk_size: int = REPORT_CHUNK_ROWS,
+) -> tuple[RevenueReport, int]:
+    """Returns the report for the period and the number of rides in it."""
+    report = RevenueReport(first, day_starts(first, days), tariff)
+    count = 0
+
+    for kind in _START_COLUMNS:
+        for rides in iter_rides(
+            kind, report.start_ms, report.end_ms, chunk_size
+        ):
+            report.add(kind, rides)
+            count += len(rides)
+
+    return report, count
+
+
+def write_table(
+    path: Path, columns: dict[str, NDArray[Any]], format: Format
+) -> None:
+    if format == "parquet":
+        if pa is None:
+            raise RuntimeError("Parquet output needs pyarrow installed")
+        pq.write_table(pa.table(columns), path)
+        return
+
+    with open(path, "w", newline="", encoding="utf-8") as file:
+        writer = csv.writer(file)
+        writer.writerow(columns)
+        writer.writerows(
+            zip(*(values.tolist() for values in columns.values()))
+        )
+
+
+def write_report(
+    report: RevenueReport, directory: Path, name: str, format: Format
+) -> list[Path]:
+    directory.mkdir(parents=True, exist_ok=True)
+    paths = []
+
+    for table, columns in report.tables().items():
+        path = directory / f"{name}-{table}.{format}"
+        write_table(path, columns, format)
+        paths.append(path)
+
+    return paths
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter
+    )
+    parser.add_argument("period", help="YYYY-MM or YYYY-MM-DD, local time")
+    parser.add_argument("--out", type=Path, default=Path("reports"))
+    parser.add_argument("--format", choices=("csv", "parquet"), default="csv")
+    parser.add_argument("--unlock-price", type=float, default=UNLOCK_PRICE)
+    parser.add_argument(
+        "--price-per-minute", type=float, default=PRICE_PER_MINUTE
+    )
+    parser.add_argument("--chunk-size", type=int, default=REPORT_CHUNK_ROWS)
+    args = parser.parse_args()
+
+    if args.format == "parquet" and pa is None:
+        parser.error("--format parquet needs pyarrow installed")
+
+    try:
+        first, days = parse_period(args.period)
+    except ValueError:
+        parser.error(
+            f"invalid period {args.period!r}, expected YYYY-MM or "
+            "YYYY-MM-DD"
+        )
+
+    migrate_db()
+    start = time.perf_counter()
+    report, rides = build_report(
+        first,
+        days,
+        Tariff(args.unlock_price, args.price_per_minute),
+        args.chunk_size,
+    )
+    paths = write_report(report, args.out, args.period, args.format)
+    revenue = report.users.revenue.sum()
+
+    print(
+        f"Priced {rides} rides ({revenue:.2f} in revenue) in "
+        f"{time.perf_counter() - start:.1f}s"
+    )
+    for path in paths:
+        print(f"Wrote {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+import heapq
+import threading
+from collections.abc import Iterable
+from dataclasses import dataclass, field
+from math import cos, floor, pi, radians
+from typing import Generic, TypeVar
+
+from mobile.geo import EARTH_RADIUS_M, haversine_m
+
+
+T = TypeVar("T")
+
+_METRES_PER_DEGREE = EARTH_RADIUS_M * pi / 180
+
+Cell = tuple[int, int]
+
+
+@dataclass(frozen=True, slots=True)
+class Neighbour(Generic[T]):
+    id: int
+    latitude: float
+    longitude: float
+    distance_m: float
+    payload: T
+
+
+@dataclass(slots=True)
+class GridIndex(Generic[T]):
+    """In-memory index of points bucketed into fixed-size lat/lng cells.
+
+    Points can be added, moved and removed one at a time. Nearest
+    neighbour queries search rings of cells outwards from the query
+    point and stop as soon as no unvisited cell can hold anything closer
+    than the current k-th hit.
+    """
+
+    cell_deg: float = 0.002
+    _points: dict[int, tuple[float, float, T]] = field(
+        default_factory=dict, init=False
+    )
+    _cells: dict[Cell, dict[int, tuple[float, float, T]]] = field(
+        default_factory=dict, init=False
+    )
+    # Cell range ever occupied since the last rebuild; it only bounds how
+    # far a search may have to go, so it is never shrunk on removal.
+    _extent: tuple[int, int, int, int] = field(
+        default=(0, 0, -1, -1), init=False
+    )
+    _lock: threading.Lock = field(default_factory=threading.Lock, init=False)
+
+    def _cell(self, lat: float, lng: float) -> Cell:
+        return floor(lat / self.cell_deg), floor(lng / self.cell_deg)
+
+    def __len__(self) -> int:
+        return len(self._points)
+
+    def __contains__(self, point_id: int) -> bool:
+        return point_id in self._points
+
+    def _discard(self, point_id: int) -> None:
+        if (point := self._points.pop(point_id, None)) is None:
+            return
+
+        cell = self._cell(point[0], point[1])
+        bucket = self._cells[cell]
+        del bucket[point_id]
+
+        if not bucket:
+            del self._cells[cell]
+
+    def _insert(
+        self, point_id: int, lat: float, lng: float, payload: T
+    ) -> None:
+        point = (lat, lng, payload)
+        i, j = cell = self._cell(lat, lng)
+        self._points[point_id] = point
+        self._cells.setdefault(cell, {})[point_id] = point
+
+        min_i, min_j, max_i, max_j = self._extent
+        if min_i > max_i:
+            self._extent = (i, j, i, j)
+        elif not (min_i <= i <= max_i and min_j <= j <= max_j):
+            self._extent = (
+                min(min_i, i),
+                min(min_j, j),
+                max(max_i, i),
+                max(max_j, j),
+            )
+
+    def points(self) -> list[tuple[int, float, float, T]]:
+        with self._lock:
+            return [
+                (point_id, lat, lng, payload)
+                for point_id, (lat, lng, payload) in self._points.items()
+            ]
+
+    def upsert(
+        self, point_id: int, lat: float, lng: float, payload: T
+    ) -> None:
+        with self._lock:
+            self._discard(point_id)
+            self._insert(point_id, lat, lng, payload)
+
+    def remove(self, point_id: int) -> None:
+        with self._lock:
+            self._discard(point_id)
+
+    def rebuild(self, points: Iterable[tuple[int, float, float, T]]) -> None:
+        with self._lock:
+            self._points.clear()
+            self._cells.clear()
+            self._extent = (0, 0, -1, -1)
+
+            for point_id, lat, lng, payload in points:
+                self._insert(point_id, lat, lng, payload)
+
+    def nearest(
+        self,
+        lat: float,
+        lng: float,
+        k: int,
+        max_distance_m: float | None = None,
+    ) -> list[Neighbour[T]]:
+        # Candidates are ranked by an equirectangular approximation, which
+        # is monotonic with the true distance at city scale; haversine is
+        # only computed for the hits that are returned.
+        lng_scale = max(cos(radians(lat)), 1e-6)
+        ring_gap_m = self.cell_deg * _METRES_PER_DEGREE * lng_scale
+        best: list[tuple[float, int, float, float, T]] = []
+
+        with self._lock:
+            if not self._cells or k <= 0:
+                return []
+
+            origin_i, origin_j = self._cell(lat, lng)
+            min_i, min_j, max_i, max_j = self._extent
+            max_ring = max(
+                origin_i - min_i,
+                max_i - origin_i,
+                origin_j - min_j,
+                max_j - origin_j,
+            )
+
+            # Rings that do not reach the occupied extent are all empty.
+            first_ring = max(
+                0,
+                min_i - origin_i,
+                origin_i - max_i,
+                min_j - origin_j,
+                origin_j - max_j,
+            )
+
+            for ring in range(first_ring, max_ring + 1):
+                # The query point may sit anywhere in its own cell, so
+                # this ring is at least `ring - 1` whole cells away.
+                lower_bound_m = (ring - 1) * ring_gap_m if ring else 0.0
+
+                if (
+                    max_distance_m is not None
+                    and lower_bound_m > max_distance_m
+                ):
+                    break
+
+                if len(best) == k and lower_bound_m > (-best[0][0]) ** 0.5:
+                    break
+
+                exhaustive = 8 * ring > len(self._cells)
+
+                if exhaustive:
+                    # Sparse surroundings: further rings would mostly be
+                    # empty, so visit every remaining occupied cell instead.
+                    cells: Iterable[Cell] = [
+                        (i, j)
+                        for i, j in self._cells
+                        if max(abs(i - origin_i), abs(j - origin_j)) >= ring
+                    ]
+                else:
+                    cells = _ring(origin_i, origin_j, ring)
+
+                for cell in cells:
+                    if (bucket := self._cells.get(cell)) is None:
+                        continue
+
+                    for point_id, (p_lat, p_lng, payload) in bucket.items():
+                        d_lat = (p_lat - lat) * _METRES_PER_DEGREE
+                        d_lng = (p_lng - lng) * _METRES_PER_DEGREE * lng_scale
+                        # Max-heap on squared distance via negation.
+                        item = (
+                            -(d_lat * d_lat + d_lng * d_lng),
+                            point_id,
+                            p_lat,
+                            p_lng,
+                            payload,
+                        )
+
+                        if len(best) < k:
+                            heapq.heappush(best, item)
+                        elif item[0] > best[0][0]:
+                            heapq.heapreplace(best, item)
+
+                if exhaustive:
+                    break
+
+        neighbours = [
+            Neighbour(
+                point_id,
+                p_lat,
+                p_lng,
+                haversine_m(lat, lng, p_lat, p_lng),
+                payload,
+            )
+            for _, point_id, p_lat, p_lng, payload in best
+        ]
+        neighbours.sort(key=lambda neighbour: neighbour.distance_m)
+
+        if max_distance_m is not None:
+            return [n for n in neighbours if n.distance_m <= max_distance_m]
+        return neighbours
+
+
+def _ring(i: int, j: int, radius: int) -> Iterable[Cell]:
+    """Cells at exactly Chebyshev distance `radius` from (i, j)."""
+    if radius == 0:
+        yield i, j
+        return
+
+    for d in range(-radius, radius + 1):
+        yield i - radius, j + d
+        yield i + radius, j + d
+
+    for d in range(-radius + 1, radius):
+        yield i + d, j - radius
+        yield i + d, j + radius
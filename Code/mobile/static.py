@@ -0,0 +1,240 @@
+"""Delivery of the built Vue frontend.
+
+The index page has no server-side variables, so it is read once and
+served from memory. Assets are served from precompressed `.br`/`.gz`
+siblings when the client accepts them; fingerprinted file names never
+change content, so those are marked immutable.
+"""
+
+import errno
+import gzip
+import hashlib
+import os
+import re
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from mimetypes import guess_type
+from pathlib import Path
+
+from starlette.datastructures import Headers
+from starlette.requests import Request
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+from starlette.types import Receive, Scope, Send
+
+
+try:
+    import brotli  # type: ignore[import-untyped]
+except ImportError:  # Brotli is optional; gzip alone is fine.
+    brotli = None
+
+
+# Vite appends an 8 character content hash, e.g. `index-BoSb7tw8.js`.
+FINGERPRINT = re.compile(r"-[\w-]{8}\.\w+$")
+COMPRESSIBLE = {
+    ".css",
+    ".eot",
+    ".html",
+    ".js",
+    ".json",
+    ".map",
+    ".svg",
+    ".ttf",
+}
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "public, max-age=0, must-revalidate"
+LARGE_FILE = 1024 * 1024
+
+
+def accepted_encodings(header: str | None) -> set[str]:
+    encodings: set[str] = set()
+
+    for part in (header or "").split(","):
+        name, _, params = part.strip().partition(";")
+        if params.strip().replace(" ", "") in ("q=0", "q=0.0", "q=0.00"):
+            continue
+        if name:
+            encodings.add(name.strip().lower())
+
+    return encodings
+
+
+def _compressors() -> list[tuple[str, Callable[[bytes], bytes]]]:
+    compressors: list[tuple[str, Callable[[bytes], bytes]]] = [
+        (".gz", lambda data: gzip.compress(data, 9, mtime=0))
+    ]
+    if brotli is not None:
+        compressors.append((".br", brotli.compress))
+    return compressors
+
+
+def precompress(directory: Path) -> int:
+    """Writes `.gz` (and `.br` when Brotli is installed) next to every
+    compressible file whose variant is missing or older than the file.
+
+    Variants that would not save at least a tenth are skipped. Returns
+    how many were written.
+    """
+    written = 0
+
+    for path in directory.rglob("*"):
+        if path.suffix not in COMPRESSIBLE or not path.is_file():
+            continue
+
+        data = None
+        mtime = path.stat().st_mtime
+
+        for suffix, compress in _compressors():
+            variant = path.with_name(path.name + suffix)
+
+            if variant.exists() and variant.stat().st_mtime >= mtime:
+                continue
+
+            data = data if data is not None else path.read_bytes()
+            compressed = compress(data)
+
+            if len(compressed) > 0.9 * len(data):
+                continue
+
+            # Written aside under a name of this process's own and
+            # renamed, so that neither a request nor another worker
+            # compressing the same file sees a half-written variant.
+            partial = variant.with_name(f".{variant.name}.{os.getpid()}.tmp")
+            try:
+                partial.write_bytes(compressed)
+                os.replace(partial, variant)
+            except OSError as e:
+                if isinstance(e, PermissionError) or e.errno == errno.EROFS:
+                    # A read-only deployment simply serves uncompressed
+                    # files.
+                    return written
+
+                partial.unlink(missing_ok=True)
+                print(f"Could not write {variant}: {e!r}")
+                continue
+            written += 1
+
+    return written
+
+
+class LargeFileResponse(FileResponse):
+    """A `FileResponse` that hands the file to the server by path when it
+    supports the ASGI `http.response.pathsend` extension, so the bytes
+    never pass through Python. Other servers get larger read chunks for
+    big files.
+    """
+
+    async def __call__(
+        self, scope: Scope, receive: Receive, send: Send
+    ) -> None:
+        extensions = scope.get("extensions") or {}
+        headers = Headers(scope=scope)
+
+        if (
+            "http.response.pathsend" in extensions
+            and self.status_code == 200
+            and scope["method"].upper() != "HEAD"
+            and "range" not in headers
+        ):
+            await send(
+                {
+                    "type": "http.response.start",
+                    "status": self.status_code,
+                    "headers": self.raw_headers,
+                }
+            )
+            await send(
+                {"type": "http.response.pathsend", "path": str(self.path)}
+            )
+            return
+
+        if self.stat_result is not None and (
+            self.stat_result.st_size >= LARGE_FILE
+        ):
+            self.chunk_size = 1024 * 1024
+
+        await super().__call__(scope, receive, send)
+
+
+class PrecompressedStaticFiles(StaticFiles):
+    """`StaticFiles` that prefers precompressed variants and sets
+    long-lived cache headers on fingerprinted files.
+    """
+
+    def file_response(
+        self,
+        full_path: str | os.PathLike[str],
+        stat_result: os.stat_result,
+        scope: Scope,
+        status_code: int = 200,
+    ) -> Response:
+        request_headers = Headers(scope=scope)
+        accepted = accepted_encodings(request_headers.get("accept-encoding"))
+        path = os.fspath(full_path)
+        encoding = None
+
+        for name, suffix in (("br", ".br"), ("gzip", ".gz")):
+            if name not in accepted:
+                continue
+            try:
+                variant_stat = os.stat(path + suffix)
+            except OSError:
+                continue
+            encoding, path, stat_result = name, path + suffix, variant_stat
+            break
+
+        response: Response = LargeFileResponse(
+            path,
+            status_code=status_code,
+            stat_result=stat_result,
+            media_type=guess_type(full_path)[0],
+        )
+
+        if encoding is not None:
+            response.headers["Content-Encoding"] = encoding
+
+        response.headers["Vary"] = "Accept-Encoding"
+        response.headers["Cache-Control"] = (
+            IMMUTABLE
+            if FINGERPRINT.search(os.fspath(full_path))
+            else REVALIDATE
+        )
+
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
+
+
+@dataclass(slots=True)
+class IndexPage:
+    """The single-page app's `index.html`, read and compressed once."""
+
+    path: Path
+    body: bytes = field(init=False)
+    gzipped: bytes = field(init=False)
+    etag: str = field(init=False)
+
+    def __post_init__(self) -> None:
+        self.body = self.path.read_bytes()
+        self.gzipped = gzip.compress(self.body, 9, mtime=0)
+        self.etag = f'"{hashlib.sha256(self.body).hexdigest()[:16]}"'
+
+    def response(self, request: Request) -> Response:
+        headers = {
+            "ETag": self.etag,
+            "Cache-Control": "no-cache",
+            "Vary": "Accept-Encoding",
+        }
+
+        if request.headers.get("if-none-match") == self.etag:
+            return Response(status_code=304, headers=headers)
+
+        if "gzip" in accepted_encodings(
+            request.headers.get("accept-encoding")
+        ):
+            headers["Content-Encoding"] = "gzip"
+            return Response(
+                self.gzipped, media_type="text/html", headers=headers
+            )
+
+        return Response(self.body, media_type="text/html", headers=headers)
@@ -0,0 +1,257 @@
+"""Scooter telemetry ingestion with write-behind batching.
+
+Scooters report on `escooter/{id}/telemetry` with a JSON object such as
+`{"latitude": 63.43, "longitude": 10.39, "battery_level": 80}`, where
+either the position or the battery level may be left out. Reports are
+merged per scooter in memory, later ones winning, and a flusher thread
+hands everything pending to the writer every `interval` seconds. However
+often scooters report, a flush costs one transaction and at most one row
+update per scooter.
+"""
+
+import json
+import os
+import socket
+import threading
+from collections.abc import Callable, Mapping
+from dataclasses import dataclass, field
+from typing import Any
+
+from paho.mqtt.client import Client, ConnectFlags, MQTTMessage
+from paho.mqtt.enums import CallbackAPIVersion
+from paho.mqtt.properties import Properties
+from paho.mqtt.reasoncodes import ReasonCode
+
+from mobile.constants import (
+    MQTT_CLIENT_PREFIX,
+    MQTT_KEEPALIVE,
+    MQTT_RECONNECT_MAX_DELAY,
+    MQTT_RECONNECT_MIN_DELAY,
+    TELEMETRY_FLUSH_INTERVAL_S,
+    TELEMETRY_MAX_PENDING,
+    TELEMETRY_SHARE_GROUP,
+    TELEMETRY_TOPIC,
+)
+
+
+@dataclass(frozen=True, slots=True)
+class Telemetry:
+    latitude: float | None = None
+    longitude: float | None = None
+    battery_level: int | None = None
+
+    def merge(self, later: "Telemetry") -> "Telemetry":
+        """This report with the fields `later` has taken from it."""
+        if later.latitude is None:
+            return Telemetry(
+                self.latitude, self.longitude, later.battery_level
+            )
+        if later.battery_level is None:
+            return Telemetry(
+                later.latitude, later.longitude, self.battery_level
+            )
+        return later
+
+
+# Writes a batch of reports by scooter id and returns the rows changed.
+Writer = Callable[[Mapping[int, Telemetry]], int]
+
+
+def _number(value: Any) -> bool:
+    return isinstance(value, int | float) and not isinstance(value, bool)
+
+
+def _is_valid(latitude: Any, longitude: Any, battery_level: Any) -> bool:
+    if latitude is None and longitude is None:
+        return battery_level is not None and _is_battery_level(battery_level)
+
+    return (
+        _number(latitude)
+        and _number(longitude)
+        and -90 <= latitude <= 90
+        and -180 <= longitude <= 180
+        and (battery_level is None or _is_battery_level(battery_level))
+    )
+
+
+def _is_battery_level(value: Any) -> bool:
+    return _number(value) and 0 <= value <= 100
+
+
+def parse_telemetry(
+    topic: str, payload: bytes
+) -> tuple[int, Telemetry] | None:
+    """Reads a report and the id of the scooter it came from, or returns
+    None for anything malformed.
+    """
+    try:
+        _, scooter_id, _ = topic.split("/")
+        data = json.loads(payload)
+        latitude, longitude, battery_level = (
+            data.get("latitude"),
+            data.get("longitude"),
+            data.get("battery_level"),
+        )
+        scooter = int(scooter_id)
+    except (ValueError, AttributeError):
+        return None
+
+    if not _is_valid(latitude, longitude, battery_level):
+        return None
+
+    if battery_level is not None:
+        battery_level = round(battery_level)
+    return scooter, Telemetry(latitude, longitude, battery_level)
+
+
+@dataclass(slots=True)
+class TelemetryStats:
+    received: int = 0
+    # Reports merged into one still waiting to be written.
+    coalesced: int = 0
+    invalid: int = 0
+    dropped: int = 0
+    flushes: int = 0
+    failed_flushes: int = 0
+    rows_written: int = 0
+
+
+@dataclass(slots=True)
+class TelemetryIngest:
+    broker: str
+    port: int
+    write: Writer
+    interval: float = TELEMETRY_FLUSH_INTERVAL_S
+    max_pending: int = TELEMETRY_MAX_PENDING
+    client_id: str = ""
+    stats: TelemetryStats = field(default_factory=TelemetryStats, init=False)
+    # The latest report of every scooter not yet written.
+    _pending: dict[int, Telemetry] = field(default_factory=dict, init=False)
+    _lock: threading.Lock = field(default_factory=threading.Lock, init=False)
+    _client: Client | None = field(default=None, init=False)
+    _flusher: threading.Thread | None = field(default=None, init=False)
+    _stopping: threading.Event = field(
+        default_factory=threading.Event, init=False
+    )
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def start(self) -> None:
+        if self._client is not None:
+            return
+
+        client_id = self.client_id or (
+            f"{MQTT_CLIENT_PREFIX}-telemetry-{socket.gethostname()}"
+            f"-{os.getpid()}"
+        )
+        client = Client(CallbackAPIVersion.VERSION2, client_id=client_id)
+        client.on_connect = self._on_connect
+        client.on_message = self._on_message
+        client.reconnect_delay_set(
+            MQTT_RECONNECT_MIN_DELAY, MQTT_RECONNECT_MAX_DELAY
+        )
+        client.connect_async(self.broker, self.port, MQTT_KEEPALIVE)
+        client.loop_start()
+
+        self._client = client
+        self._stopping.clear()
+        self._flusher = threading.Thread(
+            target=self._flush_forever, name="telemetry-flusher", daemon=True
+        )
+        self._flusher.start()
+
+    def stop(self) -> None:
+        """Unsubscribes and writes what is still pending."""
+        if self._client is None:
+            return
+
+        self._client.disconnect()
+        self._client.loop_stop()
+        self._client = None
+
+        self._stopping.set()
+        if self._flusher is not None:
+            self._flusher.join()
+        self._flusher = None
+
+    def put(self, scooter_id: int, report: Telemetry) -> bool:
+        """Queues a report for the next flush. Returns False and counts a
+        drop if it would add a scooter beyond `max_pending`.
+        """
+        with self._lock:
+            if (earlier := self._pending.get(scooter_id)) is not None:
+                self._pending[scooter_id] = earlier.merge(report)
+                self.stats.coalesced += 1
+            elif len(self._pending) < self.max_pending:
+                self._pending[scooter_id] = report
+            else:
+                self.stats.dropped += 1
+                return False
+
+        return True
+
+    def flush(self) -> int:
+        """Writes every pending report in one batch and returns how many
+        scooters changed. A batch that fails to write is queued again,
+        under anything reported since.
+        """
+        with self._lock:
+            batch, self._pending = self._pending, {}
+
+        if not batch:
+            return 0
+
+        try:
+            written = self.write(batch)
+        except Exception as e:
+            with self._lock:
+                for scooter_id, report in batch.items():
+                    if (later := self._pending.get(scooter_id)) is not None:
+                        report = report.merge(later)
+                    self._pending[scooter_id] = report
+
+            self.stats.failed_flushes += 1
+            print(f"Telemetry flush of {len(batch)} scooters failed: {e!r}")
+            return 0
+
+        self.stats.flushes += 1
+        self.stats.rows_written += written
+        return written
+
+    def _flush_forever(self) -> None:
+        while not self._stopping.wait(self.interval):
+            self.flush()
+
+        self.flush()
+
+    def _on_connect(
+        self,
+        client: Client,
+        userdata: Any,
+        flags: ConnectFlags,
+        reason_code: ReasonCode,
+        properties: Properties | None,
+    ) -> None:
+        if reason_code.is_failure:
+            print(f"MQTT connect to {self.broker} failed: {reason_code}")
+            return
+
+        # Sessions are clean, so every reconnect subscribes again.
+        topic = TELEMETRY_TOPIC
+
+        if TELEMETRY_SHARE_GROUP:
+            topic = f"$share/{TELEMETRY_SHARE_GROUP}/{topic}"
+        client.subscribe(topic)
+
+    def _on_message(
+        self, client: Client, userdata: Any, message: MQTTMessage
+    ) -> None:
+        self.stats.received += 1
+
+        if (parsed := parse_telemetry(message.topic, message.payload)) is None:
+            self.stats.invalid += 1
+            return
+
+        self.put(*parsed)
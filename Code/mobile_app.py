@@ -1,180 +1,394 @@
-from collections.abc import Mapping
-from datetime import datetime
-from sqlite3 import Cursor
+import argparse
+import asyncio
+import json
+import os
+from collections.abc import AsyncIterator, Mapping, Sequence
+from contextlib import asynccontextmanager
+from functools import partial
+from typing import Any, Literal
 
 import uvicorn
-from fastapi import FastAPI, HTTPException, Request, Response
-from fastapi.responses import JSONResponse, RedirectResponse
-from fastapi.staticfiles import StaticFiles
-from fastapi.templating import Jinja2Templates
-from itsdangerous import BadSignature, URLSafeSerializer
-from paho.mqtt.client import Client
+from fastapi import Depends, FastAPI, HTTPException, Query, Request, Response
+from fastapi.responses import (
+    FileResponse,
+    JSONResponse,
+    RedirectResponse,
+    StreamingResponse,
+)
 from pydantic import BaseModel
 
-from mobile.constants import INDEX_HTML, SECRET_KEY, TIMEZONE
-from mobile.db_connector import (
+from mobile import db_connector
+from mobile.admission import admit
+from mobile.async_db import (
     book_scooter,
     check_user,
-    connect_db,
-    create_tables,
     end_booking,
     end_drive,
-    generate_charging_stations,
-    generate_scooters,
+    executor,
+    get_cell_utilization,
     get_charging_stations,
+    get_hourly_utilization,
+    get_scooter_utilization,
     get_scooters,
-    get_user_active_bookings,
     get_user_drive_history,
-    nuke_db,
+    iter_user_drive_history,
+    load_available_scooters,
+    load_charging_stations,
     register_user,
     start_drive,
 )
-from mobile.helpers import clean_username, to_datetime
-from scooter.constants import BROKER, PORT
+from mobile.auth import (
+    SESSION_COOKIE,
+    is_admin,
+    issue_session,
+    read_session,
+    resolve_user,
+    revoke,
+)
+from mobile.constants import (
+    ASSETS_DIR,
+    FRONTEND_DIR,
+    HISTORY_MAX_PAGE_SIZE,
+    HISTORY_PAGE_SIZE,
+    INDEX_HTML,
+    MQTT_BROKER,
+    MQTT_PORT,
+    NEAREST_MAX_K,
+    UTILIZATION_MAX_HOURS,
+)
+from mobile.db_connector import (
+    HistoryCursor,
+    booking_overlay,
+    change_watcher,
+    charging_stations_json,
+    fleet_feed,
+    nearest_available_scooters,
+    scooters_json,
+)
+from mobile.geo import Area, BoundingBox, Circle
+from mobile.helpers import (
+    clean_username,
+    decode_cursor,
+    encode_cursor,
+    format_time,
+    now_ms,
+)
+from mobile.metrics import CONTENT_TYPE, MetricsMiddleware, registry
+from mobile.mqtt_publisher import MqttPublisher
+from mobile.profiling import ProfilerMiddleware
+from mobile.seeding import FleetSpec, seed_fleet
+from mobile.static import IndexPage, PrecompressedStaticFiles, precompress
+from mobile.telemetry import TelemetryIngest
 
 
-client = Client()
-client.connect(BROKER, PORT, 60)
+publisher = MqttPublisher(MQTT_BROKER, MQTT_PORT)
+telemetry = TelemetryIngest(
+    MQTT_BROKER, MQTT_PORT, db_connector.update_telemetry
+)
 
+for _field, _help in (
+    ("enqueued", "MQTT commands queued."),
+    ("published", "MQTT commands handed to the client."),
+    ("acked", "MQTT commands acknowledged by the broker."),
+    ("dropped", "MQTT commands dropped on a full queue."),
+    ("expired", "MQTT commands never acknowledged by the broker."),
+    ("connects", "Connections to the MQTT broker."),
+    ("disconnects", "Lost MQTT broker connections."),
+):
+    registry.callback(
+        f"mqtt_{_field}_total",
+        _help,
+        "counter",
+        partial(getattr, publisher.stats, _field),
+    )
 
-class AuthRequest(BaseModel):
-    username: str
-    password: str
+registry.callback(
+    "mqtt_queue_depth",
+    "MQTT commands waiting to be sent.",
+    "gauge",
+    lambda: publisher.queue_depth,
+)
+registry.callback(
+    "mqtt_in_flight",
+    "MQTT commands sent but not yet acknowledged.",
+    "gauge",
+    lambda: publisher.in_flight,
+)
+registry.callback(
+    "mqtt_connected",
+    "Whether the MQTT broker connection is up.",
+    "gauge",
+    lambda: publisher.connected,
+)
 
+for _field, _help in (
+    ("received", "Scooter telemetry reports received."),
+    ("coalesced", "Telemetry reports merged into a pending one."),
+    ("invalid", "Malformed telemetry reports."),
+    ("dropped", "Telemetry reports dropped with too many pending."),
+    ("flushes", "Batches of telemetry written."),
+    ("failed_flushes", "Batches of telemetry that failed to write."),
+    ("rows_written", "Scooters changed by telemetry."),
+):
+    registry.callback(
+        f"telemetry_{_field}_total",
+        _help,
+        "counter",
+        partial(getattr, telemetry.stats, _field),
+    )
 
-class DiscountRequest(BaseModel):
-    apply_discount: bool
+registry.callback(
+    "telemetry_pending",
+    "Scooters with telemetry waiting to be written.",
+    "gauge",
+    lambda: telemetry.pending,
+)
 
 
-class Discount(BaseModel):
-    on_charging_station: bool
+class AuthRequest(BaseModel):
+    username: str
+    password: str
 
 
-app = FastAPI()
-app.mount(
-    "/assets",
-    StaticFiles(directory="mobile/templates/dist_vue/assets"),
-    name="assets",
-)
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    executor.start()
+    publisher.start()
+    fleet_feed.attach(asyncio.get_running_loop())
+    # Started before loading so that no other worker's write falls in
+    # between.
+    change_watcher.start(db_connector.pool.database)
+    await load_available_scooters()
+    await load_charging_stations()
+    telemetry.start()
+    # Compressing the assets takes a while the first time; until it is
+    # done they are served uncompressed.
+    compressing = asyncio.get_running_loop().run_in_executor(
+        None, precompress, ASSETS_DIR
+    )
+    yield
+    await compressing
+    telemetry.stop()
+    change_watcher.stop()
+    fleet_feed.attach(None)
+    publisher.stop()
+    executor.shutdown()
+
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(ProfilerMiddleware)
 app.mount(
-    "/favicon.ico",
-    StaticFiles(directory="mobile/templates/dist_vue"),
-    name="favicon",
+    "/assets", PrecompressedStaticFiles(directory=ASSETS_DIR), name="assets"
 )
 
+index_page = IndexPage(FRONTEND_DIR / INDEX_HTML)
+
 
-templates = Jinja2Templates(directory="mobile/templates/dist_vue")
-serializer = URLSafeSerializer(SECRET_KEY)
+def get_session(request: Request) -> dict[str, Any]:
+    return read_session(request.cookies.get(SESSION_COOKIE))
 
 
-def get_session(request: Request) -> dict[str, str]:
-    if (session := request.cookies.get("session")) is None:
-        return {}
-    return serializer.loads(session)  # type: ignore
+async def fetch_user_id(session: dict[str, Any]) -> int | None:
+    user = await resolve_user(session)
+    return user.id if user else None
 
 
-def fetch_user_id(cur: Cursor, session: Mapping[str, str]) -> int | None:
-    if not session or "username" not in session:
+def area_query(
+    min_lat: float | None = Query(None, ge=-90, le=90),
+    min_lng: float | None = Query(None, ge=-180, le=180),
+    max_lat: float | None = Query(None, ge=-90, le=90),
+    max_lng: float | None = Query(None, ge=-180, le=180),
+    lat: float | None = Query(None, ge=-90, le=90),
+    lng: float | None = Query(None, ge=-180, le=180),
+    radius: float | None = Query(None, gt=0, description="metres"),
+) -> Area | None:
+    """Reads an optional viewport: either a full bounding box or a centre
+    with a radius.
+    """
+    box = (min_lat, min_lng, max_lat, max_lng)
+    circle = (lat, lng, radius)
+
+    if all(value is None for value in box + circle):
         return None
 
-    row = cur.execute(
-        "SELECT id FROM users WHERE username = ?", (session["username"],)
-    ).fetchone()
+    if None not in box and all(value is None for value in circle):
+        return BoundingBox(*box)  # type: ignore[arg-type]
+
+    if None not in circle and all(value is None for value in box):
+        return Circle(*circle)  # type: ignore[arg-type]
 
-    return row[0] if row else None
+    raise HTTPException(
+        status_code=422,
+        detail="Pass either min_lat, min_lng, max_lat and max_lng, "
+        "or lat, lng and radius.",
+    )
 
 
 @app.get("/")
-def read_root(request: Request) -> Response:
-    print("📥 Request to /")
-    return templates.TemplateResponse("index.html", {"request": request})
+async def read_root(request: Request) -> Response:
+    return index_page.response(request)
+
+
+@app.get("/favicon.ico")
+async def favicon() -> Response:
+    return FileResponse(
+        FRONTEND_DIR / "favicon.ico",
+        headers={"Cache-Control": "public, max-age=86400"},
+    )
+
+
+@app.get("/metrics")
+async def metrics(request: Request) -> Response:
+    """Admin only, like `/admin/*`. Prometheus can send the token as a
+    bearer token instead of in `X-Admin-Token`.
+    """
+    scheme, _, bearer = request.headers.get("authorization", "").partition(" ")
+    token = request.headers.get("x-admin-token") or (
+        bearer if scheme.lower() == "bearer" else None
+    )
+
+    if not is_admin(token):
+        return JSONResponse({"error": "Not found"}, status_code=404)
+
+    return Response(registry.render(), media_type=CONTENT_TYPE)
+
+
+@app.get("/admin/utilization")
+async def utilization(
+    request: Request,
+    by: Literal["hour", "scooter", "cell"] = "hour",
+    hours: int = Query(24, ge=1, le=UTILIZATION_MAX_HOURS),
+) -> Response:
+    """Shares of scooter time spent booked, driving and idle: for the
+    fleet in each of the last `hours` hours, or all-time per scooter
+    (since its first ride) or per grid cell (since records began).
+    """
+    if not is_admin(request.headers.get("x-admin-token")):
+        return JSONResponse({"error": "Not found"}, status_code=404)
+
+    now = now_ms()
+    rows: Sequence[Mapping[str, float | str]]
+
+    if by == "hour":
+        rows = [
+            {**row, "hour": format_time(int(row["hour"]))}
+            for row in await get_hourly_utilization(hours, now)
+        ]
+    elif by == "scooter":
+        rows = await get_scooter_utilization(now)
+    else:
+        rows = await get_cell_utilization(now)
+
+    return JSONResponse({"success": True, "by": by, "utilization": rows})
 
 
 @app.get("/login")
-def login_form(request: Request) -> Response:
-    if session := get_session(request):
+async def login_form(request: Request) -> Response:
+    if get_session(request):
         return RedirectResponse(url="/")
-    return templates.TemplateResponse(
-        INDEX_HTML, {"request": request, "session": session}
-    )
+    return index_page.response(request)
 
 
-@app.post("/login")
-def login(data: AuthRequest) -> Response:
+@app.post("/login", dependencies=[Depends(admit("login"))])
+async def login(data: AuthRequest) -> Response:
     username = clean_username(data.username)
 
-    if not check_user(username, data.password):
+    if (user := await check_user(username, data.password)) is None:
         return JSONResponse({"error": "Invalid credentials"}, status_code=401)
 
-    session = serializer.dumps({"username": username})
     response = JSONResponse({"message": "Login successful"})
-    response.set_cookie("session", session)
+    response.set_cookie(SESSION_COOKIE, issue_session(user))
     return response
 
 
 @app.get("/register")
-def register_form(request: Request) -> Response:
-    if session := get_session(request):
+async def register_form(request: Request) -> Response:
+    if get_session(request):
         return RedirectResponse(url="/")
-    return templates.TemplateResponse(
-        INDEX_HTML, {"request": request, "session": session}
-    )
+    return index_page.response(request)
 
 
-@app.post("/register")
-def register(data: AuthRequest) -> Response:
+@app.post("/register", dependencies=[Depends(admit("login"))])
+async def register(data: AuthRequest) -> Response:
     username = clean_username(data.username)
 
-    if not register_user(username, data.password):
+    if (user := await register_user(username, data.password)) is None:
         return JSONResponse(
             {"error": "Username already exists"}, status_code=409
         )
 
-    session = serializer.dumps({"username": username})
     response = JSONResponse({"message": "Registration successful"})
-    response.set_cookie("session", session)
+    response.set_cookie(SESSION_COOKIE, issue_session(user))
     return response
 
 
 @app.post("/logout")
-def logout() -> RedirectResponse:
+async def logout(request: Request, everywhere: bool = False) -> Response:
+    """Clears the session cookie. With `everywhere`, every other session
+    of the user stops being accepted as well.
+    """
+    if everywhere and (user_id := await fetch_user_id(get_session(request))):
+        await revoke(user_id)
+
     response = RedirectResponse(url="/", status_code=302)
-    response.delete_cookie("session")
+    response.delete_cookie(SESSION_COOKIE)
     return response
 
 
 def get_me(request: Request) -> dict[str, str]:
-    if not (session_cookie := request.cookies.get("session")):
+    if not request.cookies.get(SESSION_COOKIE):
         raise HTTPException(status_code=401, detail="Not logged in")
 
-    try:
-        session_data = serializer.loads(session_cookie)
-    except BadSignature as e:
-        raise HTTPException(status_code=401, detail="Invalid session") from e
+    if not (session := get_session(request)):
+        raise HTTPException(status_code=401, detail="Invalid session")
+
+    return {"username": session["username"]}
 
-    return {"username": session_data["username"]}
+
+def not_modified(request: Request, etag: str) -> bool:
+    if (header := request.headers.get("if-none-match")) is None:
+        return False
+
+    tags = {tag.strip().removeprefix("W/") for tag in header.split(",")}
+    return "*" in tags or etag in tags
+
+
+def versioned_json(body: bytes, etag: str) -> Response:
+    # `no-cache` makes clients revalidate every time, which costs a 304
+    # as long as the fleet has not changed.
+    return Response(
+        body,
+        media_type="application/json",
+        headers={"ETag": etag, "Cache-Control": "no-cache"},
+    )
 
 
 @app.get("/scooters", response_model=list[dict[str, float | int | str]])
-def scooters(request: Request) -> JSONResponse:
-    session = get_session(request)
-    user_id = None
-    conn, cur = connect_db()
-
-    if session:
-        user_id = fetch_user_id(cur, session)
-
-    all_scooters = get_scooters()
-    rows = cur.execute(
-        "SELECT scooter_id FROM bookings WHERE user_id = ? AND end_time IS NULL",
-        (user_id,),
-    ).fetchall()
-    conn.close()
-
-    user_booked_scooters = {row[0] for row in rows}
+async def scooters(
+    request: Request, area: Area | None = Depends(area_query)
+) -> Response:
+    """Returns the unbooked scooters plus the caller's own bookings.
+
+    Responses carry the fleet version as their ETag, so an unchanged
+    fleet is answered with 304 before anything is looked up.
+    """
+    user_id = await fetch_user_id(get_session(request))
+    etag = f'"{fleet_feed.tag()}-{user_id or 0}"'
+
+    if not_modified(request, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+
+    if area is None:
+        version, body = scooters_json(user_id)
+        return versioned_json(
+            body, f'"{fleet_feed.tag(version)}-{user_id or 0}"'
+        )
+
+    user_booked_scooters = booking_overlay.scooters_of(user_id or 0)
     filtered_scooters: list[dict[str, float | int | str]] = []
 
-    for scooter in all_scooters:
+    for scooter in await get_scooters(area):
         if scooter["id"] in user_booked_scooters:
             scooter["is_user_booked"] = True
             filtered_scooters.append(scooter)
@@ -182,246 +396,284 @@ def scooters(request: Request) -> JSONResponse:
             scooter["is_user_booked"] = False
             filtered_scooters.append(scooter)
 
-    return JSONResponse(content=filtered_scooters)
+    return versioned_json(json.dumps(filtered_scooters).encode(), etag)
 
 
-@app.post("/book/{scooter_id}")
-def book_scooter_route(request: Request, scooter_id: int) -> Response:
-    if not (session := get_session(request)):
-        return JSONResponse(
-            {"error": "You must be logged in."}, status_code=401
-        )
+@app.get("/scooters/nearest")
+async def nearest_scooters(
+    lat: float = Query(..., ge=-90, le=90),
+    lng: float = Query(..., ge=-180, le=180),
+    k: int = Query(5, ge=1, le=NEAREST_MAX_K),
+) -> JSONResponse:
+    return JSONResponse(content=nearest_available_scooters(lat, lng, k))
 
-    conn, cur = connect_db()
-    user_id = fetch_user_id(cur, session)
-    conn.close()
 
-    booking_time = datetime.now(TIMEZONE).strftime(r"%Y-%m-%d %H:%M:%S")
-
-    if user_id:
-        mqtt_topic = f"escooter/{scooter_id}"
-        client.publish(mqtt_topic, "reserve")
-
-    if book_scooter(user_id, scooter_id, booking_time):
-        return JSONResponse({"success": True, "message": "Scooter booked"})
-    return JSONResponse(
-        {"error": "Scooter already booked or unavailable."}, status_code=400
+@app.get("/scooters/stream")
+async def scooter_stream(request: Request) -> StreamingResponse:
+    """Server-Sent Events: a `snapshot` of the fleet, then one `scooter`
+    event per change. Reconnecting clients that send `Last-Event-ID` get
+    only what they missed.
+    """
+    return StreamingResponse(
+        fleet_feed.stream(request.headers.get("last-event-id")),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
 
 
-@app.get("/bookings")
-def bookings_page(request: Request) -> Response:
+@app.post("/book/{scooter_id}", dependencies=[Depends(admit("write"))])
+async def book_scooter_route(request: Request, scooter_id: int) -> Response:
     if not (session := get_session(request)):
-        return templates.TemplateResponse(
-            INDEX_HTML,
-            {
-                "request": request,
-                "session": {},
-                "error": "You must be logged in to view your bookings.",
-            },
+        return JSONResponse(
+            {"error": "You must be logged in."}, status_code=401
         )
 
-    conn, cur = connect_db()
+    user_id = await fetch_user_id(session)
+    if not await book_scooter(user_id, scooter_id, now_ms()):
+        return JSONResponse(
+            {"error": "Scooter already booked or unavailable."},
+            status_code=400,
+        )
 
-    if not (user_id := fetch_user_id(cur, session)):
+    mqtt_topic = f"escooter/{scooter_id}"
+    publisher.publish(mqtt_topic, "reserve")
+    return JSONResponse({"success": True, "message": "Scooter booked"})
+
+
+@app.get("/bookings")
+async def bookings_page(request: Request) -> Response:
+    # The page is rendered client-side; the server only checks that a
+    # session which is present is still valid.
+    if (session := get_session(request)) and not await fetch_user_id(session):
         return JSONResponse(
             {"error": "Invalid session or user"}, status_code=401
         )
 
-    conn.close()
-
-    bookings = get_user_active_bookings(user_id)
-    return templates.TemplateResponse(
-        INDEX_HTML,
-        {"request": request, "session": session, "bookings": bookings},
-    )
+    return index_page.response(request)
 
 
-@app.post("/end_booking/{booking_id}")
-def end_booking_route(
-    request: Request, booking_id: int, data: DiscountRequest
-) -> Response:
+@app.post(
+    "/end_booking/{booking_id}", dependencies=[Depends(admit("priority"))]
+)
+async def end_booking_route(request: Request, booking_id: int) -> Response:
     if not get_session(request):
         return JSONResponse(
             {"error": "You must be logged in to end a booking."},
             status_code=401,
         )
 
-    end_time = datetime.now(TIMEZONE).isoformat()
-    price = end_booking(booking_id, end_time, data.apply_discount)
-
-    conn, cur = connect_db()
-    booking = cur.execute(
-        """
-        SELECT b.scooter_id, b.booking_time, b.end_time, s.latitude, s.longitude
-        FROM bookings AS b
-        JOIN scooters AS s ON b.scooter_id = s.id
-        WHERE b.scooter_id = ?
-        """,
-        (booking_id,),
-    ).fetchone()
-    conn.close()
-
-    if not booking:
+    ride = await end_booking(booking_id, now_ms())
+
+    if ride is None:
         return JSONResponse(
             content={"error": "Failed to end booking"}, status_code=400
         )
 
-    booking_time = to_datetime(booking[1]).astimezone(TIMEZONE)
-    end_time_date = to_datetime(booking[2]).astimezone(TIMEZONE)
-
-    minutes = (end_time_date - booking_time).total_seconds() / 60
-
     booking_details = {
-        "id": booking[0],
-        "booking_time": booking_time.strftime("%Y-%m-%d %H:%M:%S"),
-        "end_time": end_time_date.strftime("%Y-%m-%d %H:%M:%S"),
-        "duration": round(minutes),
-        "price": price,
+        "id": ride.scooter_id,
+        "booking_time": format_time(ride.start_time),
+        "end_time": format_time(ride.end_time),
+        "duration": round(ride.minutes),
+        "discount_applied": ride.discount > 0,
+        "price": ride.price,
     }
 
-    mqtt_topic = f"escooter/{booking[0]}"
-    client.publish(mqtt_topic, "cancel")
+    mqtt_topic = f"escooter/{ride.scooter_id}"
+    publisher.publish(mqtt_topic, "cancel")
 
     return JSONResponse(content={"success": True, "booking": booking_details})
 
 
+def local_times(drive: dict[str, float]) -> dict[str, float | str]:
+    """Formats the stored times of a history row for the response."""
+    return {
+        **drive,
+        "booking_time": format_time(int(drive["booking_time"])),
+        "end_time": format_time(int(drive["end_time"])),
+    }
+
+
 @app.get("/history")
-def history_page(request: Request) -> Response:
+async def history_page(
+    request: Request,
+    cursor: str | None = None,
+    limit: int | None = Query(None, ge=1, le=HISTORY_MAX_PAGE_SIZE),
+    format: Literal["json", "ndjson"] = "json",
+) -> Response:
+    """Returns the rider's finished drives, newest first.
+
+    JSON responses hold one page plus the `next_cursor` to pass back for
+    the following one. Without `cursor` or `limit` the whole history is
+    returned in one response, as it was before paging. With
+    `format=ndjson` everything from `cursor` onwards is streamed, one
+    drive per line.
+    """
     if not (session := get_session(request)):
         return JSONResponse(
             {"error": "You must be logged in to view your booking history."},
             status_code=401,
         )
 
-    conn, cur = connect_db()
-    user_id = fetch_user_id(cur, session)
+    user_id = await fetch_user_id(session)
+
     if not user_id:
         return JSONResponse(
             {"error": "Invalid session or user"}, status_code=401
         )
 
-    conn.close()
+    after: HistoryCursor | None = None
+
+    if cursor is not None:
+        try:
+            after = decode_cursor(cursor)
+        except ValueError:
+            return JSONResponse({"error": "Invalid cursor"}, status_code=400)
+
+    if format == "ndjson":
+        rows = iter_user_drive_history(
+            user_id, after, limit or HISTORY_PAGE_SIZE
+        )
+        return StreamingResponse(
+            (json.dumps(local_times(row)) + "\n" async for row in rows),
+            media_type="application/x-ndjson",
+        )
+
+    if after is None and limit is None:
+        history = [
+            row
+            async for row in iter_user_drive_history(
+                user_id, chunk_size=HISTORY_MAX_PAGE_SIZE
+            )
+        ]
+        next_after = None
+    else:
+        history, next_after = await get_user_drive_history(
+            user_id, after, limit or HISTORY_PAGE_SIZE
+        )
 
-    history = get_user_drive_history(user_id)
-    return JSONResponse(content={"success": True, "history": history})
+    return JSONResponse(
+        content={
+            "success": True,
+            "history": [local_times(row) for row in history],
+            "next_cursor": next_after and encode_cursor(*next_after),
+        }
+    )
 
 
 @app.get("/charging_stations", response_model=list[dict[str, float]])
-def charging_stations() -> JSONResponse:
-    stations_data = get_charging_stations()
-    return JSONResponse(content=stations_data)
+async def charging_stations(
+    request: Request, area: Area | None = Depends(area_query)
+) -> Response:
+    etag = f'"{fleet_feed.tag()}"'
+
+    if not_modified(request, etag):
+        return Response(status_code=304, headers={"ETag": etag})
 
+    if area is None:
+        version, body = charging_stations_json()
+        return versioned_json(body, f'"{fleet_feed.tag(version)}"')
 
-@app.post("/start_drive/{scooter_id}")
-def start_drive_route(request: Request, scooter_id: int) -> Response:
+    stations_data = await get_charging_stations(area)
+    return versioned_json(json.dumps(stations_data).encode(), etag)
+
+
+@app.post("/start_drive/{scooter_id}", dependencies=[Depends(admit("write"))])
+async def start_drive_route(request: Request, scooter_id: int) -> Response:
     if not (session := get_session(request)):
         return JSONResponse(
             {"error": "You must be logged in to start a drive."},
             status_code=401,
         )
 
-    conn, cur = connect_db()
-    user_id = fetch_user_id(cur, session)
+    user_id = await fetch_user_id(session)
+
     if not user_id:
         return JSONResponse(
             {"error": "Invalid session or user"}, status_code=401
         )
 
-    conn.close()
-    booking_time = datetime.now(TIMEZONE).strftime(r"%Y-%m-%d %H:%M:%S")
-
-    mqtt_topic = f"escooter/{scooter_id}"
-    client.publish(mqtt_topic, "unlock")
-
-    if start_drive(user_id, scooter_id, booking_time):
+    if not await start_drive(user_id, scooter_id, now_ms()):
         return JSONResponse(
-            {"success": True, "message": "Scooter started successfully"}
+            {"error": "Scooter already booked or unavailable."},
+            status_code=400,
         )
+
+    mqtt_topic = f"escooter/{scooter_id}"
+    publisher.publish(mqtt_topic, "unlock")
     return JSONResponse(
-        {"error": "Scooter already booked or unavailable."}, status_code=400
+        {"success": True, "message": "Scooter started successfully"}
     )
 
 
-@app.post("/end_drive/{scooter_id}")
-def end_drive_route(
-    request: Request, scooter_id: int, data: DiscountRequest
-) -> Response:
+@app.post("/end_drive/{scooter_id}", dependencies=[Depends(admit("priority"))])
+async def end_drive_route(request: Request, scooter_id: int) -> Response:
     if not get_session(request):
         return JSONResponse(
             {"error": "You must be logged in to end a drive."},
             status_code=401,
         )
-    print("Ending drive with applying discount:", data.apply_discount)
-
-    price = end_drive(
-        scooter_id, datetime.now(TIMEZONE).isoformat(), data.apply_discount
-    )
+    ride = await end_drive(scooter_id, now_ms())
 
-    conn, cur = connect_db()
-    drive = cur.execute(
-        """
-        SELECT d.scooter_id, d.driving_time, d.end_time
-        FROM drives AS d
-        JOIN scooters AS s ON d.scooter_id = s.id
-        WHERE d.scooter_id = ?
-        """,
-        (scooter_id,),
-    ).fetchone()
-
-    conn.close()
-
-    if not drive:
+    if ride is None:
         return JSONResponse(
             content={"error": "Failed to end drive"}, status_code=400
         )
 
-    # Correct parsing – handles both str and datetime
-    driving_time_raw = drive[1]
-    end_time_raw = drive[2]
-
-    driving_time = (
-        datetime.fromisoformat(driving_time_raw)
-        if isinstance(driving_time_raw, str)
-        else driving_time_raw
-    )
-
-    end_time_date = (
-        datetime.fromisoformat(end_time_raw)
-        if isinstance(end_time_raw, str)
-        else end_time_raw
-    )
-
-    # Convert to correct timezone
-    driving_time = driving_time.astimezone(TIMEZONE)
-    end_time_date = end_time_date.astimezone(TIMEZONE)
-    minutes = (end_time_date - driving_time).total_seconds() / 60
-
     drive_details = {
-        "scooter_id": drive[0],
-        "driving_time": driving_time.strftime("%Y-%m-%d %H:%M:%S"),
-        "end_time": end_time_date.strftime("%Y-%m-%d %H:%M:%S"),
-        "duration": round(minutes),
-        "price": price,
+        "scooter_id": ride.scooter_id,
+        "driving_time": format_time(ride.start_time),
+        "end_time": format_time(ride.end_time),
+        "duration": round(ride.minutes),
+        "discount_applied": ride.discount > 0,
+        "price": ride.price,
     }
 
-    mqtt_topic = f"escooter/{drive[0]}"
-    client.publish(mqtt_topic, "lock")
+    mqtt_topic = f"escooter/{ride.scooter_id}"
+    publisher.publish(mqtt_topic, "lock")
 
     return JSONResponse(content={"success": True, "drive": drive_details})
 
 
 def main() -> None:
-    nuke_db()
-    create_tables()
-    generate_scooters(center_lat=63.422, center_lng=10.395)
-    generate_charging_stations(center_lat=63.422, center_lng=10.395)
+    parser = argparse.ArgumentParser(description="Run the mobile backend.")
+    parser.add_argument(
+        "--prod",
+        action="store_true",
+        help="run worker processes without auto-reload",
+    )
+    parser.add_argument(
+        "--workers", type=int, default=os.cpu_count() or 1, metavar="N"
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8_000)
+    parser.add_argument(
+        "--reset",
+        action="store_true",
+        help="delete the database first (development only)",
+    )
+    args = parser.parse_args()
+
+    if args.reset:
+        if args.prod:
+            parser.error("--reset cannot be used with --prod")
+        db_connector.nuke_db()
+
+    # Done once here rather than in every worker; the migration lock
+    # still protects against servers started side by side.
+    db_connector.migrate_db()
+
+    if not db_connector.is_fleet_seeded():
+        seed_fleet(FleetSpec())
+
+    # Connections must not be inherited by the worker processes.
+    db_connector.pool.close_all()
 
     uvicorn.run(
         "mobile_app:app",
-        host="127.0.0.1",
-        port=8_000,
-        reload=True,
+        host=args.host,
+        port=args.port,
+        reload=not args.prod,
+        workers=args.workers if args.prod else None,
         ssl_keyfile="key.pem",
         ssl_certfile="cert.pem",
     )
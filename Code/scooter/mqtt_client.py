@@ -33,7 +33,9 @@ class MqttClient:
 
         topic_parts = msg.topic.split("/")
 
-        if len(topic_parts) <= 1:
+        # Commands come on `escooter/{id}`; deeper topics such as
+        # `escooter/{id}/telemetry` are not for the state machines.
+        if len(topic_parts) != 2:
             return
 
         stm_name = f"ScooterLogic({topic_parts[1]})"